@@ -3,7 +3,7 @@ from django.contrib.admin.utils import NestedObjects
 from django.contrib.auth import get_user_model
 from django.db import DEFAULT_DB_ALIAS
 from django.db.models import ProtectedError
-from django.forms import BooleanField, ModelForm
+from django.forms import BooleanField, CharField, ModelForm
 
 from x509_pki.models import Certificate
 
@@ -14,6 +14,8 @@ User = get_user_model()
 
 
 class AuthorisedAppForm(ModelForm):
+    # Only the digest of the token is stored, a new token is shown once after saving
+    token = CharField(required=False, help_text="Set a new token, leave empty to keep the current token")
     generate_new_token = BooleanField(required=False, initial=False)
 
     class Meta:
@@ -36,6 +38,8 @@ class AuthorisedAppForm(ModelForm):
 
     def save(self, commit=True):
         obj = super(AuthorisedAppForm, self).save(commit=False)
+        if self.cleaned_data.get("token"):
+            obj.token = self.cleaned_data["token"]
         if commit:
             obj.save()
         return obj
@@ -44,14 +48,20 @@ class AuthorisedAppForm(ModelForm):
 @admin.register(AuthorisedApp)
 class AppAdmin(admin.ModelAdmin):
     form = AuthorisedAppForm
-    search_fields = ["user__username", "name", "token"]
-    list_display = ["user", "name", "token"]
+    search_fields = ["user__username", "name", "token_prefix"]
     list_display = [
         "user",
         "name",
-        "token",
+        "token_prefix",
     ]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.token:
+            self.message_user(
+                request, f"The token of {obj.name} is {obj.token}, copy it now as it is not shown again.", messages.INFO
+            )
+
     def get_form(self, request, obj=None, **kwargs):
         form_class = super(AppAdmin, self).get_form(request, obj, **kwargs)
 
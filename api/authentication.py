@@ -1,41 +1,175 @@
-from functools import wraps
+import threading
+import time
+from collections import OrderedDict
 
-from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
 from rest_framework.authentication import BaseAuthentication
 
+from api import utils
 from api.models import AuthorisedApp
 
+# Nr of seconds the authorised app of a token is kept in the shared cache, which is invalidated on change
 KEYS_TTL = 1800
+# The local cache of a process is not invalidated by other processes, a removed token is accepted by the other
+# processes for at most this nr of seconds. The process handling the change invalidates its own cache on commit.
+LOCAL_KEYS_TTL = 60
+LOCAL_KEYS_SIZE = 1024
 
 
-def cache_value(func):
-    @wraps(func)
-    def new_func(self, app_token, *args, **kwargs):
-        key = f":app_auth:authorised_app:{app_token}:"
-        data = cache.get(key)
-        if data is None:
-            data = func(self, app_token, *args, **kwargs)
-            cache.set(key, data, KEYS_TTL)
+class LocalCache(object):
+    """
+    In-process least recently used cache, of which the entries expire after a fixed number of seconds
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalCache(LOCAL_KEYS_SIZE, LOCAL_KEYS_TTL)
+
+
+def get_cache_key(token_digest):
+    # Tokens are secrets, so only the digest of the token is used in the (shared) cache
+    return f":app_auth:authorised_app:{token_digest}:"
 
-        return data
 
-    return new_func
+def get_shared_cache():
+    """
+    Get the cache shared by the processes of the application, the default local memory cache is kept per process and
+    can not be invalidated for the other processes when a token is changed or removed
+
+    Returns:   The shared cache or None if no shared cache backend is configured
+    """
+    shared_cache = caches["default"]
+    if isinstance(shared_cache, LocMemCache):
+        return None
+    return shared_cache
+
+
+def get_cached_user_fields():
+    return [field.attname for field in User._meta.concrete_fields if field.attname != "password"]
+
+
+def load_cached_user(fields):
+    """
+    Create the user of an authorised app from its cached fields, without querying the database
+
+    Arguments: fields - dict with the cached fields of the user
+    Returns:   The user, of which the password is loaded from the database when accessed
+    """
+    # The password is deferred, so saving the user does not overwrite it
+    names = [name for name in get_cached_user_fields() if name in fields]
+    return User.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+
+
+def get_cached_app(token_digest):
+    """
+    Get the authorised app of a token from the caches
+
+    Arguments: token_digest - The digest of the token of the authorised app
+    Returns:   Tuple with the id of the authorised app and the fields of its user, or None if not cached
+    """
+    key = get_cache_key(token_digest)
+    data = local_cache.get(key)
+    if data is None:
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            data = shared_cache.get(key)
+        if data is not None:
+            local_cache.set(key, data)
+    return data
+
+
+def set_cached_app(token_digest, app):
+    """
+    Store the authorised app of a token in the caches, only its id and the fields of its user are stored,
+    not the token itself or the password hash of the user
+
+    Arguments: token_digest - The digest of the token of the authorised app
+               app - The authorised app
+    """
+    key = get_cache_key(token_digest)
+    data = (app.pk, {name: getattr(app.user, name) for name in get_cached_user_fields()})
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.set(key, data, KEYS_TTL)
+    local_cache.set(key, data)
+
+
+def invalidate_app_token(token_digest):
+    """
+    Remove an app token from the caches
+
+    Arguments: token_digest - The digest of the token of the authorised app
+    """
+    key = get_cache_key(token_digest)
+    local_cache.delete(key)
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.delete(key)
 
 
 class AppTokenAuthentication(BaseAuthentication):
     def authenticate(self, request):
         # The tokens to set: X-AUTH-TOKEN or X-USER-AUTH-TOKEN
         app_token = request.META.get("HTTP_X_AUTH_TOKEN")
+        if not app_token:
+            return None
         user_token = request.META.get("HTTP_X_USER_AUTH_TOKEN")
-        app = self.authorised_app_for_token(app_token)
-        if app:
-            return app.user, AuthData(app_token, user_token)
+        user = self.user_for_token(app_token)
+        if user:
+            return user, AuthData(app_token, user_token)
         else:
             return None
 
-    # @cache_value
+    def user_for_token(self, app_token):
+        token_digest = utils.token_digest(app_token)
+        cached_app = get_cached_app(token_digest)
+        if cached_app is not None:
+            _, user_fields = cached_app
+            return load_cached_user(user_fields)
+        app = self.authorised_app_for_token(app_token)
+        if app is None:
+            return None
+        set_cached_app(token_digest, app)
+        return app.user
+
     def authorised_app_for_token(self, app_token):
-        return AuthorisedApp.objects.filter(token=app_token).first()
+        # Point query on the indexed digest, the token itself is not stored
+        return AuthorisedApp.objects.select_related("user").filter(token_digest=utils.token_digest(app_token)).first()
 
 
 class AuthData(object):
@@ -772,6 +772,7 @@ createToken() {
     if (isValid) {
       this.name_visible = false;
       apptokens.create(this.token).then( response  => {
+          this.$emit('token-created', response.data.token);
           this.$emit('update-dashboard');
           this.resetForm();
           this.$emit('close-dialog');
@@ -0,0 +1,31 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_token_digests(apps, schema_editor):
+    AuthorisedApp = apps.get_model("api", "AuthorisedApp")
+    for app in AuthorisedApp.objects.all():
+        app.token_digest = hashlib.sha256(app.token.encode("utf-8")).hexdigest()
+        app.save(update_fields=["token_digest"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_authorisedapp_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorisedapp',
+            name='token_digest',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_token_digests, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='authorisedapp',
+            name='token_digest',
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def fill_token_prefixes(apps, schema_editor):
+    AuthorisedApp = apps.get_model("api", "AuthorisedApp")
+    for app in AuthorisedApp.objects.all():
+        app.token_prefix = app.token[:6]
+        app.save(update_fields=["token_prefix"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_authorisedapp_token_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorisedapp',
+            name='token_prefix',
+            field=models.CharField(
+                default='',
+                editable=False,
+                help_text='First characters of the token, to recognise it',
+                max_length=6,
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_token_prefixes, migrations.RunPython.noop),
+        # Only the digest of the token is kept, the token can not be restored when reverting
+        migrations.AlterField(
+            model_name='authorisedapp',
+            name='token',
+            field=models.TextField(null=True, unique=True),
+        ),
+        migrations.RemoveField(
+            model_name='authorisedapp',
+            name='token',
+        ),
+    ]
@@ -7,9 +7,9 @@ from certificate_engine.ssl.certificate import PolicyError
 
 
 class TrapDjangoValidationErrorCreateMixin(object):
-    def perform_create(self, serializer):
+    def perform_create(self, serializer, **kwargs):
         try:
-            serializer.save()
+            serializer.save(**kwargs)
         except DjangoValidationError as detail:
             raise serializers.ValidationError({"non_field_errors": detail.messages})
         except PolicyError as detail:
@@ -1,22 +1,75 @@
+from functools import partial
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 
 from api import utils
 
+# Nr of characters of the token stored to recognise it, the rest of the token is only known by its digest
+TOKEN_PREFIX_LENGTH = 6
+
 
 class AuthorisedApp(models.Model):
     name = models.TextField()
-    token = models.TextField(unique=True)
+    token_digest = models.CharField(max_length=64, unique=True, editable=False)
+    token_prefix = models.CharField(
+        max_length=TOKEN_PREFIX_LENGTH, editable=False, help_text="First characters of the token, to recognise it"
+    )
     user = models.ForeignKey(User, on_delete=models.PROTECT)
 
     class Meta:
         ordering = ["name"]
         unique_together = ("name", "user")
 
+    @property
+    def token(self):
+        """
+        The token is only known when it is created or changed, only its digest is stored
+        """
+        return getattr(self, "_token", None)
+
+    @token.setter
+    def token(self, value):
+        self._token = value
+
     def save(self, *args, **kwargs):
-        if not self.id:
+        if not self.id and not self.token:
             self.token = utils.new_token(44)
+        if self.token:
+            self.token_digest = utils.token_digest(self.token)
+            self.token_prefix = self.token[:TOKEN_PREFIX_LENGTH]
         super(AuthorisedApp, self).save(*args, **kwargs)
 
     def __str__(self):
-        return "{} - {}".format(self.name, self.token)
+        return "{} - {}...".format(self.name, self.token_prefix)
+
+
+def _invalidate_app_token(token_digest):
+    from api.authentication import invalidate_app_token
+
+    # After the commit, otherwise a concurrent request can cache the old record again
+    transaction.on_commit(partial(invalidate_app_token, token_digest))
+
+
+@receiver(pre_save, sender=AuthorisedApp)
+def invalidate_changed_authorised_app(sender, instance, **kwargs):
+    if instance.id:
+        token_digest = AuthorisedApp.objects.filter(pk=instance.id).values_list("token_digest", flat=True).first()
+        if token_digest:
+            _invalidate_app_token(token_digest)
+
+
+@receiver(post_delete, sender=AuthorisedApp)
+def invalidate_deleted_authorised_app(sender, instance, **kwargs):
+    _invalidate_app_token(instance.token_digest)
+
+
+@receiver(post_save, sender=User)
+def invalidate_changed_user(sender, instance, update_fields=None, **kwargs):
+    # The fields of the user are cached with the authorised apps, a login only changes the last login
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    for token_digest in AuthorisedApp.objects.filter(user=instance).values_list("token_digest", flat=True):
+        _invalidate_app_token(token_digest)
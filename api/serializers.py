@@ -2,16 +2,59 @@
 
 import django_countries
 from dj_rest_auth.serializers import UserDetailsSerializer
+from django.conf import settings
 from django.contrib.auth import password_validation
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError
 from django_countries.serializers import CountryFieldMixin
 from rest_framework import serializers
 
+from certificate_engine.ssl.certificate import CertificateError, PassPhraseError, PolicyError
+from certificate_engine.ssl.csr import get_csr_subject, load_csr
+from certificate_engine.ssl.key import KEY_SIZES
 from certificate_engine.types import CertificateTypes
-from x509_pki.models import Certificate, DistinguishedName, KeyStore
+from x509_pki.models import (
+    Certificate,
+    CertificateJob,
+    DistinguishedName,
+    KeyStore,
+    issue_certificates,
+    validate_certificate_request,
+)
 
 countries = django_countries.Countries()
 
 
+def validate_key_parameters(data):
+    """
+    Check the optional key algorithm and key size of a certificate against the supported key sizes
+
+    Arguments: data - The validated data of the certificate
+    """
+    key_algorithm = data.get("key_algorithm") or settings.KEY_ALGORITHM
+    key_size = data.get("key_size")
+    if key_size is None:
+        return
+    if KEY_SIZES[key_algorithm] == [None]:
+        raise serializers.ValidationError({"key_size": f"Key size should not be set for {key_algorithm} keys"})
+    if key_size not in KEY_SIZES[key_algorithm]:
+        sizes = ", ".join(str(size) for size in KEY_SIZES[key_algorithm])
+        raise serializers.ValidationError({"key_size": f"Key size of {key_algorithm} keys should be one of {sizes}"})
+
+
+def get_validation_error_detail(error):
+    """
+    Get the detail of a serializer validation error for an error raised while validating a certificate
+
+    Arguments: error - The django validation error or policy error
+    Returns:   Dict with the errors per field
+    """
+    if isinstance(error, DjangoValidationError):
+        return error.message_dict if hasattr(error, "error_dict") else {"non_field_errors": error.messages}
+    detail = error.args[0]
+    return detail if isinstance(detail, dict) else {"non_field_errors": [detail]}
+
+
 class DistinguishedNameSerializer(CountryFieldMixin, serializers.ModelSerializer):
     class Meta:
         fields = (
@@ -63,6 +106,8 @@ class CertificateSerializer(serializers.ModelSerializer):
             "revoked",
             "crl_distribution_url",
             "ocsp_distribution_host",
+            "key_algorithm",
+            "key_size",
             "passphrase_issuer",
             "passphrase_out",
             "passphrase_out_confirmation",
@@ -116,6 +161,7 @@ class CertificateSerializer(serializers.ModelSerializer):
 
         if "passphrase_issuer" not in data:
             self.validate_passphrase_issuer(None)
+        validate_key_parameters(data)
         return data
 
     def create(self, validated_data):
@@ -129,6 +175,199 @@ class CertificateSerializer(serializers.ModelSerializer):
         return certificate
 
 
+class CertificateJobSerializer(serializers.ModelSerializer):
+    certificate = CertificateSerializer(read_only=True)
+
+    class Meta:
+        fields = ("id", "status", "error", "created_at", "started_at", "finished_at", "certificate")
+        read_only_fields = fields
+        model = CertificateJob
+
+
+class CertificateBulkItemSerializer(serializers.ModelSerializer):
+    dn = DistinguishedNameSerializer()
+    type = serializers.ChoiceField(
+        choices=[
+            (cert_type, label)
+            for cert_type, label in Certificate.TYPES
+            if cert_type not in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]
+        ]
+    )
+    passphrase_out = serializers.CharField(max_length=200, required=False, allow_null=True, allow_blank=True)
+    passphrase_out_confirmation = serializers.CharField(
+        max_length=200, required=False, allow_null=True, allow_blank=True
+    )
+
+    class Meta:
+        fields = (
+            "name",
+            "type",
+            "dn",
+            "expires_at",
+            "key_algorithm",
+            "key_size",
+            "passphrase_out",
+            "passphrase_out_confirmation",
+        )
+        model = Certificate
+        extra_kwargs = {
+            "passphrase_out": {"write_only": True},
+            "passphrase_out_confirmation": {"write_only": True},
+        }
+
+    def validate_passphrase_out(self, passphrase_out):
+        if passphrase_out:
+            password_validation.validate_password(passphrase_out)
+            return passphrase_out
+        return None
+
+    def validate(self, data):
+        passphrase_out = data.get("passphrase_out")
+        passphrase_out_confirmation = data.get("passphrase_out_confirmation")
+        if passphrase_out and passphrase_out != passphrase_out_confirmation:
+            raise serializers.ValidationError(
+                {"passphrase_out_confirmation": "The two passphrase fields didn't match."}
+            )
+        validate_key_parameters(data)
+        return data
+
+
+class CertificateBulkSerializer(serializers.Serializer):
+    parent = serializers.PrimaryKeyRelatedField(queryset=Certificate.objects.all())
+    passphrase_issuer = serializers.CharField(max_length=200, required=False, allow_null=True, allow_blank=True)
+    certificates = CertificateBulkItemSerializer(
+        many=True, allow_empty=False, max_length=settings.CERTIFICATE_BULK_MAX_SIZE
+    )
+
+    owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
+    def validate_parent(self, parent):
+        if parent.owner != self.context["request"].user:
+            raise serializers.ValidationError("Parent certificate not found")
+        if parent.type != CertificateTypes.INTERMEDIATE:
+            raise serializers.ValidationError("Certificates can only be issued in bulk by an intermediate CA")
+        if parent.revoked:
+            raise serializers.ValidationError("Parent certificate has been revoked")
+        return parent
+
+    def validate(self, data):
+        certificates = []
+        errors = []
+        names = set()
+        for item in data["certificates"]:
+            item = dict(item)
+            dn = DistinguishedName(**item.pop("dn"))
+            certificate = Certificate(
+                parent=data["parent"],
+                owner=data["owner"],
+                dn=dn,
+                passphrase_issuer=data.get("passphrase_issuer"),
+                **item,
+            )
+            error = {}
+            try:
+                validate_certificate_request(certificate)
+                if (certificate.name, certificate.type) in names:
+                    raise DjangoValidationError(
+                        f'{dict(Certificate.TYPES)[certificate.type]} "{certificate.name}" is requested twice.'
+                    )
+                names.add((certificate.name, certificate.type))
+            except (DjangoValidationError, PolicyError) as e:
+                error = get_validation_error_detail(e)
+            certificates.append(certificate)
+            errors.append(error)
+
+        if any(errors):
+            raise serializers.ValidationError({"certificates": errors})
+        data["certificates"] = certificates
+        return data
+
+    def create(self, validated_data):
+        try:
+            return issue_certificates(validated_data["certificates"], validated_data.get("passphrase_issuer"))
+        except PassPhraseError:
+            raise serializers.ValidationError(
+                {"passphrase_issuer": "Passphrase incorrect. Not allowed to sign your certificates"}
+            )
+        except IntegrityError:
+            raise serializers.ValidationError("One of the certificates already exists.")
+
+
+class CertificateSigningRequestSerializer(serializers.ModelSerializer):
+    csr = serializers.CharField(write_only=True, help_text="PKCS#10 certificate signing request in PEM format")
+    dn = DistinguishedNameSerializer(
+        required=False, help_text="Distinguished name of the certificate, if not set taken from the request"
+    )
+    type = serializers.ChoiceField(
+        choices=[
+            (cert_type, label)
+            for cert_type, label in Certificate.TYPES
+            if cert_type
+            in [CertificateTypes.SERVER_CERT, CertificateTypes.CLIENT_CERT, CertificateTypes.CODE_SIGNING_CERT]
+        ]
+    )
+    passphrase_issuer = serializers.CharField(max_length=200, required=False, allow_null=True, allow_blank=True)
+
+    owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
+    class Meta:
+        fields = (
+            "name",
+            "owner",
+            "parent",
+            "type",
+            "dn",
+            "expires_at",
+            "csr",
+            "passphrase_issuer",
+        )
+        model = Certificate
+        extra_kwargs = {
+            "parent": {"required": True, "allow_null": False},
+            "passphrase_issuer": {"write_only": True},
+        }
+
+    def validate_csr(self, csr):
+        try:
+            return load_csr(csr)
+        except CertificateError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate_parent(self, parent):
+        if parent.owner != self.context["request"].user:
+            raise serializers.ValidationError("Parent certificate not found")
+        if parent.revoked:
+            raise serializers.ValidationError("Parent certificate has been revoked")
+        return parent
+
+    def validate(self, data):
+        data = dict(data)
+        csr = data.pop("csr")
+        dn = DistinguishedName(**(data.pop("dn", None) or get_csr_subject(csr)))
+        certificate = Certificate(dn=dn, public_key=csr.public_key(), **data)
+        try:
+            validate_certificate_request(certificate)
+        except (DjangoValidationError, PolicyError) as e:
+            raise serializers.ValidationError(get_validation_error_detail(e))
+        try:
+            if not certificate.parent.is_passphrase_valid(certificate.passphrase_issuer):
+                raise serializers.ValidationError(
+                    {"passphrase_issuer": "Passphrase incorrect. Not allowed to sign your certificate"}
+                )
+        except KeyStore.DoesNotExist:
+            raise serializers.ValidationError("Certificate has no cert, something went wrong during generation")
+        return {"certificate": certificate}
+
+    def create(self, validated_data):
+        certificate = validated_data["certificate"]
+        dn = certificate.dn
+        dn.save()
+        certificate.dn = dn
+        certificate.save()
+        certificate.passphrase_issuer = None
+        return certificate
+
+
 class CertificateRevokeSerializer(serializers.ModelSerializer):
     passphrase_issuer = serializers.CharField(max_length=200, required=True)
 
@@ -226,6 +465,23 @@ class CrlRenewSerializer(serializers.ModelSerializer):
         return None
 
 
+class CertificateDownloadSerializer(serializers.Serializer):
+    passphrase_in = serializers.CharField(max_length=200, required=False, allow_null=True, allow_blank=True)
+
+    def validate_passphrase_in(self, passphrase_in):
+        return passphrase_in or None
+
+
+class CertificateUnlockSerializer(serializers.ModelSerializer):
+    passphrase_in = serializers.CharField(max_length=200, required=True, write_only=True)
+    minutes = serializers.IntegerField(min_value=1, required=True, write_only=True)
+
+    class Meta:
+        fields = ("passphrase_in", "minutes", "unlocked_until")
+        model = Certificate
+        read_only_fields = ("unlocked_until",)
+
+
 class UserSerializer(UserDetailsSerializer):
     class Meta(UserDetailsSerializer.Meta):
         fields = ("username", "email", "first_name", "last_name")
@@ -0,0 +1,186 @@
+from unittest.mock import patch
+
+import arrow
+from cryptography import x509
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from django.utils import timezone
+from rest_framework import status
+
+from api.tests.base import APILoginTestCase
+from certificate_engine.ssl.key import Key
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, KeyStore
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+class BulkCertificateTest(APILoginTestCase):
+    base_url = "/api/v1/certificates/bulk"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            name="repleo root ca",
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="ca.bounca.org",
+            ),
+        )
+        cls.ca.save()
+
+        cls.int_certificate = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            name="repleo int ca",
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="int.bounca.org",
+            ),
+        )
+        cls.int_certificate.save()
+
+    def make_request(self, count, **kwargs):
+        expires_at = arrow.get(timezone.now()).shift(years=+1).date()
+        data = {
+            "parent": self.int_certificate.pk,
+            "passphrase_issuer": "welkom1234",
+            "certificates": [
+                {
+                    "type": CertificateTypes.CLIENT_CERT,
+                    "expires_at": str(expires_at),
+                    "dn": {"commonName": f"device-{i}.repleo.nl", "subjectAltNames": [f"device-{i}@repleo.nl"]},
+                    "passphrase_out": "dev1cepass",
+                    "passphrase_out_confirmation": "dev1cepass",
+                }
+                for i in range(count)
+            ],
+        }
+        data.update(kwargs)
+        return data
+
+    def test_bulk_issue_certificates(self):
+        response = self.client.post(self.base_url, self.make_request(3), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(len(response.data), 3)
+        int_crt = x509.load_pem_x509_certificate(self.int_certificate.keystore.crt.encode("utf8"))
+        for i, result in enumerate(response.data):
+            cert = Certificate.objects.get(pk=result["id"])
+            self.assertEqual(cert.name, f"device-{i}.repleo.nl")
+            self.assertEqual(cert.type, CertificateTypes.CLIENT_CERT)
+            self.assertEqual(cert.parent, self.int_certificate)
+            self.assertEqual(cert.owner, self.user)
+            self.assertEqual(cert.created_at, timezone.now().date())
+            self.assertEqual(result["keystore"]["fingerprint"], cert.keystore.fingerprint)
+
+            crt = x509.load_pem_x509_certificate(cert.keystore.crt.encode("utf8"))
+            self.assertEqual(crt.serial_number, int(cert.serial))
+            self.assertEqual(crt.issuer, int_crt.subject)
+            crt.verify_directly_issued_by(int_crt)
+            self.assertTrue(Key.check_passphrase(cert.keystore.key, "dev1cepass"))
+            self.assertIsNotNone(cert.keystore.p12)
+            self.assertIsNotNone(cert.keystore.p12_legacy)
+
+    def test_bulk_issue_key_algorithms(self):
+        data = self.make_request(2)
+        data["certificates"][0].update(key_algorithm="ed25519")
+        data["certificates"][1].update(key_algorithm="ecdsa", key_size=384)
+        response = self.client.post(self.base_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        public_keys = [
+            x509.load_pem_x509_certificate(Certificate.objects.get(pk=r["id"]).keystore.crt.encode("utf8")).public_key()
+            for r in response.data
+        ]
+        self.assertIsInstance(public_keys[0], ed25519.Ed25519PublicKey)
+        self.assertIsInstance(public_keys[1], ec.EllipticCurvePublicKey)
+        self.assertEqual(public_keys[1].curve.name, "secp384r1")
+
+    def test_bulk_issue_unsupported_key_size(self):
+        data = self.make_request(1)
+        data["certificates"][0].update(key_algorithm="ecdsa", key_size=2048)
+        response = self.client.post(self.base_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Key size of ecdsa keys should be one of 256, 384", str(response.data["certificates"][0]))
+
+    def test_bulk_issue_decrypts_issuer_key_once(self):
+        with patch.object(Key, "load", autospec=True, side_effect=Key.load) as load, patch.object(
+            Certificate, "is_passphrase_valid"
+        ) as is_passphrase_valid:
+            response = self.client.post(self.base_url, self.make_request(3), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(load.call_count, 1)
+        is_passphrase_valid.assert_not_called()
+
+    def test_bulk_issue_wrong_passphrase_issuer(self):
+        response = self.client.post(self.base_url, self.make_request(2, passphrase_issuer="wrong"), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("passphrase_issuer", response.data)
+        self.assertFalse(Certificate.objects.filter(type=CertificateTypes.CLIENT_CERT).exists())
+        self.assertEqual(KeyStore.objects.count(), 2)
+
+    def test_bulk_issue_item_errors(self):
+        response = self.client.post(self.base_url, self.make_request(1), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        data = self.make_request(3)
+        data["certificates"][2]["dn"]["commonName"] = "int.bounca.org"
+        response = self.client.post(self.base_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data["certificates"]
+        self.assertEqual(len(errors), 3)
+        self.assertIn("already exists", str(errors[0]))
+        self.assertEqual(errors[1], {})
+        self.assertIn("should not be equal to common name of parent", str(errors[2]))
+        self.assertEqual(Certificate.objects.filter(type=CertificateTypes.CLIENT_CERT).count(), 1)
+
+    def test_bulk_issue_duplicate_in_request(self):
+        data = self.make_request(2)
+        data["certificates"][1]["dn"]["commonName"] = "device-0.repleo.nl"
+        response = self.client.post(self.base_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("is requested twice", str(response.data["certificates"][1]))
+
+    def test_bulk_issue_passphrase_out_not_matching(self):
+        data = self.make_request(1)
+        data["certificates"][0]["passphrase_out_confirmation"] = "otherpass1"
+        response = self.client.post(self.base_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("didn't match", str(response.data["certificates"][0]))
+
+    def test_bulk_issue_authority_types_not_allowed(self):
+        data = self.make_request(1)
+        data["certificates"][0]["type"] = CertificateTypes.INTERMEDIATE
+        response = self.client.post(self.base_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("type", response.data["certificates"][0])
+
+    def test_bulk_issue_root_parent_not_allowed(self):
+        response = self.client.post(self.base_url, self.make_request(1, parent=self.ca.pk), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("parent", response.data)
+
+    def test_bulk_issue_parent_different_owner(self):
+        user = UserFactory.create(username="test_user_bulk")
+        self.client.logout()
+        self.client.login(username=user.username, password="password123")
+        response = self.client.post(self.base_url, self.make_request(1), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data["parent"][0]), "Parent certificate not found")
+
+    def test_bulk_issue_empty(self):
+        response = self.client.post(self.base_url, self.make_request(0), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("certificates__non_field_errors", response.data)
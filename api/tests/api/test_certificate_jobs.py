@@ -0,0 +1,214 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import arrow
+from cryptography import x509
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from api.tests.base import APILoginTestCase
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.key_pool import KeyPool
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import (
+    Certificate,
+    CertificateJob,
+    DistinguishedName,
+    KeyStore,
+    claim_certificate_job,
+    fail_stale_certificate_jobs,
+)
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+@override_settings(CERTIFICATE_ASYNC_ENABLED=True)
+class CertificateJobTest(APILoginTestCase):
+    base_url = "/api/v1/certificates"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            name="repleo root ca",
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="ca.bounca.org",
+            ),
+        )
+        cls.ca.save()
+
+        cls.int_certificate = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            name="repleo int ca",
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="int.bounca.org",
+            ),
+        )
+        cls.int_certificate.save()
+
+    def create_certificate(self, common_name="device.repleo.nl", url=None, **kwargs):
+        data = {
+            "type": CertificateTypes.CLIENT_CERT,
+            "parent": self.int_certificate.pk,
+            "passphrase_issuer": "welkom1234",
+            "passphrase_out": "dev1cepass",
+            "passphrase_out_confirmation": "dev1cepass",
+            "expires_at": str(arrow.get(timezone.now()).shift(years=+1).date()),
+            "dn": {"commonName": common_name, "subjectAltNames": [f"{common_name}@repleo.nl"]},
+        }
+        data.update(kwargs)
+        return self.client.post(url or f"{self.base_url}?async=true", data, format="json")
+
+    def run_worker(self):
+        out = StringIO()
+        call_command("certificate_worker", "--once", "--processes", "1", stdout=out)
+        return out.getvalue()
+
+    def test_create_certificate_async(self):
+        response = self.create_certificate()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, response.data)
+        self.assertEqual(response.data["status"], CertificateJob.PENDING)
+        self.assertIsNone(response.data["certificate"]["keystore"])
+        self.assertTrue(response["Location"].endswith(f"/api/v1/jobs/{response.data['id']}"))
+
+        job = CertificateJob.objects.get(pk=response.data["id"])
+        self.assertEqual(job.owner, self.user)
+        self.assertNotIn(b"welkom1234", bytes(job.passphrases))
+        self.assertEqual(job.get_passphrases(), ("welkom1234", "dev1cepass"))
+        self.assertFalse(KeyStore.objects.filter(certificate=job.certificate).exists())
+
+        self.run_worker()
+
+        response = self.client.get(f"/api/v1/jobs/{job.pk}", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], CertificateJob.DONE)
+        self.assertIsNotNone(response.data["finished_at"])
+        cert = Certificate.objects.get(pk=response.data["certificate"]["id"])
+        self.assertEqual(response.data["certificate"]["keystore"]["fingerprint"], cert.keystore.fingerprint)
+        self.assertIsNone(CertificateJob.objects.get(pk=job.pk).passphrases)
+
+        crt = x509.load_pem_x509_certificate(cert.keystore.crt.encode("utf8"))
+        crt.verify_directly_issued_by(x509.load_pem_x509_certificate(self.int_certificate.keystore.crt.encode("utf8")))
+        self.assertTrue(Key.check_passphrase(cert.keystore.key, "dev1cepass"))
+        self.assertIsNotNone(cert.keystore.p12)
+
+    def test_create_certificate_async_disabled(self):
+        with override_settings(CERTIFICATE_ASYNC_ENABLED=False):
+            response = self.create_certificate()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertIsNotNone(response.data["keystore"])
+        self.assertFalse(CertificateJob.objects.exists())
+
+    def test_create_certificate_sync(self):
+        response = self.create_certificate(url=self.base_url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertFalse(CertificateJob.objects.exists())
+
+    def test_create_certificate_async_invalid(self):
+        response = self.create_certificate(passphrase_issuer="wrong")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("passphrase_issuer", response.data)
+        self.assertFalse(CertificateJob.objects.exists())
+
+    def test_failed_job(self):
+        response = self.create_certificate()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, response.data)
+        job_id = response.data["id"]
+        dn_id = Certificate.objects.get(pk=response.data["certificate"]["id"]).dn.pk
+        with patch("x509_pki.models.build_keystore", side_effect=RuntimeError("Signing failed")):
+            self.run_worker()
+
+        response = self.client.get(f"/api/v1/jobs/{job_id}", format="json")
+        self.assertEqual(response.data["status"], CertificateJob.FAILED)
+        self.assertEqual(response.data["error"], "Signing failed")
+        self.assertIsNone(response.data["certificate"])
+        self.assertFalse(DistinguishedName.objects.filter(pk=dn_id).exists())
+
+        response = self.create_certificate()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, response.data)
+
+    def test_stale_running_job(self):
+        response = self.create_certificate()
+        job_id = response.data["id"]
+        dn_id = Certificate.objects.get(pk=response.data["certificate"]["id"]).dn.pk
+        job = claim_certificate_job()
+        self.assertEqual(str(job.pk), job_id)
+
+        # A job of a worker which is still generating is not touched
+        self.assertEqual(fail_stale_certificate_jobs(), 0)
+        self.assertEqual(CertificateJob.objects.get(pk=job_id).status, CertificateJob.RUNNING)
+
+        # The worker has been stopped, the job is failed once the timeout has passed
+        CertificateJob.objects.filter(pk=job_id).update(started_at=timezone.now() - timedelta(minutes=11))
+        self.assertIn("Processed 0 certificate jobs", self.run_worker())
+
+        job = CertificateJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, CertificateJob.FAILED)
+        self.assertEqual(job.error, "Certificate generation did not finish in time")
+        self.assertIsNone(job.passphrases)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(job.certificate)
+        self.assertFalse(DistinguishedName.objects.filter(pk=dn_id).exists())
+
+        response = self.create_certificate()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, response.data)
+
+    def test_revoked_before_processed(self):
+        response = self.create_certificate()
+        job_id = response.data["id"]
+        cert = Certificate.objects.get(pk=response.data["certificate"]["id"])
+        cert.passphrase_issuer = "welkom1234"
+        cert.delete()
+        self.run_worker()
+        job = CertificateJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, CertificateJob.FAILED)
+        self.assertFalse(KeyStore.objects.filter(certificate=job.certificate).exists())
+
+    def test_worker_processes_jobs_in_order(self):
+        jobs = [self.create_certificate(f"device-{i}.repleo.nl").data["id"] for i in range(3)]
+        self.assertIn("Processed 3 certificate jobs", self.run_worker())
+        started = [CertificateJob.objects.get(pk=job).started_at for job in jobs]
+        self.assertEqual(started, sorted(started))
+        self.assertIn("Processed 0 certificate jobs", self.run_worker())
+
+    def test_worker_key_pool(self):
+        Key.pool = KeyPool(2, executor=ThreadPoolExecutor(max_workers=2))
+        self.addCleanup(setattr, Key, "pool", None)
+        self.addCleanup(Key.pool.shutdown)
+        self.create_certificate()
+        with self.assertLogs("certificate_engine.ssl.key_pool", level="INFO") as logs:
+            self.assertIn("Processed 1 certificate jobs", self.run_worker())
+        # The pool is filled at start of the worker, its stats are logged when the queue is empty
+        self.assertRegex(logs.output[0], r"Key pool rsa-2048: depth \d, pending \d, hits \d, misses \d, errors 0")
+        Key.pool.wait()
+        stats = Key.pool.stats()["rsa-2048"]
+        self.assertEqual(stats["depth"], 2)
+        self.assertEqual(stats["hits"] + stats["misses"], 1)
+
+    def test_job_different_owner(self):
+        response = self.create_certificate()
+        user = UserFactory.create(username="test_user_jobs")
+        self.client.logout()
+        self.client.login(username=user.username, password="password123")
+        response = self.client.get(f"/api/v1/jobs/{response.data['id']}", format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
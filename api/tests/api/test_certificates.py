@@ -1,8 +1,12 @@
 import io
 import zipfile
-from uuid import UUID
+from uuid import UUID, uuid4
 
 import arrow
+from cryptography import x509
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
 
@@ -147,6 +151,8 @@ class ServerCertificateTest(APILoginTestCase):
                     "expires_at": self.cert[i].expires_at.strftime("%Y-%m-%d"),
                     "id": self.cert[i].id,
                     "keystore": {"fingerprint": self.cert[i].keystore.fingerprint},
+                    "key_algorithm": "rsa",
+                    "key_size": 2048,
                     "name": f"www.repleo.nl - {i}",
                     "ocsp_distribution_host": None,
                     "parent": self.cert[i].parent.id,
@@ -176,6 +182,116 @@ class ServerCertificateTest(APILoginTestCase):
         result = response.json()
         self.assertEqual(result["name"], "www.repleo.nl - 0")
 
+    def test_filter_revoked_and_expired_certificates(self):
+        Certificate.objects.filter(pk=self.cert[1].pk).update(revoked_uuid=uuid4(), revoked_at=timezone.now())
+        Certificate.objects.filter(pk=self.cert[2].pk).update(
+            expires_at=arrow.get(timezone.now()).shift(days=-1).date()
+        )
+
+        response = self.client.get(f"{self.base_url}?type=S&revoked=true", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([cert["id"] for cert in response.json()], [self.cert[1].id])
+        self.assertTrue(response.json()[0]["revoked"])
+
+        response = self.client.get(f"{self.base_url}?type=S&revoked=false", format="json")
+        self.assertEqual([cert["id"] for cert in response.json()], [self.cert[3].id, self.cert[2].id, self.cert[0].id])
+
+        response = self.client.get(f"{self.base_url}?type=S&expired=true", format="json")
+        self.assertEqual([cert["id"] for cert in response.json()], [self.cert[2].id])
+        self.assertTrue(response.json()[0]["expired"])
+
+        response = self.client.get(f"{self.base_url}?type=S&expired=false&revoked=false", format="json")
+        self.assertEqual([cert["id"] for cert in response.json()], [self.cert[3].id, self.cert[0].id])
+
+        response = self.client.get(f"{self.base_url}?type=S&ordering=-is_revoked,id", format="json")
+        self.assertEqual(
+            [cert["id"] for cert in response.json()],
+            [self.cert[1].id, self.cert[0].id, self.cert[2].id, self.cert[3].id],
+        )
+
+    def test_filter_revoked_certificates_in_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{self.base_url}?revoked=false&page=1&page_size=2", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 7)
+        self.assertEqual(len(response.json()["results"]), 2)
+        count_query = next(query["sql"] for query in queries.captured_queries if "COUNT(" in query["sql"])
+        self.assertIn("revoked_uuid", count_query)
+        self.assertTrue(any("LIMIT 2" in query["sql"] for query in queries.captured_queries))
+
+    def test_retrieve_certificates_number_of_queries(self):
+        # session, user, count and the certificates joined with their dn and keystore
+        with self.assertNumQueries(4):
+            response = self.client.get(f"{self.base_url}?page=1&page_size=2", format="json")
+        self.assertEqual(len(response.json()["results"]), 2)
+        with self.assertNumQueries(4):
+            response = self.client.get(f"{self.base_url}?page=1&page_size=7", format="json")
+        self.assertEqual(len(response.json()["results"]), 7)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"{self.base_url}?page=1&page_size=7", format="json")
+        select_query = queries.captured_queries[-1]["sql"]
+        self.assertIn('"x509_pki_keystore"."fingerprint"', select_query)
+        self.assertNotIn('"x509_pki_keystore"."p12"', select_query)
+        self.assertNotIn('"x509_pki_keystore"."key"', select_query)
+
+    def test_retrieve_certificates_cursor_pagination(self):
+        test_uri = f"{self.base_url}?pagination=cursor&page_size=3"
+        ids = []
+        with CaptureQueriesContext(connection) as queries:
+            while test_uri:
+                response = self.client.get(test_uri, format="json")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotIn("count", response.json())
+                ids += [cert["id"] for cert in response.json()["results"]]
+                test_uri = response.json()["next"]
+        expected_ids = list(Certificate.objects.filter(owner=self.user).order_by("-id").values_list("id", flat=True))
+        self.assertEqual(ids, expected_ids)
+        for query in queries.captured_queries:
+            self.assertNotIn("COUNT(", query["sql"])
+            self.assertNotIn("OFFSET", query["sql"])
+
+    def test_retrieve_certificates_cursor_pagination_related_ordering(self):
+        expected_ids = list(
+            Certificate.objects.filter(type=CertificateTypes.INTERMEDIATE)
+            .order_by("dn__commonName")
+            .values_list("id", flat=True)
+        )
+        response = self.client.get(
+            f"{self.base_url}?pagination=cursor&page_size=1&type=I&ordering=dn__commonName", format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([cert["id"] for cert in response.json()["results"]], expected_ids[:1])
+        response = self.client.get(response.json()["next"], format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([cert["id"] for cert in response.json()["results"]], expected_ids[1:])
+        self.assertIsNone(response.json()["next"])
+
+    def test_retrieve_certificates_cursor_pagination_duplicate_values(self):
+        # Several certificates have the same type and expiry date
+        for ordering in ["type", "-type", "expires_at", "-expires_at"]:
+            expected_ids = list(
+                Certificate.objects.filter(owner=self.user).order_by(ordering, "id").values_list("id", flat=True)
+            )
+            ids = []
+            pages = []
+            test_uri = f"{self.base_url}?pagination=cursor&page_size=2&ordering={ordering}"
+            while test_uri:
+                response = self.client.get(test_uri, format="json")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                pages.append([cert["id"] for cert in response.json()["results"]])
+                ids += pages[-1]
+                test_uri = response.json()["next"]
+            self.assertEqual(ids, expected_ids)
+
+            # Walk back from the last page
+            test_uri = response.json()["previous"]
+            for page in reversed(pages[:-1]):
+                response = self.client.get(test_uri, format="json")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual([cert["id"] for cert in response.json()["results"]], page)
+                test_uri = response.json()["previous"]
+            self.assertIsNone(test_uri)
+
     def test_create_server_certificates_no_passphrase(self):
         test_uri = f"{self.base_url}"
         expire_date = arrow.get(timezone.now()).shift(years=+1).date()
@@ -265,6 +381,8 @@ class ServerCertificateTest(APILoginTestCase):
                 },
                 "expired": False,
                 "expires_at": expire_date.strftime("%Y-%m-%d"),
+                "key_algorithm": "rsa",
+                "key_size": 2048,
                 "name": "www.repleo.nl - test post",
                 "ocsp_distribution_host": None,
                 "parent": self.int_certificate.id,
@@ -277,6 +395,64 @@ class ServerCertificateTest(APILoginTestCase):
             },
         )
 
+    def make_server_certificate_request(self, name, **kwargs):
+        cert = {
+            "dn": {"commonName": name, "subjectAltNames": [name]},
+            "expires_at": arrow.get(timezone.now()).shift(years=+1).date(),
+            "name": name,
+            "parent": self.int_certificate.id,
+            "passphrase_issuer": "welkom1234",
+            "type": "S",
+        }
+        cert.update(kwargs)
+        return cert
+
+    def test_create_server_certificate_key_algorithm(self):
+        for key_algorithm, key_size, key_type, curve in [
+            ("ecdsa", None, ec.EllipticCurvePublicKey, "secp256r1"),
+            ("ecdsa", 384, ec.EllipticCurvePublicKey, "secp384r1"),
+            ("ed25519", None, ed25519.Ed25519PublicKey, None),
+            ("rsa", 3072, rsa.RSAPublicKey, None),
+        ]:
+            with self.subTest(key_algorithm=key_algorithm, key_size=key_size):
+                name = f"{key_algorithm}{key_size or ''}.repleo.nl"
+                cert = self.make_server_certificate_request(name, key_algorithm=key_algorithm)
+                if key_size:
+                    cert["key_size"] = key_size
+                response = self.client.post(self.base_url, data=cert, format="json")
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.json())
+                result = response.json()
+                self.assertEqual(result["key_algorithm"], key_algorithm)
+                self.assertEqual(result["key_size"], key_size or (256 if key_algorithm == "ecdsa" else None))
+
+                certificate = Certificate.objects.get(pk=result["id"])
+                public_key = x509.load_pem_x509_certificate(certificate.keystore.crt.encode("utf8")).public_key()
+                self.assertIsInstance(public_key, key_type)
+                if curve:
+                    self.assertEqual(public_key.curve.name, curve)
+                elif key_size:
+                    self.assertEqual(public_key.key_size, key_size)
+
+    def test_create_server_certificate_unsupported_key_parameters(self):
+        for kwargs, error in [
+            ({"key_algorithm": "dsa"}, {"key_algorithm": ['"dsa" is not a valid choice.']}),
+            (
+                {"key_algorithm": "ecdsa", "key_size": 521},
+                {"key_size": ["Key size of ecdsa keys should be one of 256, 384"]},
+            ),
+            (
+                {"key_algorithm": "ed25519", "key_size": 256},
+                {"key_size": ["Key size should not be set for ed25519 keys"]},
+            ),
+            ({"key_size": 1024}, {"key_size": ["Key size of rsa keys should be one of 2048, 3072, 4096"]}),
+        ]:
+            with self.subTest(**kwargs):
+                cert = self.make_server_certificate_request("unsupported.repleo.nl", **kwargs)
+                response = self.client.post(self.base_url, data=cert, format="json")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertDictEqual(response.json(), error)
+        self.assertFalse(Certificate.objects.filter(name="unsupported.repleo.nl").exists())
+
     def test_revoke_server_certificates_no_passphrase(self):
         dn = DistinguishedNameFactory(
             countryName="NL",
@@ -366,7 +542,7 @@ class ServerCertificateTest(APILoginTestCase):
         test_uri = f"{self.base_url}/{self.cert[0].id}/download"
         response = self.client.get(test_uri, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        with zipfile.ZipFile(io.BytesIO(response.content)) as cert_zipfile:
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as cert_zipfile:
             self.assertListEqual(
                 [info.filename for info in cert_zipfile.infolist()],
                 [
@@ -385,6 +561,49 @@ class ServerCertificateTest(APILoginTestCase):
             self.assertTrue("CN=www.repleo.nl.setup" in info_txt.replace(" ", ""))
             self.assertTrue("TLS Web Server Authentication" in info_txt)
 
+    def test_download_server_certificate_number_of_queries(self):
+        test_uri = f"{self.base_url}/{self.cert[0].id}/download"
+        # session, user and the certificate joined with its chain and keystores
+        with self.assertNumQueries(3):
+            response = self.client.get(test_uri, format="json")
+            content = b"".join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(content)) as cert_zipfile:
+            self.assertEqual(cert_zipfile.testzip(), None)
+            self.assertEqual(len(cert_zipfile.infolist()), 8)
+
+    def test_download_issued_certificates(self):
+        Certificate.objects.filter(pk=self.cert[1].pk).update(revoked_uuid=uuid4(), revoked_at=timezone.now())
+        test_uri = f"{self.base_url}/{self.int_certificate.id}/issued/download"
+        response = self.client.get(test_uri, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response["Content-Disposition"], "attachment; filename=test_client_intermediate_certificate.issued.zip"
+        )
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as cert_zipfile:
+            filenames = [info.filename for info in cert_zipfile.infolist()]
+            expected = ["rootca.pem", "intermediate.pem", "intermediate_root-chain.pem"]
+            for i in [0, 2, 3]:
+                name = f"www.repleo.nl_-_{i}"
+                expected += [
+                    f"{name}.server_cert/{name}.pem",
+                    f"{name}.server_cert/{name}-chain.pem",
+                    f"{name}.server_cert/{name}.key",
+                    f"{name}.server_cert/{name}.p12",
+                    f"{name}.server_cert/{name}.legacy.p12",
+                ]
+            self.assertListEqual(filenames, expected)
+            self.assertEqual(
+                cert_zipfile.read("www.repleo.nl_-_2.server_cert/www.repleo.nl_-_2.pem").decode("utf-8"),
+                Certificate.objects.get(pk=self.cert[2].pk).keystore.crt,
+            )
+
+    def test_download_issued_certificates_not_intermediate(self):
+        response = self.client.get(f"{self.base_url}/{self.ca.id}/issued/download", format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{self.base_url}/{self.cert[0].id}/issued/download", format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_renew_server_certificate(self):
         dn = DistinguishedNameFactory(
             countryName="NL",
@@ -449,6 +668,8 @@ class ServerCertificateTest(APILoginTestCase):
                 },
                 "expired": False,
                 "expires_at": renew_expire_date.strftime("%Y-%m-%d"),
+                "key_algorithm": "rsa",
+                "key_size": 2048,
                 "name": "www.repleo.nl - revoke",
                 "ocsp_distribution_host": None,
                 "parent": self.int_certificate.id,
@@ -464,7 +685,7 @@ class ServerCertificateTest(APILoginTestCase):
         test_uri = f"{self.base_url}/{renewed_cert_id}/download"
         response = self.client.get(test_uri, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        with zipfile.ZipFile(io.BytesIO(response.content)) as cert_zipfile:
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as cert_zipfile:
             cert_pem = cert_zipfile.read("www.repleo.nl_-_revoke.pem").decode("utf-8")
             info_txt = get_certificate_info(cert_pem)
             self.assertTrue("CN=www.repleo.nl-revoke" in info_txt.replace(" ", ""))
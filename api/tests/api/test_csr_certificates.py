@@ -0,0 +1,227 @@
+import io
+import zipfile
+from unittest.mock import patch
+
+import arrow
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+from django.utils import timezone
+from rest_framework import status
+
+from api.tests.base import APILoginTestCase
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+def make_csr(key, common_name="device.repleo.nl", alt_names=("device.repleo.nl",)):
+    builder = x509.CertificateSigningRequestBuilder().subject_name(
+        x509.Name(
+            [
+                x509.NameAttribute(NameOID.COUNTRY_NAME, "NL"),
+                x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Repleo"),
+                x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+            ]
+        )
+    )
+    if alt_names:
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName([x509.DNSName(name) for name in alt_names]), critical=False
+        )
+    return builder.sign(key, hashes.SHA256())
+
+
+def serialize_csr(csr):
+    return csr.public_bytes(serialization.Encoding.PEM).decode("utf8")
+
+
+class CertificateSigningRequestTest(APILoginTestCase):
+    base_url = "/api/v1/certificates/csr"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            name="repleo root ca",
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="ca.bounca.org",
+            ),
+        )
+        cls.ca.save()
+
+        cls.int_certificate = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            name="repleo int ca",
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="int.bounca.org",
+            ),
+        )
+        cls.int_certificate.save()
+
+    def setUp(self):
+        super().setUp()
+        self.key = ec.generate_private_key(ec.SECP256R1())
+
+    def make_request(self, csr=None, **kwargs):
+        data = {
+            "type": CertificateTypes.SERVER_CERT,
+            "parent": self.int_certificate.pk,
+            "passphrase_issuer": "welkom1234",
+            "expires_at": str(arrow.get(timezone.now()).shift(years=+1).date()),
+            "csr": serialize_csr(csr or make_csr(self.key)),
+        }
+        data.update(kwargs)
+        return data
+
+    def load_certificate(self, certificate):
+        return x509.load_pem_x509_certificate(certificate.keystore.crt.encode("utf8"))
+
+    def test_issue_certificate(self):
+        with patch("x509_pki.models.KeyGenerator.create_key") as create_key:
+            response = self.client.post(self.base_url, self.make_request(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        create_key.assert_not_called()
+
+        cert = Certificate.objects.get(pk=response.data["id"])
+        self.assertEqual(cert.name, "device.repleo.nl")
+        self.assertEqual(cert.dn.countryName.code, "NL")
+        self.assertEqual(cert.dn.organizationName, "Repleo")
+        self.assertEqual(cert.dn.subjectAltNames, ["device.repleo.nl"])
+        self.assertEqual((cert.key_algorithm, cert.key_size), ("ecdsa", 256))
+        self.assertEqual(response.data["keystore"]["fingerprint"], cert.keystore.fingerprint)
+        self.assertEqual(cert.keystore.key, "")
+        self.assertIsNone(cert.keystore.p12)
+
+        crt = self.load_certificate(cert)
+        crt.verify_directly_issued_by(self.load_certificate(self.int_certificate))
+        self.assertEqual(crt.public_key(), self.key.public_key())
+        alt_names = crt.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        self.assertEqual(alt_names.get_values_for_type(x509.DNSName), ["device.repleo.nl"])
+
+    def test_issue_certificate_dn(self):
+        data = self.make_request(
+            name="device",
+            type=CertificateTypes.CLIENT_CERT,
+            dn={"commonName": "Device", "subjectAltNames": ["device@repleo.nl"]},
+        )
+        response = self.client.post(self.base_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        crt = self.load_certificate(Certificate.objects.get(pk=response.data["id"]))
+        self.assertEqual(crt.subject.rfc4514_string(), "CN=Device")
+        alt_names = crt.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        self.assertEqual(alt_names.get_values_for_type(x509.RFC822Name), ["device@repleo.nl"])
+
+    def test_invalid_csr(self):
+        response = self.client.post(self.base_url, {**self.make_request(), "csr": "no csr"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data["csr"][0]), "Could not load certificate signing request")
+
+    def test_invalid_signature(self):
+        der = bytearray(make_csr(rsa.generate_private_key(65537, 2048)).public_bytes(serialization.Encoding.DER))
+        der[-1] ^= 0xFF
+        csr = x509.load_der_x509_csr(bytes(der))
+        response = self.client.post(self.base_url, self.make_request(csr), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data["csr"][0]), "Signature of certificate signing request is not valid")
+
+    def test_policy_violation(self):
+        response = self.client.post(self.base_url, self.make_request(make_csr(self.key, alt_names=())), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            str(response.data["dn__subjectAltNames"][0]), "Attribute 'subjectAltNames' is required by policy"
+        )
+
+        csr = make_csr(self.key, common_name="int.bounca.org")
+        response = self.client.post(self.base_url, self.make_request(csr), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("should not be equal to common name of parent", str(response.data))
+        self.assertFalse(Certificate.objects.filter(type=CertificateTypes.SERVER_CERT).exists())
+
+    def test_unsupported_key(self):
+        csr = make_csr(ec.generate_private_key(ec.SECP521R1()))
+        response = self.client.post(self.base_url, self.make_request(csr), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Curve secp521r1 not supported for ECDSA keys", str(response.data))
+
+        csr = make_csr(rsa.generate_private_key(65537, 1024))
+        response = self.client.post(self.base_url, self.make_request(csr), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Key size of rsa keys should be one of 2048, 3072, 4096", str(response.data))
+
+    def test_authority_types_not_allowed(self):
+        for cert_type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE, CertificateTypes.OCSP]:
+            response = self.client.post(self.base_url, self.make_request(type=cert_type), format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("type", response.data)
+
+    def test_wrong_passphrase_issuer(self):
+        response = self.client.post(self.base_url, self.make_request(passphrase_issuer="wrong"), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("passphrase_issuer", response.data)
+        self.assertFalse(Certificate.objects.filter(type=CertificateTypes.SERVER_CERT).exists())
+
+    def test_certificate_exists(self):
+        response = self.client.post(self.base_url, self.make_request(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        response = self.client.post(self.base_url, self.make_request(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("already exists", str(response.data))
+
+    def test_parent_different_owner(self):
+        user = UserFactory.create(username="test_user_csr")
+        self.client.logout()
+        self.client.login(username=user.username, password="password123")
+        response = self.client.post(self.base_url, self.make_request(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data["parent"][0]), "Parent certificate not found")
+
+    def test_download_without_key(self):
+        response = self.client.post(self.base_url, self.make_request(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        pk = response.data["id"]
+
+        response = self.client.get(f"/api/v1/certificates/{pk}/download")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as cert_zipfile:
+            self.assertEqual(
+                sorted(cert_zipfile.namelist()),
+                [
+                    "device.repleo.nl-chain.pem",
+                    "device.repleo.nl.pem",
+                    "intermediate.pem",
+                    "intermediate_root-chain.pem",
+                    "rootca.pem",
+                ],
+            )
+
+        response = self.client.get(f"/api/v1/certificates/{pk}/key")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_renew(self):
+        response = self.client.post(self.base_url, self.make_request(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        cert = Certificate.objects.get(pk=response.data["id"])
+        cert.passphrase_issuer = "welkom1234"
+        renewed = Certificate.objects.get(pk=cert.renew(arrow.get(timezone.now()).shift(years=+2).date()).pk)
+        self.assertNotEqual(renewed.pk, response.data["id"])
+        self.assertEqual(renewed.keystore.key, "")
+        self.assertEqual(self.load_certificate(renewed).public_key(), self.key.public_key())
@@ -0,0 +1,133 @@
+import io
+import zipfile
+from unittest.mock import patch
+
+import arrow
+from cryptography.hazmat.primitives.serialization import pkcs12
+from django.utils import timezone
+from rest_framework import status
+
+from api.tests.base import APILoginTestCase
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, KeyStore
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory
+
+
+@patch("x509_pki.models.settings.PKCS12_GENERATION", "lazy")
+class LazyPKCS12DownloadTest(APILoginTestCase):
+    base_url = "/api/v1/certificates"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            name="repleo root ca",
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="ca.bounca.org",
+            ),
+        )
+        cls.ca.save()
+
+        cls.int_certificate = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            name="repleo int ca",
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="int.bounca.org",
+            ),
+        )
+        cls.int_certificate.save()
+
+    def create_certificate(self, passphrase_out="dev1cepass"):
+        response = self.client.post(
+            self.base_url,
+            {
+                "type": CertificateTypes.CLIENT_CERT,
+                "parent": self.int_certificate.pk,
+                "passphrase_issuer": "welkom1234",
+                "passphrase_out": passphrase_out,
+                "passphrase_out_confirmation": passphrase_out,
+                "expires_at": str(arrow.get(timezone.now()).shift(years=+1).date()),
+                "dn": {"commonName": "device.repleo.nl", "subjectAltNames": ["device@repleo.nl"]},
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return Certificate.objects.get(pk=response.data["id"])
+
+    @staticmethod
+    def read_zip(response):
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as cert_zipfile:
+            return {info.filename: cert_zipfile.read(info.filename) for info in cert_zipfile.infolist()}
+
+    def test_issue_without_pkcs12(self):
+        cert = self.create_certificate()
+        self.assertIsNone(cert.keystore.p12)
+        self.assertIsNone(cert.keystore.p12_legacy)
+
+    def test_download_without_passphrase(self):
+        cert = self.create_certificate()
+        response = self.client.get(f"{self.base_url}/{cert.pk}/download")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        files = self.read_zip(response)
+        self.assertIn("device.repleo.nl.key", files)
+        self.assertNotIn("device.repleo.nl.p12", files)
+        self.assertNotIn("device.repleo.nl.legacy.p12", files)
+
+    def test_download_with_passphrase(self):
+        cert = self.create_certificate()
+        response = self.client.post(
+            f"{self.base_url}/{cert.pk}/download", {"passphrase_in": "dev1cepass"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        files = self.read_zip(response)
+        for filename in ["device.repleo.nl.p12", "device.repleo.nl.legacy.p12"]:
+            p12 = pkcs12.load_pkcs12(files[filename], b"dev1cepass")
+            self.assertEqual(p12.cert.friendly_name, b"device.repleo.nl")
+            self.assertEqual(len(p12.additional_certs), 2)
+
+        keystore = KeyStore.objects.get(certificate=cert)
+        self.assertEqual(bytes(keystore.p12), files["device.repleo.nl.p12"])
+        self.assertEqual(bytes(keystore.p12_legacy), files["device.repleo.nl.legacy.p12"])
+        response = self.client.get(f"{self.base_url}/{cert.pk}/download")
+        self.assertIn("device.repleo.nl.p12", self.read_zip(response))
+
+    @patch("x509_pki.models.settings.PKCS12_CACHE", False)
+    def test_download_with_passphrase_not_cached(self):
+        cert = self.create_certificate()
+        response = self.client.post(
+            f"{self.base_url}/{cert.pk}/download", {"passphrase_in": "dev1cepass"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("device.repleo.nl.p12", self.read_zip(response))
+        self.assertIsNone(KeyStore.objects.get(certificate=cert).p12)
+
+    def test_download_with_wrong_passphrase(self):
+        cert = self.create_certificate()
+        response = self.client.post(f"{self.base_url}/{cert.pk}/download", {"passphrase_in": "wrong"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("passphrase_in", response.data)
+        self.assertIsNone(KeyStore.objects.get(certificate=cert).p12)
+
+    def test_download_key_without_passphrase(self):
+        cert = self.create_certificate(passphrase_out="")
+        response = self.client.get(f"{self.base_url}/{cert.pk}/download")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        files = self.read_zip(response)
+        self.assertIsNotNone(pkcs12.load_pkcs12(files["device.repleo.nl.p12"], None).key)
@@ -0,0 +1,238 @@
+import base64
+import datetime
+from io import StringIO
+from unittest import mock
+
+import arrow
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509 import ocsp
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from certificate_engine.ssl.certificate import PassPhraseError
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, OcspResponse, update_ocsp_responses
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+class OcspResponderTest(TestCase):
+    base_url = "/api/v1/ocsp"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserFactory()
+        cls.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="ca"
+            ),
+        )
+        cls.ca.save()
+        cls.int = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="int"
+            ),
+        )
+        cls.int.save()
+        cls.responder = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+            type=CertificateTypes.OCSP,
+            parent=cls.int,
+            owner=cls.user,
+            crl_distribution_url=None,
+            ocsp_distribution_host=None,
+            passphrase_out="ocspp4ss",
+            passphrase_out_confirmation="ocspp4ss",
+            passphrase_issuer="welkom1234",
+            dn=DistinguishedNameFactory(commonName="ocsp.repleo.nl"),
+        )
+        cls.responder.save()
+        cls.cert = cls.make_server_certificate("www.repleo.nl")
+        cls.int_crt = x509.load_pem_x509_certificate(cls.int.keystore.crt.encode("utf8"))
+        cls.responder_crt = x509.load_pem_x509_certificate(cls.responder.keystore.crt.encode("utf8"))
+
+    @classmethod
+    def make_server_certificate(cls, common_name):
+        cert = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+            name=common_name,
+            type=CertificateTypes.SERVER_CERT,
+            parent=cls.int,
+            owner=cls.user,
+            crl_distribution_url=None,
+            ocsp_distribution_host=None,
+            passphrase_issuer="welkom1234",
+            dn=DistinguishedNameFactory(commonName=common_name, subjectAltNames=[common_name]),
+        )
+        cert.save()
+        return Certificate.objects.get(pk=cert.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def make_request(self, cert, algorithm=None):
+        crt = x509.load_pem_x509_certificate(cert.keystore.crt.encode("utf8"))
+        builder = ocsp.OCSPRequestBuilder().add_certificate(crt, self.int_crt, algorithm or hashes.SHA1())
+        return builder.build().public_bytes(serialization.Encoding.DER)
+
+    def post(self, data):
+        response = self.client.generic("POST", self.base_url, data, content_type="application/ocsp-request")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/ocsp-response")
+        return response, ocsp.load_der_ocsp_response(response.content)
+
+    def test_good(self):
+        self.assertEqual(update_ocsp_responses(self.responder, "ocspp4ss"), 2)
+        response, ocsp_response = self.post(self.make_request(self.cert))
+        self.assertEqual(ocsp_response.response_status, ocsp.OCSPResponseStatus.SUCCESSFUL)
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.GOOD)
+        self.assertEqual(ocsp_response.serial_number, int(self.cert.serial))
+        self.assertEqual(ocsp_response.certificates, [self.responder_crt])
+        self.responder_crt.public_key().verify(
+            ocsp_response.signature,
+            ocsp_response.tbs_response_bytes,
+            padding.PKCS1v15(),
+            ocsp_response.signature_hash_algorithm,
+        )
+        self.assertNotIn("Cache-Control", response)
+
+    def test_get(self):
+        update_ocsp_responses(self.responder, "ocspp4ss")
+        encoded = base64.b64encode(self.make_request(self.cert)).decode("ascii")
+        response = self.client.get(f"{self.base_url}/{encoded}")
+        self.assertEqual(response.status_code, 200)
+        ocsp_response = ocsp.load_der_ocsp_response(response.content)
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.GOOD)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertIn("Expires", response)
+        self.assertIn("Last-Modified", response)
+        self.assertIn("ETag", response)
+
+    def test_served_from_cache(self):
+        update_ocsp_responses(self.responder, "ocspp4ss")
+        data = self.make_request(self.cert)
+        self.post(data)
+        with self.assertNumQueries(0):
+            response, ocsp_response = self.post(data)
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.GOOD)
+
+    def test_revoked(self):
+        update_ocsp_responses(self.responder, "ocspp4ss")
+        data = self.make_request(self.cert)
+        self.post(data)
+
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.passphrase_issuer = "welkom1234"
+        with self.captureOnCommitCallbacks(execute=True):
+            cert.delete()
+
+        response, ocsp_response = self.post(data)
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+        self.assertEqual(ocsp_response.revocation_time_utc, cert.revoked_at.replace(microsecond=0))
+        # Signed by the authority itself, which did not need the key of the OCSP signing certificate
+        self.assertEqual(
+            ocsp_response.responder_key_hash,
+            x509.SubjectKeyIdentifier.from_public_key(self.int_crt.public_key()).digest,
+        )
+
+        # Refreshing keeps the revoked status
+        with mock.patch("x509_pki.models.settings.OCSP_REFRESH_HOURS", 48):
+            update_ocsp_responses(self.responder, "ocspp4ss")
+        response, ocsp_response = self.post(data)
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+
+    def test_revoked_authority_without_ocsp(self):
+        update_ocsp_responses(self.responder, "ocspp4ss")
+        Certificate.objects.filter(pk=self.int.pk).update(ocsp_distribution_host=None)
+        data = self.make_request(self.cert)
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.passphrase_issuer = "welkom1234"
+        with self.captureOnCommitCallbacks(execute=True):
+            cert.delete()
+        response, ocsp_response = self.post(data)
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+
+    def test_revoked_signing_failed(self):
+        update_ocsp_responses(self.responder, "ocspp4ss")
+        data = self.make_request(self.cert)
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.passphrase_issuer = "welkom1234"
+        with mock.patch("x509_pki.models.ocsp_response_builder", side_effect=RuntimeError("Signing failed")):
+            with self.captureOnCommitCallbacks(execute=True):
+                cert.delete()
+        # The previous response is kept until it is replaced on the next update
+        self.assertTrue(OcspResponse.objects.get(certificate=cert).stale)
+        response, ocsp_response = self.post(data)
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.GOOD)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(update_ocsp_responses(self.responder, "ocspp4ss"), 1)
+        self.assertFalse(OcspResponse.objects.get(certificate=cert).stale)
+        response, ocsp_response = self.post(data)
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+
+    def test_refresh_window(self):
+        self.assertEqual(update_ocsp_responses(self.responder, "ocspp4ss"), 2)
+        self.assertEqual(update_ocsp_responses(self.responder, "ocspp4ss"), 0)
+        cert = self.make_server_certificate("www2.repleo.nl")
+        self.assertEqual(update_ocsp_responses(self.responder, "ocspp4ss"), 1)
+        self.assertTrue(OcspResponse.objects.filter(certificate=cert).exists())
+        with mock.patch("x509_pki.models.settings.OCSP_REFRESH_HOURS", 48):
+            self.assertEqual(update_ocsp_responses(self.responder, "ocspp4ss"), 3)
+
+    def test_expired_response(self):
+        update_ocsp_responses(self.responder, "ocspp4ss")
+        OcspResponse.objects.update(next_update=timezone.now() - datetime.timedelta(minutes=1))
+        response, ocsp_response = self.post(self.make_request(self.cert))
+        self.assertEqual(ocsp_response.response_status, ocsp.OCSPResponseStatus.UNAUTHORIZED)
+
+    def test_unknown_certificate(self):
+        response, ocsp_response = self.post(self.make_request(self.cert))
+        self.assertEqual(ocsp_response.response_status, ocsp.OCSPResponseStatus.UNAUTHORIZED)
+        with self.assertNumQueries(0):
+            response, ocsp_response = self.post(self.make_request(self.cert))
+        self.assertEqual(ocsp_response.response_status, ocsp.OCSPResponseStatus.UNAUTHORIZED)
+
+    def test_other_hash_algorithm(self):
+        update_ocsp_responses(self.responder, "ocspp4ss")
+        response, ocsp_response = self.post(self.make_request(self.cert, hashes.SHA256()))
+        self.assertEqual(ocsp_response.response_status, ocsp.OCSPResponseStatus.UNAUTHORIZED)
+
+    def test_malformed_request(self):
+        response, ocsp_response = self.post(b"malformed")
+        self.assertEqual(ocsp_response.response_status, ocsp.OCSPResponseStatus.MALFORMED_REQUEST)
+        response = self.client.get(f"{self.base_url}/not-base64")
+        self.assertEqual(
+            ocsp.load_der_ocsp_response(response.content).response_status, ocsp.OCSPResponseStatus.MALFORMED_REQUEST
+        )
+
+    def test_update_ocsp_responses_wrong_passphrase(self):
+        with self.assertRaises(PassPhraseError):
+            update_ocsp_responses(self.responder, "wrong")
+        self.assertFalse(OcspResponse.objects.exists())
+
+    def test_ocsp_responses_command(self):
+        out = StringIO()
+        with mock.patch("getpass.getpass", return_value="ocspp4ss"):
+            call_command("ocsp_responses", self.responder.pk, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Signed 2 OCSP responses")
+        with self.assertRaises(CommandError):
+            call_command("ocsp_responses", self.cert.pk)
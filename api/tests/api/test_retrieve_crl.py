@@ -2,10 +2,14 @@ from time import sleep
 from unittest.mock import patch
 
 import arrow
+from cryptography import x509
+from django.core.cache import cache
+from django.test import override_settings
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from api.authentication import local_cache
 from api.tests.base import APITokenLoginTestCase
 from api.tests.factories import AuthorisedAppFactory
 from certificate_engine.types import CertificateTypes
@@ -146,6 +150,129 @@ class CrlRetrieveTest(APITokenLoginTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertNotEqual(response.headers["Last-Modified"], ls)
 
+    @patch("x509_pki.models.settings.CRL_DELTA_ENABLED", True)
+    def test_retrieve_crl_last_modified_delta_update(self):
+        self.ca.passphrase_in = "welkom123"
+        self.ca.renew_revocation_list()
+        test_uri = f"{self.base_url}{self.ca.pk}/crl"
+        response = self.client.get(test_uri, format="json")
+        last_modified = response.headers["Last-Modified"]
+        delta_last_modified = self.client.get(f"{test_uri}?delta=1", format="json").headers["Last-Modified"]
+        sleep(1)
+        client2 = APIClient()
+        client2.login(username=self.user.username, password="password123")
+        client2.delete(
+            f"/api/v1/certificates/{self.int_certificate2.pk}", data={"passphrase_issuer": "welkom123"}, format="json"
+        )
+        # Only the delta CRL has been regenerated, the complete CRL is unchanged
+        response = self.client.get(test_uri, format="json", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(f"{test_uri}?delta=1", format="json", HTTP_IF_MODIFIED_SINCE=delta_last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_delta_crl_not_available(self):
+        test_uri = f"{self.base_url}{self.ca.pk}/crl?delta=1"
+        response = self.client.get(test_uri, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @patch("x509_pki.models.settings.CRL_DELTA_ENABLED", True)
+    def test_retrieve_delta_crl_root_certificate(self):
+        client2 = APIClient()
+        client2.login(username=self.user.username, password="password123")
+        client2.delete(
+            f"/api/v1/certificates/{self.int_certificate2.pk}", data={"passphrase_issuer": "welkom123"}, format="json"
+        )
+        test_uri = f"{self.base_url}{self.ca.pk}/crl?delta=1"
+        response = self.client.get(test_uri, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Content-Disposition"], "attachment; filename=root_ca-delta.crl")
+        self.assertIn(b"-----BEGIN X509 CRL-----", response.content)
+
+    def test_retrieve_crl_conditional(self):
+        test_uri = f"{self.base_url}{self.ca.pk}/crl"
+        response = self.client.get(test_uri, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+        self.assertRegex(etag, r'^"[0-9a-f]{32}-pem"$')
+
+        response = self.client.get(test_uri, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertIn("max-age=", response.headers["Cache-Control"])
+
+        response = self.client.get(test_uri, format="json", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(test_uri, format="json", HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_crl_conditional_after_revoke(self):
+        test_uri = f"{self.base_url}{self.ca.pk}/crl"
+        etag = self.client.get(test_uri, format="json").headers["ETag"]
+        client2 = APIClient()
+        client2.login(username=self.user.username, password="password123")
+        client2.delete(
+            f"/api/v1/certificates/{self.int_certificate2.pk}", data={"passphrase_issuer": "welkom123"}, format="json"
+        )
+        response = self.client.get(test_uri, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_retrieve_crl_cache_control(self):
+        test_uri = f"{self.base_url}{self.ca.pk}/crl"
+        response = self.client.get(test_uri, format="json")
+        self.assertEqual(response.headers["Cache-Control"], "private, max-age=300")
+        self.assertIn("X-Auth-Token", response.headers["Vary"])
+        with override_settings(CRL_CACHE_MAX_AGE=10 * 365 * 24 * 3600):
+            response = self.client.get(test_uri, format="json")
+        crl = x509.load_pem_x509_crl(response.content)
+        max_age = int(response.headers["Cache-Control"].split("max-age=")[1])
+        expected = (crl.next_update_utc - timezone.now()).total_seconds()
+        self.assertAlmostEqual(max_age, expected, delta=5)
+
+    def test_retrieve_crl_pem_not_parsed(self):
+        test_uri = f"{self.base_url}{self.ca.pk}/crl"
+        with patch("api.views.x509.load_pem_x509_crl") as load_crl:
+            response = self.client.get(test_uri, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get(test_uri, format="json", HTTP_IF_NONE_MATCH=response.headers["ETag"])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        load_crl.assert_not_called()
+        response = self.client.get(test_uri, format="json")
+        self.assertEqual(response.content.decode("utf-8"), Certificate.objects.get(pk=self.ca.pk).crlstore.crl)
+
+    def test_retrieve_crl_der(self):
+        test_uri = f"{self.base_url}{self.ca.pk}/crl?encoding=der"
+        response = self.client.get(test_uri, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Content-Type"], "application/pkix-crl")
+        self.assertEqual(response.headers["Content-Disposition"], "attachment; filename=root_ca.der.crl")
+        self.assertRegex(response.headers["ETag"], r"-der\"$")
+        pem = self.client.get(f"{self.base_url}{self.ca.pk}/crl", format="json").content
+        self.assertEqual(x509.load_der_x509_crl(response.content), x509.load_pem_x509_crl(pem))
+
+        test_uri = f"{self.base_url}{self.int_certificate_old_crl_extension.pk}/crl?encoding=der"
+        response = self.client.get(test_uri, format="json")
+        self.assertEqual(response.headers["Content-Disposition"], "attachment; filename=cert2.der.crl")
+
+    def test_retrieve_crl_unknown_encoding(self):
+        response = self.client.get(f"{self.base_url}{self.ca.pk}/crl?encoding=txt", format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_crl_number_of_queries(self):
+        cache.clear()
+        local_cache.clear()
+        # token joined with its user and the certificate joined with its CRL
+        with self.assertNumQueries(2):
+            response = self.client.get(f"{self.base_url}{self.ca.pk}/crl", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # token and its user from the cache, the certificate joined with its CRL
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{self.base_url}{self.ca.pk}/crl", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_retrieve_crl_root_certificate_different_owner(self):
         user = UserFactory.create(username="test_user_diff_crl")
         auth_app = AuthorisedAppFactory(user=user)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import arrow
+from django.utils import timezone
+from rest_framework import status
+
+from api.tests.base import APILoginTestCase
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory
+
+
+class SigningUnavailableTest(APILoginTestCase):
+    base_url = "/api/v1/certificates"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            name="repleo root ca",
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="ca.bounca.org",
+            ),
+        )
+        cls.ca.save()
+
+        cls.int_certificate = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            name="repleo int ca",
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="int.bounca.org",
+            ),
+        )
+        cls.int_certificate.save()
+
+        cls.cert = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+            name="www.repleo.nl",
+            type=CertificateTypes.SERVER_CERT,
+            parent=cls.int_certificate,
+            owner=cls.user,
+            crl_distribution_url=None,
+            ocsp_distribution_host=None,
+            passphrase_issuer="welkom1234",
+            dn=DistinguishedNameFactory(commonName="www.repleo.nl", subjectAltNames=["www.repleo.nl"]),
+        )
+        cls.cert.save()
+
+    def setUp(self):
+        super().setUp()
+        # The signing daemon is configured, but not running
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = patch("x509_pki.models.settings.SIGNING_SOCKET", os.path.join(directory, "signing.sock"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertUnavailable(self, response):
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(str(response.data["detail"]), "Signing service not available, try again later.")
+
+    def test_create_certificate(self):
+        data = {
+            "type": CertificateTypes.CLIENT_CERT,
+            "parent": self.int_certificate.pk,
+            "passphrase_issuer": "welkom1234",
+            "expires_at": str(arrow.get(timezone.now()).shift(years=+1).date()),
+            "dn": {"commonName": "device.repleo.nl", "subjectAltNames": ["device@repleo.nl"]},
+        }
+        self.assertUnavailable(self.client.post(self.base_url, data, format="json"))
+        self.assertFalse(Certificate.objects.filter(name="device.repleo.nl").exists())
+
+    def test_revoke_certificate(self):
+        response = self.client.delete(
+            f"{self.base_url}/{self.cert.pk}", data={"passphrase_issuer": "welkom1234"}, format="json"
+        )
+        self.assertUnavailable(response)
+
+    def test_renew_certificate(self):
+        data = {
+            "expires_at": str(arrow.get(timezone.now()).shift(years=+2).date()),
+            "passphrase_issuer": "welkom1234",
+        }
+        self.assertUnavailable(self.client.patch(f"{self.base_url}/{self.cert.pk}/renew", data, format="json"))
+        self.assertIsNone(Certificate.objects.get(pk=self.cert.pk).revoked_at)
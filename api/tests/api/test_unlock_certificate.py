@@ -0,0 +1,167 @@
+from unittest.mock import patch
+
+import arrow
+from cryptography import x509
+from django.utils import timezone
+from rest_framework import status
+
+from api.tests.base import APILoginTestCase
+from certificate_engine.ssl.key import Key
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, issuer_key_cache
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+@patch("x509_pki.models.settings.KEY_UNLOCK_MAX_MINUTES", 60)
+class UnlockCertificateTest(APILoginTestCase):
+    base_url = "/api/v1/certificates"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            name="repleo root ca",
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="ca.bounca.org",
+            ),
+        )
+        cls.ca.save()
+
+        cls.int_certificate = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            name="repleo int ca",
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="int.bounca.org",
+            ),
+        )
+        cls.int_certificate.save()
+
+    def tearDown(self):
+        issuer_key_cache.evict(self.int_certificate.pk)
+
+    def unlock(self, passphrase="welkom1234", minutes=10, pk=None):
+        return self.client.patch(
+            f"{self.base_url}/{pk or self.int_certificate.pk}/unlock",
+            {"passphrase_in": passphrase, "minutes": minutes},
+            format="json",
+        )
+
+    def create_client_certificate(self, common_name, passphrase_issuer="welkom1234"):
+        return self.client.post(
+            self.base_url,
+            {
+                "type": CertificateTypes.CLIENT_CERT,
+                "parent": self.int_certificate.pk,
+                "passphrase_issuer": passphrase_issuer,
+                "expires_at": str(arrow.get(timezone.now()).shift(years=+1).date()),
+                "dn": {"commonName": common_name, "subjectAltNames": [f"{common_name}@repleo.nl"]},
+            },
+            format="json",
+        )
+
+    def test_unlock(self):
+        response = self.unlock()
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        cert = Certificate.objects.get(pk=self.int_certificate.pk)
+        self.assertTrue(cert.unlocked)
+        self.assertEqual(arrow.get(response.data["unlocked_until"]), arrow.get(cert.unlocked_until))
+        self.assertIn(cert.pk, issuer_key_cache)
+
+    def test_unlocked_key_not_decrypted(self):
+        self.assertEqual(self.unlock().status_code, status.HTTP_200_OK)
+        with patch.object(Key, "load", autospec=True, side_effect=Key.load) as load, patch.object(
+            Key, "check_passphrase", side_effect=Key.check_passphrase
+        ) as check_passphrase:
+            response = self.create_client_certificate("device.repleo.nl")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+            cert = Certificate.objects.get(pk=response.data["id"])
+            response = self.client.delete(
+                f"{self.base_url}/{cert.pk}", {"passphrase_issuer": "welkom1234"}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        load.assert_not_called()
+        check_passphrase.assert_not_called()
+        crl = x509.load_pem_x509_crl(Certificate.objects.get(pk=self.int_certificate.pk).crlstore.crl.encode("utf8"))
+        self.assertIsNotNone(crl.get_revoked_certificate_by_serial_number(int(cert.serial)))
+
+    def test_unlocked_key_requires_passphrase(self):
+        self.assertEqual(self.unlock().status_code, status.HTTP_200_OK)
+        response = self.create_client_certificate("device.repleo.nl", passphrase_issuer="wrong")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("passphrase_issuer", response.data)
+
+    def test_lock(self):
+        self.assertEqual(self.unlock().status_code, status.HTTP_200_OK)
+        response = self.client.delete(f"{self.base_url}/{self.int_certificate.pk}/unlock")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Certificate.objects.get(pk=self.int_certificate.pk).unlocked)
+        self.assertNotIn(self.int_certificate.pk, issuer_key_cache)
+
+    def test_locked_by_other_process(self):
+        self.assertEqual(self.unlock().status_code, status.HTTP_200_OK)
+        Certificate.objects.filter(pk=self.int_certificate.pk).update(unlocked_until=None)
+        response = self.create_client_certificate("device.repleo.nl")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertNotIn(self.int_certificate.pk, issuer_key_cache)
+
+    def test_unlock_wrong_passphrase(self):
+        response = self.unlock(passphrase="wrong")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("passphrase_in", response.data)
+        self.assertFalse(Certificate.objects.get(pk=self.int_certificate.pk).unlocked)
+
+    def test_unlock_too_long(self):
+        response = self.unlock(minutes=61)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unlock_disabled(self):
+        with patch("x509_pki.models.settings.KEY_UNLOCK_MAX_MINUTES", 0):
+            response = self.unlock()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Unlocking keys is not enabled", str(response.data))
+
+    def test_unlock_disabled_idle_timeout(self):
+        response = self.unlock()
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        with patch("x509_pki.models.issuer_key_cache", None):
+            response = self.unlock()
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("Unlocking keys is not enabled", str(response.data))
+
+            # Keys unlocked before are decrypted on every use
+            with patch.object(Key, "load", autospec=True, side_effect=Key.load) as load:
+                response = self.create_client_certificate("device.repleo.nl")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+            self.assertTrue(load.called)
+            response = self.client.delete(f"{self.base_url}/{self.int_certificate.pk}/unlock")
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_unlock_leaf_certificate(self):
+        response = self.create_client_certificate("device.repleo.nl")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        response = self.unlock(pk=response.data["id"], passphrase="welkom")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unlock_different_owner(self):
+        user = UserFactory.create(username="test_user_unlock")
+        self.client.logout()
+        self.client.login(username=user.username, password="password123")
+        response = self.unlock()
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
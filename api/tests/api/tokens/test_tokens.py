@@ -2,6 +2,7 @@ from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
 from rest_framework.test import APIClient, APITestCase
 
+from api.authentication import AppTokenAuthentication
 from api.models import AuthorisedApp
 from api.tests.factories import AuthorisedAppFactory
 from x509_pki.tests.factories import UserFactory
@@ -60,14 +61,37 @@ class TokensTest(APITestCase):
         self.assertEqual(response.data[0]["name"], token_1.name)
         self.assertEqual(response.data[1]["name"], token_2.name)
 
+    def test_retrieve_tokens_cursor_pagination(self):
+        tokens = [AuthorisedAppFactory(name=f"token_{i}", user=self.user) for i in range(3)]
+        AuthorisedAppFactory(name="token_0", user=self.alt_user)
+        response = self.client.get(f"{self.test_uri}?pagination=cursor&page_size=2&ordering=name", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([token["name"] for token in response.data["results"]], ["token_0", "token_1"])
+        self.assertIsNone(response.data["previous"])
+        self.assertNotIn("count", response.data)
+        response = self.client.get(response.data["next"], format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([token["id"] for token in response.data["results"]], [tokens[2].id])
+        self.assertIsNone(response.data["next"])
+
+    def test_retrieve_tokens_invalid_cursor(self):
+        response = self.client.get(f"{self.test_uri}?pagination=cursor&cursor=cD10b2tlbl9h", format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_create_token(self):
         response = self.client.post(self.test_uri, {"name": "token_1_api"}, format="json")
         self.assertEqual(response.data["name"], "token_1_api")
-        self.assertTrue(bool(response.data["token"]))
+        token = response.data["token"]
+        self.assertEqual(len(token), 44)
+        self.assertEqual(response.data["token_prefix"], token[:6])
         response = self.client.get(self.test_uri, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]["name"], "token_1_api")
+        # The token is only shown at creation
+        self.assertIsNone(response.data[0]["token"])
+        self.assertEqual(response.data[0]["token_prefix"], token[:6])
+        self.assertEqual(AppTokenAuthentication().user_for_token(token), self.user)
 
     def test_create_token_invalid(self):
         response = self.client.post(self.test_uri, {}, format="json")
@@ -20,7 +20,9 @@ class AuthorisedAppFactory(DjangoModelFactory):
     @classmethod
     def default(cls):
         try:
-            authorised_app = models.AuthorisedApp.objects.get(token="aasdfghjkl")
+            authorised_app = models.AuthorisedApp.objects.get(token_digest=utils.token_digest("aasdfghjkl"))
+            # Only the digest of the token is stored
+            authorised_app.token = "aasdfghjkl"
         except ObjectDoesNotExist:
             authorised_app = AuthorisedAppFactory.create(token="aasdfghjkl")
         return authorised_app
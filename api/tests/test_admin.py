@@ -5,6 +5,7 @@ from unittest.mock import patch
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 
+from api import utils
 from api.admin import AuthorisedAppForm
 from api.models import AuthorisedApp
 
@@ -31,7 +32,20 @@ class AuthorisedAppFormTest(TestCase):
         form = AuthorisedAppForm(data=form_data, instance=self.authorised_app, current_user=self.user)
         self.assertTrue(form.is_valid())
         cleaned_data = form.clean()
-        self.assertEqual(cleaned_data["token"], self.authorised_app.token)
+        self.assertEqual(cleaned_data["token"], "")
+        token_digest = self.authorised_app.token_digest
+        form.save()
+        self.assertEqual(AuthorisedApp.objects.get(pk=self.authorised_app.pk).token_digest, token_digest)
+
+    @patch("api.admin.utils.new_token", return_value="new_generated_token")
+    def test_save_new_token(self, mock_new_token):
+        form_data = {"name": "TestApp", "generate_new_token": True, "user": self.user}
+        form = AuthorisedAppForm(data=form_data, instance=self.authorised_app, current_user=self.user)
+        self.assertTrue(form.is_valid())
+        form.save()
+        authorised_app = AuthorisedApp.objects.get(pk=self.authorised_app.pk)
+        self.assertEqual(authorised_app.token_digest, utils.token_digest("new_generated_token"))
+        self.assertEqual(authorised_app.token_prefix, "new_ge")
 
     def test_fields_disabled_for_non_superuser(self):
         non_superuser = User.objects.create(username="non_superuser", is_superuser=False)
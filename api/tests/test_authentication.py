@@ -0,0 +1,167 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api import utils
+from api.authentication import AppTokenAuthentication, LocalCache, get_cache_key, get_shared_cache, local_cache
+from api.models import AuthorisedApp
+from api.tests.factories import AuthorisedAppFactory
+from x509_pki.tests.factories import UserFactory
+
+
+class LocalCacheTest(TestCase):
+    def test_get_set_delete(self):
+        local = LocalCache(size=2, ttl=10)
+        self.assertIsNone(local.get("a"))
+        local.set("a", 1)
+        self.assertEqual(local.get("a"), 1)
+        local.delete("a")
+        self.assertIsNone(local.get("a"))
+
+    def test_least_recently_used_evicted(self):
+        local = LocalCache(size=2, ttl=10)
+        local.set("a", 1)
+        local.set("b", 2)
+        local.get("a")
+        local.set("c", 3)
+        self.assertEqual(local.get("a"), 1)
+        self.assertIsNone(local.get("b"))
+        self.assertEqual(local.get("c"), 3)
+
+    def test_expired(self):
+        local = LocalCache(size=2, ttl=10)
+        with patch("api.authentication.time.monotonic", return_value=100):
+            local.set("a", 1)
+        with patch("api.authentication.time.monotonic", return_value=109):
+            self.assertEqual(local.get("a"), 1)
+        with patch("api.authentication.time.monotonic", return_value=110):
+            self.assertIsNone(local.get("a"))
+
+
+class AppTokenAuthenticationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserFactory.default()
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.auth_app = AuthorisedAppFactory(user=self.user)
+        self.authentication = AppTokenAuthentication()
+
+    def authenticate(self, token=None):
+        headers = {"HTTP_X_AUTH_TOKEN": token} if token else {}
+        return self.authentication.authenticate(RequestFactory().get("/", **headers))
+
+    def test_authenticate(self):
+        with self.assertNumQueries(1):
+            user, auth_data = self.authenticate(self.auth_app.token)
+        self.assertEqual(user, self.user)
+        self.assertEqual(auth_data.app_token, self.auth_app.token)
+
+    def test_authenticate_cached(self):
+        self.authenticate(self.auth_app.token)
+        with self.assertNumQueries(0):
+            user, auth_data = self.authenticate(self.auth_app.token)
+            self.assertEqual(user, self.user)
+            self.assertEqual(user.username, self.user.username)
+            self.assertTrue(user.is_authenticated)
+
+    def test_cached_user_save_keeps_password(self):
+        self.authenticate(self.auth_app.token)
+        user, auth_data = self.authenticate(self.auth_app.token)
+        user.first_name = "Changed"
+        user.save()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, "Changed")
+        self.assertTrue(user.check_password("password123"))
+
+    @patch("api.authentication.get_shared_cache", return_value=cache)
+    def test_invalidate_on_user_change(self, get_shared_cache):
+        self.authenticate(self.auth_app.token)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertIsNone(cache.get(get_cache_key(self.auth_app.token_digest)))
+        user, auth_data = self.authenticate(self.auth_app.token)
+        self.assertFalse(user.is_active)
+
+    def test_login_keeps_cache(self):
+        self.authenticate(self.auth_app.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            APIClient().login(username=self.user.username, password="password123")
+        self.assertIsNotNone(local_cache.get(get_cache_key(self.auth_app.token_digest)))
+
+    def test_authenticate_shared_cache(self):
+        with patch("api.authentication.get_shared_cache", return_value=cache):
+            self.authenticate(self.auth_app.token)
+            local_cache.clear()
+            with self.assertNumQueries(0):
+                user, auth_data = self.authenticate(self.auth_app.token)
+        self.assertEqual(user, self.user)
+
+    def test_local_memory_cache_not_shared(self):
+        self.assertIsNone(get_shared_cache())
+        self.authenticate(self.auth_app.token)
+        self.assertIsNone(cache.get(get_cache_key(self.auth_app.token_digest)))
+
+    def test_token_not_in_cache(self):
+        with patch("api.authentication.get_shared_cache", return_value=cache):
+            self.authenticate(self.auth_app.token)
+        self.assertNotIn(self.auth_app.token, get_cache_key(self.auth_app.token_digest))
+        self.assertIsNone(cache.get(f":app_auth:authorised_app:{self.auth_app.token}:"))
+        key = get_cache_key(self.auth_app.token_digest)
+        app_id, user_fields = cache.get(key)
+        self.assertEqual(app_id, self.auth_app.pk)
+        self.assertEqual(user_fields["id"], self.user.pk)
+        self.assertNotIn("password", user_fields)
+        self.assertEqual(local_cache.get(key), cache.get(key))
+
+    def test_token_digest(self):
+        self.assertEqual(len(self.auth_app.token_digest), 64)
+        self.assertEqual(self.auth_app.token_digest, utils.token_digest(self.auth_app.token))
+        self.assertNotEqual(self.auth_app.token_digest, self.auth_app.token)
+
+    def test_no_token(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.authenticate())
+
+    def test_unknown_token(self):
+        self.assertIsNone(self.authenticate("unknown"))
+        self.assertIsNone(cache.get(get_cache_key(utils.token_digest("unknown"))))
+
+    @patch("api.authentication.get_shared_cache", return_value=cache)
+    def test_invalidate_on_delete(self, get_shared_cache):
+        self.authenticate(self.auth_app.token)
+        client = APIClient()
+        client.login(username=self.user.username, password="password123")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.delete(f"/api/v1/auth/tokens/{self.auth_app.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertIsNone(self.authenticate(self.auth_app.token))
+        self.assertIsNone(cache.get(get_cache_key(self.auth_app.token_digest)))
+
+    @patch("api.authentication.get_shared_cache", return_value=cache)
+    def test_invalidate_on_token_change(self, get_shared_cache):
+        token = self.auth_app.token
+        self.authenticate(token)
+        self.auth_app.token = "new-token"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auth_app.save()
+        self.assertIsNone(self.authenticate(token))
+        self.assertEqual(self.auth_app.token_digest, utils.token_digest("new-token"))
+        user, auth_data = self.authenticate("new-token")
+        self.assertEqual(user, self.user)
+
+    def test_token_not_stored(self):
+        authorised_app = AuthorisedApp.objects.get(pk=self.auth_app.pk)
+        self.assertIsNone(authorised_app.token)
+        self.assertEqual(authorised_app.token_prefix, self.auth_app.token[:6])
+        self.assertNotIn("token", [field.name for field in AuthorisedApp._meta.get_fields()])
+        user, auth_data = self.authenticate(self.auth_app.token)
+        self.assertEqual(user, self.user)
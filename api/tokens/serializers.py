@@ -11,7 +11,8 @@ class AuthorisedAppSerializer(ModelSerializer):
     #  al/4-authentication-and-permissions/#associating-snippets-with-users
     #  will not work, as we have a unique constraint for user/name.
     class Meta:
-        fields = ("id", "name", "token", "user")
-        read_only_fields = ("token",)
+        # The token is only returned when it is created, afterwards only its prefix is known
+        fields = ("id", "name", "token", "token_prefix", "user")
+        read_only_fields = ("token", "token_prefix")
         model = AuthorisedApp
         extra_kwargs = {"user": {"required": False}}
@@ -13,14 +13,20 @@ from api.tokens.urls import urlpatterns as urlpatterns_token
 from .auth.views import AccountViewSet
 from .views import (
     ApiRoot,
+    CertificateBulkView,
     CertificateCRLFilesView,
     CertificateFilesView,
     CertificateInfoView,
     CertificateInstanceView,
+    CertificateIssuedFilesView,
+    CertificateJobView,
     CertificateKeyView,
     CertificateListView,
     CertificateRenewView,
+    CertificateSigningRequestView,
+    CertificateUnlockView,
     NotFoundView,
+    OcspResponderView,
 )
 
 
@@ -31,12 +37,23 @@ class CertificateCrlFileView:
 urlpatterns_apiv1 = [
     path("certificates/files/<int:pk>", CertificateFilesView.as_view(), name="certificate-files"),
     path("certificates/<int:pk>/download", CertificateFilesView.as_view(), name="certificate-download"),
+    path(
+        "certificates/<int:pk>/issued/download",
+        CertificateIssuedFilesView.as_view(),
+        name="certificate-issued-download",
+    ),
     path("certificates/<int:pk>/crl", CertificateCRLFilesView.as_view(), name="certificate-crl"),
     path("certificates/<int:pk>/info", CertificateInfoView.as_view(), name="certificate-info"),
     path("certificates/<int:pk>/key", CertificateKeyView.as_view(), name="certificate-key"),
     path("certificates/<int:pk>/renew", CertificateRenewView.as_view(), name="certificate-renew"),
+    path("certificates/<int:pk>/unlock", CertificateUnlockView.as_view(), name="certificate-unlock"),
     path("certificates/<int:pk>", CertificateInstanceView.as_view(), name="certificate-instance"),
+    path("certificates/bulk", CertificateBulkView.as_view(), name="certificates-bulk"),
+    path("certificates/csr", CertificateSigningRequestView.as_view(), name="certificates-csr"),
     path("certificates", CertificateListView.as_view(), name="certificates"),
+    path("jobs/<uuid:pk>", CertificateJobView.as_view(), name="certificate-job"),
+    path("ocsp", OcspResponderView.as_view(), name="ocsp"),
+    path("ocsp/<path:encoded_request>", OcspResponderView.as_view(), name="ocsp-get"),
     path("auth/", include(urlpatterns_token)),
     path("auth/", include(urlpatterns_rest_auth)),
     path(
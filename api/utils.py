@@ -1,7 +1,55 @@
+import hashlib
+import io
 import random
 import string
+import zipfile
 
 
 def new_token(length=44):
     r = random.SystemRandom()
     return "".join(r.choice(string.ascii_uppercase + string.ascii_lowercase + string.digits) for i in range(length))
+
+
+def token_digest(token):
+    """
+    Fixed length digest of a token, used to look up and cache the token without handling the secret itself
+
+    Arguments: token - The token
+    Returns:   Hex encoded SHA256 digest of the token
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, unseekable file object, which collects the written data until it is read"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def read_written(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files):
+    """
+    Create a zip file as a stream, the files are read and compressed one by one
+
+    Arguments: files - Iterable with tuples of filename and content
+    Returns:   Generator with the bytes of the zip file
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w") as f:
+        for filename, content in files:
+            f.writestr(filename, content)
+            yield stream.read_written()
+    yield stream.read_written()
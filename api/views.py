@@ -1,20 +1,37 @@
 """API Views for certificate generation"""
 
-import io
+import base64
+import binascii
+import hashlib
+import json
 import logging
 import re
-import zipfile
 
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509 import ocsp
 from django.conf import settings
 from django.core.exceptions import ValidationError as InternalValidationError
-from django.http import Http404, HttpResponse
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.urls import NoReverseMatch, URLResolver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
 from django.utils.http import http_date
-from django_property_filter import PropertyBooleanFilter, PropertyFilterSet
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django_filters import BooleanFilter, FilterSet
 from rest_framework import permissions, status
-from rest_framework.exceptions import ValidationError
-from rest_framework.generics import ListCreateAPIView, RetrieveDestroyAPIView, UpdateAPIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.generics import (
+    CreateAPIView,
+    ListCreateAPIView,
+    RetrieveAPIView,
+    RetrieveDestroyAPIView,
+    UpdateAPIView,
+)
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.settings import api_settings
@@ -23,12 +40,29 @@ from rest_framework.views import APIView
 from api.authentication import AppTokenAuthentication
 from api.mixins import TrapDjangoValidationErrorCreateMixin
 from api.serializers import (
+    CertificateBulkSerializer,
+    CertificateDownloadSerializer,
+    CertificateJobSerializer,
     CertificateRenewSerializer,
     CertificateRevokeSerializer,
     CertificateSerializer,
+    CertificateSigningRequestSerializer,
+    CertificateUnlockSerializer,
     CrlRenewSerializer,
 )
-from x509_pki.models import Certificate, CertificateTypes, KeyStore
+from api.utils import stream_zip
+from certificate_engine.ssl.certificate import PassPhraseError
+from certificate_engine.ssl.ocsp import load_ocsp_request, ocsp_error_response
+from certificate_engine.ssl.signing_daemon import UNAVAILABLE, UNKNOWN_KEY, SigningError
+from vuetifyforms.views import vue_exception_handler
+from x509_pki.models import (
+    Certificate,
+    CertificateJob,
+    CertificateTypes,
+    KeyStore,
+    get_delta_crl_url,
+    get_ocsp_response,
+)
 
 if settings.IS_GENERATE_FRONTEND:
     from api import forms  # make sure vuetifyforms can find the classes
@@ -38,6 +72,40 @@ if settings.IS_GENERATE_FRONTEND:
 
 logger = logging.getLogger(__name__)
 
+CRL_FILENAME_RE = re.compile(r"([^\/]+\.crl(.pem)?)$")
+CRL_EXTENSION_RE = re.compile(r"\.crl(\.pem)?$")
+
+OCSP_MALFORMED_REQUEST = ocsp_error_response(ocsp.OCSPResponseStatus.MALFORMED_REQUEST)
+OCSP_UNAUTHORIZED = ocsp_error_response(ocsp.OCSPResponseStatus.UNAUTHORIZED)
+
+
+class SigningUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Signing service not available, try again later."
+    default_code = "signing_unavailable"
+
+
+class SigningKeyUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Key of the authority not available in the signing service."
+    default_code = "signing_key_unavailable"
+
+
+def exception_handler(exc, context):
+    """
+    Responds with 503 Service Unavailable when the signing daemon can not be reached, or does not hold the key
+    of the authority, as the request can be retried when it is up again or the key has been added.
+
+    Other errors are processed by the vuetifyforms.views.vue_exception_handler
+    """
+    if isinstance(exc, SigningError) and exc.code == UNAVAILABLE:
+        logger.error(f"Signing failed: {exc}")
+        exc = SigningUnavailable()
+    elif isinstance(exc, SigningError) and exc.code == UNKNOWN_KEY:
+        logger.error(f"Signing failed: {exc}")
+        exc = SigningKeyUnavailable()
+    return vue_exception_handler(exc, context)
+
 
 class IsCertificateOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -46,18 +114,141 @@ class IsCertificateOwner(permissions.BasePermission):
         return False
 
 
+class APICursorPagination(CursorPagination):
+    """
+    Cursor pagination in the ordering of the view, the id is added to the ordering as tiebreaker.
+
+    The values of all ordering fields of a row are encoded in the cursor, so rows with the same value of
+    an ordering field, like the name, are neither skipped nor repeated.
+    """
+
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = "-id"
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip("-") in ["id", "pk"] for field in ordering):
+            ordering.append("id")
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        current_position = self.cursor.position if self.cursor else None
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(order[1:] if order.startswith("-") else f"-{order}" for order in ordering)
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self._get_position_filter(ordering, current_position))
+
+        # Positions are unique, so pages never need an offset. The extra row tells if there is a following page.
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_following_position = len(results) > len(self.page)
+        following_position = self._get_position_from_instance(results[-1], self.ordering) if results else None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        # Support orderings on related fields, like dn__commonName
+        values = []
+        for order in ordering:
+            attr = instance
+            for field_name in order.lstrip("-").split("__"):
+                attr = attr[field_name] if isinstance(attr, dict) else getattr(attr, field_name)
+            values.append(None if attr is None else str(attr))
+        return json.dumps(values)
+
+    def _get_position_filter(self, ordering, position):
+        """
+        Filter on the rows following the position in the order of the queryset. NULL values are sorted
+        after all other values, like PostgreSQL does.
+
+        Arguments: ordering - The ordering of the queryset
+                   position - The encoded values of the ordering fields of the last row of the previous page
+        Returns:   Q object with the filter
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        position_filter = Q(pk__in=[])
+        equal = Q()
+        for order, value in zip(ordering, values):
+            field = order.lstrip("-")
+            if order.startswith("-"):
+                following = Q(**{f"{field}__isnull": False}) if value is None else Q(**{f"{field}__lt": value})
+            else:
+                following = (
+                    Q(pk__in=[]) if value is None else Q(**{f"{field}__gt": value}) | Q(**{f"{field}__isnull": True})
+                )
+            position_filter |= equal & following
+            equal &= Q(**{f"{field}__isnull": True}) if value is None else Q(**{field: value})
+        return position_filter
+
+
 class APIPageNumberPagination(PageNumberPagination):
+    """
+    Page number pagination, which switches to cursor pagination with ?pagination=cursor
+
+    Cursor pagination doesn't count the rows and doesn't use an offset, it continues after the last row
+    of the previous page in the order of the view. Use it to walk through large lists.
+    """
+
     page_size_query_param = "page_size"
+    pagination_query_param = "pagination"
+    cursor_pagination_class = APICursorPagination
+
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.pagination_query_param) == "cursor":
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
 
 
-class CertificateFilterSet(PropertyFilterSet):
+class CertificateFilterSet(FilterSet):
+    # Requires a queryset annotated by Certificate.objects.with_status()
+    revoked = BooleanFilter(field_name="is_revoked")
+    expired = BooleanFilter(field_name="is_expired")
+
     class Meta:
         model = Certificate
         exclude = ["revoked_uuid"]
-        property_fields = [
-            ("revoked", PropertyBooleanFilter, ["exact"]),
-            ("expired", PropertyBooleanFilter, ["exact"]),
-        ]
 
 
 class NotFoundView(APIView):
@@ -82,7 +273,66 @@ class CertificateListView(TrapDjangoValidationErrorCreateMixin, ListCreateAPIVie
         for the currently authenticated user.
         """
         user = self.request.user
-        return Certificate.objects.filter(owner=user)
+        return (
+            Certificate.objects.filter(owner=user)
+            .with_status()
+            .select_related("dn", "keystore")
+            .defer("keystore__key", "keystore__crt", "keystore__p12", "keystore__p12_legacy")
+        )
+
+    def create(self, request, *args, **kwargs):
+        """
+        Create a certificate, with ?async=true the key and certificate are generated by the certificate
+        worker and the pending job is returned
+        """
+        if not (settings.CERTIFICATE_ASYNC_ENABLED and request.query_params.get("async") in ["1", "true"]):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer, generate_async=True)
+        job = serializer.instance.job
+        headers = {"Location": reverse("certificate-job", kwargs={"pk": job.pk}, request=request)}
+        return Response(CertificateJobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+
+class CertificateJobView(RetrieveAPIView):
+    model = CertificateJob
+    serializer_class = CertificateJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return CertificateJob.objects.filter(owner=self.request.user).select_related(
+            "certificate__dn", "certificate__keystore"
+        )
+
+
+class CertificateBulkView(TrapDjangoValidationErrorCreateMixin, CreateAPIView):
+    model = Certificate
+    serializer_class = CertificateBulkSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        result_serializer = CertificateSerializer(serializer.instance, many=True)
+        return Response(result_serializer.data, status=status.HTTP_201_CREATED)
+
+
+class CertificateSigningRequestView(TrapDjangoValidationErrorCreateMixin, CreateAPIView):
+    model = Certificate
+    serializer_class = CertificateSigningRequestSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        """
+        Issue a certificate for a PKCS#10 certificate signing request, the private key is kept by the requester
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        result_serializer = CertificateSerializer(serializer.instance)
+        return Response(result_serializer.data, status=status.HTTP_201_CREATED)
 
 
 class CertificateInstanceView(RetrieveDestroyAPIView):
@@ -135,6 +385,31 @@ class CertificateRenewView(UpdateAPIView):
             raise ValidationError(e.message)
 
 
+class CertificateUnlockView(UpdateAPIView):
+    model = Certificate
+    serializer_class = CertificateUnlockSerializer
+    queryset = Certificate.objects.all()
+    permission_classes = [permissions.IsAuthenticated, IsCertificateOwner]
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop("partial", False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        try:
+            instance.unlock(serializer.validated_data["passphrase_in"], serializer.validated_data["minutes"])
+        except PassPhraseError:
+            raise ValidationError({"passphrase_in": "Passphrase incorrect. Not allowed to unlock your certificate"})
+        except InternalValidationError as e:
+            raise ValidationError(e.message)
+        return Response(self.get_serializer(instance).data)
+
+    def delete(self, request, *args, **kwargs):
+        instance = self.get_object()
+        instance.lock()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class CertificateInfoView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -163,6 +438,8 @@ class CertificateKeyView(APIView):
         if not hasattr(cert, "keystore"):
             raise Http404("Certificate has no keystore, generation of key object went wrong")
         key = cert.keystore.key
+        if not key:
+            raise Http404("Certificate has no key, the key is held by the requester of the certificate")
         return Response({"text": key})
 
 
@@ -202,13 +479,12 @@ class FileView(APIView):
 
     @staticmethod
     def get_cert_keystore(cert):
-        if not hasattr(cert, "keystore") or not cert.keystore.crt or not cert.keystore.key:
-            raise KeyStore.DoesNotExist("Certificate has no cert/key, " "something went wrong during generation")
+        # The key is empty when it is held by the requester of the certificate
+        if not hasattr(cert, "keystore") or not cert.keystore.crt:
+            raise KeyStore.DoesNotExist("Certificate has no cert, " "something went wrong during generation")
         return {
             "crt": cert.keystore.crt,
             "key": cert.keystore.key,
-            "p12": cert.keystore.p12,
-            "p12_legacy": cert.keystore.p12_legacy,
         }
 
     @staticmethod
@@ -219,6 +495,22 @@ class FileView(APIView):
 
 
 class CertificateFilesView(FileView):
+    labels = {
+        CertificateTypes.ROOT: "root",
+        CertificateTypes.INTERMEDIATE: "intermediate-chain",
+        CertificateTypes.SERVER_CERT: "server_cert",
+        CertificateTypes.CLIENT_CERT: "client_cert",
+        CertificateTypes.CODE_SIGNING_CERT: "code_signing_cert",
+        CertificateTypes.OCSP: "ocsp_cert",
+    }
+
+    @staticmethod
+    def _get_queryset(user):
+        # A chain is at most a leaf, intermediate and root certificate, fetch it in one query
+        return Certificate.objects.filter(owner=user).select_related(
+            "keystore", "parent__keystore", "parent__parent__keystore"
+        )
+
     @classmethod
     def _get_cert_chain(cls, cert):
         return [cert] + cls._get_cert_chain(cert.parent) if cert.parent else [cert]
@@ -228,62 +520,94 @@ class CertificateFilesView(FileView):
         return cert.name.replace(" ", "_")
 
     @classmethod
-    def make_certificate_zip(cls, cert):
-        cert_chain = cls._get_cert_chain(cert)
+    def _get_chain_keystores(cls, cert):
         cert_chain_cert_keys = []
-        for _cert in cert_chain:
+        for _cert in cls._get_cert_chain(cert):
             try:
                 cert_chain_cert_keys.append(cls.get_cert_keystore(_cert))
             except KeyStore.DoesNotExist:
                 raise RuntimeError(
                     f"Certificate ({_cert}) has no keystore, " f"generation of certificate object went wrong"
                 )
+        return cert_chain_cert_keys
 
-        root_cert_file_content = cert_chain_cert_keys[-1]["crt"]
-        intermediate_cert_file_content = cert_chain_cert_keys[1]["crt"]
-
-        cert_chain_file_content = "".join([cert_key["crt"] for cert_key in cert_chain_cert_keys])
-        cert_file_content = cert_chain_cert_keys[0]["crt"]
-        key_file_content = cert_chain_cert_keys[0]["key"]
-        p12_file_content = cert_chain_cert_keys[0]["p12"]
-        p12_legacy_file_content = cert_chain_cert_keys[0]["p12_legacy"]
-
-        zipped_file = io.BytesIO()
-        with zipfile.ZipFile(zipped_file, "w") as f:
-            filename = cls._get_filename_escape(cert)
-            f.writestr("rootca.pem", root_cert_file_content)
-            f.writestr("intermediate.pem", intermediate_cert_file_content)
-            f.writestr("intermediate_root-chain.pem", intermediate_cert_file_content + root_cert_file_content)
+    @classmethod
+    def get_authority_files(cls, intermediate):
+        """
+        Get the files with the certificates of the intermediate and root authority
 
-            f.writestr(f"{filename}.pem", cert_file_content)
-            f.writestr(f"{filename}-chain.pem", cert_chain_file_content)
-            f.writestr(f"{filename}.key", key_file_content)
+        Arguments: intermediate - The intermediate certificate
+        Returns:   List with tuples of filename and content
+        """
+        cert_chain_cert_keys = cls._get_chain_keystores(intermediate)
+        root_cert_file_content = cert_chain_cert_keys[-1]["crt"]
+        intermediate_cert_file_content = cert_chain_cert_keys[0]["crt"]
+        return [
+            ("rootca.pem", root_cert_file_content),
+            ("intermediate.pem", intermediate_cert_file_content),
+            ("intermediate_root-chain.pem", intermediate_cert_file_content + root_cert_file_content),
+        ]
 
-            if p12_file_content:
-                f.writestr(f"{filename}.p12", p12_file_content)
+    @classmethod
+    def get_leaf_files(cls, cert, passphrase=None, directory=""):
+        """
+        Get the files with the certificate, chain, key and PKCS12 packages of a leaf certificate. The key and
+        PKCS12 packages are left out when the key is held by the requester of the certificate.
+
+        Arguments: cert - The leaf certificate
+                   passphrase - The passphrase of the key, needed to create PKCS12 packages that are not stored yet.
+                                Without it the PKCS12 packages are left out when they can't be created.
+                   directory - Optional directory of the files in the zip file
+        Returns:   List with tuples of filename and content
+        """
+        cert_chain_cert_keys = cls._get_chain_keystores(cert)
+        key = cert_chain_cert_keys[0]["key"]
+        p12_file_content, p12_legacy_file_content = None, None
+        if key:
+            try:
+                p12_file_content, p12_legacy_file_content = cert.keystore.get_pkcs12(passphrase)
+            except PassPhraseError:
+                if passphrase is not None:
+                    raise
+
+        filename = f"{directory}{cls._get_filename_escape(cert)}"
+        files = [
+            (f"{filename}.pem", cert_chain_cert_keys[0]["crt"]),
+            (f"{filename}-chain.pem", "".join([cert_key["crt"] for cert_key in cert_chain_cert_keys])),
+        ]
+        if key:
+            files.append((f"{filename}.key", key))
+        if p12_file_content:
+            files.append((f"{filename}.p12", p12_file_content))
+        if p12_legacy_file_content:
+            files.append((f"{filename}.legacy.p12", p12_legacy_file_content))
+        return files
 
-            if p12_legacy_file_content:
-                f.writestr(f"{filename}.legacy.p12", p12_legacy_file_content)
+    @classmethod
+    def make_certificate_zip(cls, cert, passphrase=None):
+        """
+        Zip the certificate with its chain, key and PKCS12 packages
 
-        zipped_file.seek(0)
-        return zipped_file
+        Arguments: cert - The leaf certificate
+                   passphrase - The passphrase of the key, needed to create PKCS12 packages that are not stored yet
+        Returns:   Generator with the bytes of the zip file
+        """
+        # Collect the files before streaming, so errors are raised before the response starts
+        files = cls.get_authority_files(cert.parent) + cls.get_leaf_files(cert, passphrase)
+        return stream_zip(files)
 
     @staticmethod
     def _make_file_response(content, filename):
-        response = HttpResponse(content, content_type="application/octet-stream")
+        if isinstance(content, (str, bytes)):
+            response = HttpResponse(content, content_type="application/octet-stream")
+        else:
+            response = StreamingHttpResponse(content, content_type="application/octet-stream")
         response["Content-Disposition"] = f"attachment; filename={filename}"
         response["Access-Control-Expose-Headers"] = "Content-Disposition"
         return response
 
-    def _make_certificate_content(self, cert):
-        label = {
-            CertificateTypes.ROOT: "root",
-            CertificateTypes.INTERMEDIATE: "intermediate-chain",
-            CertificateTypes.SERVER_CERT: "server_cert",
-            CertificateTypes.CLIENT_CERT: "client_cert",
-            CertificateTypes.CODE_SIGNING_CERT: "code_signing_cert",
-            CertificateTypes.OCSP: "ocsp_cert",
-        }[cert.type]
+    def _make_certificate_content(self, cert, passphrase=None):
+        label = self.labels[cert.type]
 
         if cert.type is CertificateTypes.ROOT:
             try:
@@ -309,19 +633,66 @@ class CertificateFilesView(FileView):
             CertificateTypes.OCSP,
         ]:
             filename = f"{self._get_filename_escape(cert)}.{label}.zip"
-            return self.make_certificate_zip(cert), filename
+            return self.make_certificate_zip(cert, passphrase), filename
 
         raise NotImplementedError(f"File generation for cert type {cert.type} " f"not implemented")
 
     def get(self, request, pk, *args, **kwargs):
         try:
             user = self.request.user
-            cert = Certificate.objects.get(pk=pk, owner=user)
+            cert = self._get_queryset(user).get(pk=pk)
         except Certificate.DoesNotExist:
             raise Http404("File not found")
         content, filename = self._make_certificate_content(cert)
         return self._make_file_response(content, filename)
 
+    def post(self, request, pk, *args, **kwargs):
+        """
+        Download the certificate files, including PKCS12 packages created with the provided passphrase of the key
+        """
+        try:
+            user = self.request.user
+            cert = self._get_queryset(user).get(pk=pk)
+        except Certificate.DoesNotExist:
+            raise Http404("File not found")
+        serializer = CertificateDownloadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            content, filename = self._make_certificate_content(cert, serializer.validated_data["passphrase_in"])
+        except PassPhraseError:
+            raise ValidationError({"passphrase_in": "Passphrase incorrect. Not allowed to download your certificate"})
+        return self._make_file_response(content, filename)
+
+
+class CertificateIssuedFilesView(CertificateFilesView):
+    def get(self, request, pk, *args, **kwargs):
+        """
+        Download the files of all valid certificates issued by an intermediate certificate as one zip file.
+        The zip file is streamed, certificates are read from the database in chunks while it is written.
+        """
+        try:
+            user = self.request.user
+            issuer = self._get_queryset(user).get(pk=pk)
+        except Certificate.DoesNotExist:
+            raise Http404("File not found")
+        if issuer.type != CertificateTypes.INTERMEDIATE:
+            raise ValidationError("Only the certificates issued by an intermediate certificate can be downloaded")
+
+        certificates = (
+            Certificate.objects.filter(parent=issuer, revoked_at__isnull=True, keystore__isnull=False)
+            .select_related("keystore")
+            .order_by("id")
+        )
+
+        def files():
+            yield from self.get_authority_files(issuer)
+            for cert in certificates.iterator(chunk_size=100):
+                cert.parent = issuer
+                directory = f"{self._get_filename_escape(cert)}.{self.labels[cert.type]}/"
+                yield from self.get_leaf_files(cert, directory=directory)
+
+        return self._make_file_response(stream_zip(files()), f"{self._get_filename_escape(issuer)}.issued.zip")
+
 
 class CertificateCRLFilesView(FileView, UpdateAPIView):
     authentication_classes = [AppTokenAuthentication] + api_settings.DEFAULT_AUTHENTICATION_CLASSES
@@ -330,35 +701,84 @@ class CertificateCRLFilesView(FileView, UpdateAPIView):
     queryset = Certificate.objects.all()
     model = Certificate
 
-    def get(self, request, pk, *args, **kwargs):
-        cert = Certificate.objects.get(pk=pk)
-        user = self.request.user
-        if cert.owner.id is not user.id:
+    def _get_authority(self, pk):
+        try:
+            cert = Certificate.objects.select_related("crlstore").get(pk=pk, owner=self.request.user)
+        except Certificate.DoesNotExist:
             raise Http404("Certificate not found")
-        if cert.type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
-            if not cert.crl_distribution_url:
-                raise Http404("CRL Distribution is not enabled, " "no crl distribution url")
+        if cert.type not in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
+            raise ValidationError("CRL can only be generated for Root or Intermediate certificates")
+        if not cert.crl_distribution_url:
+            raise Http404("CRL Distribution is not enabled, " "no crl distribution url")
+        return cert
 
-            try:
-                cert_crlstore = self.get_crlstore(cert)
-            except KeyStore.DoesNotExist:
-                raise Http404("Certificate has no keystore, " "generation of certificate object went wrong")
+    @staticmethod
+    def _get_crl_filename(cert):
+        match = CRL_FILENAME_RE.search(cert.crl_distribution_url)
+        if not match:
+            raise RuntimeError(
+                f"Unexpected wrong format crl distribution url: "
+                f"{cert.crl_distribution_url} should end with "
+                f"<filename>.crl"
+            )
+        return match.group(1)
 
-            matches = re.findall(r"([^\/]+\.crl(.pem)?)$", cert.crl_distribution_url)
-            if not matches:
-                raise RuntimeError(
-                    f"Unexpected wrong format crl distribution url: "
-                    f"{cert.crl_distribution_url} should end with "
-                    f"<filename>.crl"
-                )
-            filename = matches[0][0]
-            response = HttpResponse(cert_crlstore.crl, content_type="application/octet-stream")
-            response["Content-Disposition"] = f"attachment; filename={filename}"
-            response["Last-Modified"] = http_date(cert_crlstore.last_update.timestamp())
-            response["Access-Control-Expose-Headers"] = "Content-Disposition"
-            return response
+    @staticmethod
+    def _get_max_age(crlstore):
+        # Clients should not cache the CRL after its next update
+        max_age = settings.CRL_CACHE_MAX_AGE
+        if crlstore.next_update:
+            max_age = min(max_age, max(int((crlstore.next_update - timezone.now()).total_seconds()), 0))
+        return max_age
+
+    @staticmethod
+    def _make_crl_response(crl, filename, encoding):
+        if encoding == "der":
+            content = x509.load_pem_x509_crl(crl.encode("utf-8")).public_bytes(serialization.Encoding.DER)
+            response = HttpResponse(content, content_type="application/pkix-crl")
+            filename = CRL_EXTENSION_RE.sub(".der.crl", filename)
         else:
-            raise ValidationError("CRL can only be generated for Root or Intermediate certificates")
+            response = HttpResponse(crl, content_type="application/octet-stream")
+        response["Content-Disposition"] = f"attachment; filename={filename}"
+        response["Access-Control-Expose-Headers"] = "Content-Disposition"
+        return response
+
+    def get(self, request, pk, *args, **kwargs):
+        """
+        Download the CRL of an authority, as PEM or with ?encoding=der as DER. With ?delta=1 the delta CRL is returned.
+        Supports conditional requests with If-None-Match and If-Modified-Since.
+        """
+        cert = self._get_authority(pk)
+        try:
+            cert_crlstore = self.get_crlstore(cert)
+        except KeyStore.DoesNotExist:
+            raise Http404("Certificate has no keystore, " "generation of certificate object went wrong")
+
+        filename = self._get_crl_filename(cert)
+        crl = cert_crlstore.crl
+        # Delta CRLs do not change the complete CRL, which keeps the date at which it has been generated
+        modified_at = cert_crlstore.base_update or cert_crlstore.last_update
+        if request.query_params.get("delta"):
+            if not cert_crlstore.delta_crl:
+                raise Http404("No delta CRL available")
+            crl = cert_crlstore.delta_crl
+            modified_at = cert_crlstore.last_update
+            filename = get_delta_crl_url(filename)
+        encoding = request.query_params.get("encoding", "pem").lower()
+        if encoding not in ["pem", "der"]:
+            raise ValidationError({"encoding": "Encoding should be pem or der"})
+
+        etag = f'"{hashlib.sha256(crl.encode("utf-8")).hexdigest()[:32]}-{encoding}"'
+        last_modified = int(modified_at.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self._make_crl_response(crl, filename, encoding)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, private=True, max_age=self._get_max_age(cert_crlstore))
+        patch_vary_headers(response, ["Authorization", "X-Auth-Token", "X-User-Auth-Token", "Cookie"])
+        return response
 
     def update(self, request, *args, **kwargs):
         user = self.request.user
@@ -378,3 +798,52 @@ class CertificateCRLFilesView(FileView, UpdateAPIView):
             return instance.renew_revocation_list()
         except InternalValidationError as e:
             raise ValidationError(e.message)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class OcspResponderView(View):
+    """
+    OCSP responder (RFC 6960 and the lightweight profile of RFC 5019), answering with the responses
+    signed in advance, so no key is decrypted while handling a request
+    """
+
+    http_method_names = ["get", "post"]
+
+    def get(self, request, encoded_request="", *args, **kwargs):
+        try:
+            data = base64.b64decode(encoded_request, validate=True)
+        except binascii.Error:
+            return self._make_ocsp_response(OCSP_MALFORMED_REQUEST)
+        return self._respond(data, cacheable=True)
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type != "application/ocsp-request":
+            return self._make_ocsp_response(OCSP_MALFORMED_REQUEST)
+        return self._respond(request.body, cacheable=False)
+
+    @staticmethod
+    def _make_ocsp_response(content):
+        return HttpResponse(content, content_type="application/ocsp-response")
+
+    def _respond(self, data, cacheable):
+        ocsp_request = load_ocsp_request(data)
+        if ocsp_request is None:
+            return self._make_ocsp_response(OCSP_MALFORMED_REQUEST)
+        entry = get_ocsp_response(ocsp_request.serial_number)
+        # Responses are signed for SHA1 certificate ids, as required by RFC 5019
+        if (
+            entry is None
+            or not isinstance(ocsp_request.hash_algorithm, hashes.SHA1)
+            or ocsp_request.issuer_key_hash != entry[0]
+        ):
+            return self._make_ocsp_response(OCSP_UNAUTHORIZED)
+
+        _, content, this_update, next_update = entry
+        response = self._make_ocsp_response(content)
+        if cacheable:
+            max_age = max(int((next_update - timezone.now()).total_seconds()), 0)
+            response["ETag"] = f'"{hashlib.sha1(content, usedforsecurity=False).hexdigest()}"'
+            response["Last-Modified"] = http_date(this_update.timestamp())
+            response["Expires"] = http_date(next_update.timestamp())
+            patch_cache_control(response, public=True, no_transform=True, must_revalidate=True, max_age=max_age)
+        return response
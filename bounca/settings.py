@@ -32,12 +32,81 @@ DEBUG = SERVICES["django"]["debug"]
 
 KEY_ALGORITHM = SERVICES["certificate-engine"]["key_algorithm"].lower()
 
-# Nr of days in the future the CRL list will expire
-CRL_UPDATE_DAYS_FUTURE = 365
-
-if KEY_ALGORITHM not in ["ed25519", "rsa"]:
+# Nr of pre-generated keys kept ready per key type, 0 disables the key pool
+KEY_POOL_SIZE = int(SERVICES["certificate-engine"].get("key_pool_size", 0))
+# Nr of worker processes generating keys for the key pool, 0 uses the number of CPUs
+KEY_POOL_WORKERS = int(SERVICES["certificate-engine"].get("key_pool_workers", 0)) or None
+
+# Max nr of minutes the decrypted key of an authority can be kept in memory after unlocking, 0 disables unlocking
+KEY_UNLOCK_MAX_MINUTES = int(SERVICES["certificate-engine"].get("key_unlock_max_minutes", 0))
+# Nr of minutes an unused unlocked key stays in memory, it is decrypted again on its next use, 0 disables unlocking
+KEY_UNLOCK_IDLE_MINUTES = int(SERVICES["certificate-engine"].get("key_unlock_idle_minutes", 15))
+
+# Max nr of parsed certificates kept in memory, mostly the authority certificates, 0 disables the cache
+CERTIFICATE_CACHE_SIZE = int(SERVICES["certificate-engine"].get("certificate_cache_size", 256))
+
+# Nr of days in the future the CRL list will expire, fractions can be used for short-lived CRLs
+CRL_UPDATE_DAYS_FUTURE = float(SERVICES["certificate-engine"].get("crl_update_days_future", 365))
+
+# Max nr of seconds clients may cache a downloaded CRL, limited by the next update of the CRL
+CRL_CACHE_MAX_AGE = int(SERVICES["certificate-engine"].get("crl_cache_max_age", 300))
+
+# Directory to which the CRLs are written on every update, so they can be served as static files. The path of the
+# CRL distribution url is used as path within this directory.
+CRL_EXPORT_DIR = SERVICES["certificate-engine"].get("crl_export_dir")
+
+# Nr of hours a signed OCSP response is valid
+OCSP_RESPONSE_VALIDITY_HOURS = int(SERVICES["certificate-engine"].get("ocsp_response_validity_hours", 24))
+# OCSP responses which expire within this nr of hours are signed again by the ocsp_responses command
+OCSP_REFRESH_HOURS = int(SERVICES["certificate-engine"].get("ocsp_refresh_hours", 12))
+# Nr of seconds an OCSP response is kept in the cache of the OCSP responder
+OCSP_CACHE_SECONDS = int(SERVICES["certificate-engine"].get("ocsp_cache_seconds", 60))
+
+# Maximum number of certificates issued in one bulk request
+CERTIFICATE_BULK_MAX_SIZE = int(SERVICES["certificate-engine"].get("certificate_bulk_max_size", 1000))
+
+# Create the PKCS12 packages of client and server certificates at issuance (eager), or when they are downloaded
+# with the passphrase of the key (lazy)
+PKCS12_GENERATION = SERVICES["certificate-engine"].get("pkcs12_generation", "eager").lower()
+# Store the PKCS12 packages created on download, so they are only created once
+PKCS12_CACHE = bool(SERVICES["certificate-engine"].get("pkcs12_cache", True))
+
+# Publish delta CRLs on revocation, the complete CRL is only regenerated on renewal of the CRL
+CRL_DELTA_ENABLED = bool(SERVICES["certificate-engine"].get("crl_delta", False))
+
+# Generate certificates requested with ?async=true in the certificate_worker processes
+CERTIFICATE_ASYNC_ENABLED = bool(SERVICES["certificate-engine"].get("async_issuance", False))
+# Nr of minutes after which a running certificate job is considered abandoned by its worker and failed
+CERTIFICATE_JOB_TIMEOUT_MINUTES = int(SERVICES["certificate-engine"].get("async_job_timeout_minutes", 10))
+
+# Unix socket of the signing daemon, which holds the keys of the authorities and signs certificates and CRLs.
+# Signing is done in the application processes when not set.
+SIGNING_SOCKET = SERVICES["certificate-engine"].get("signing_socket")
+
+# Backend holding the keys of the authorities: the encrypted keys in the database (pem), or a software token which
+# keeps the keys imported with the soft_token_import command decrypted per process (soft_token)
+SIGNER_BACKEND = SERVICES["certificate-engine"].get("signer", "pem").lower()
+SOFT_TOKEN_DIR = SERVICES["certificate-engine"].get("soft_token_dir")
+SOFT_TOKEN_PIN = SERVICES["certificate-engine"].get("soft_token_pin")
+
+if KEY_ALGORITHM not in ["ecdsa", "ed25519", "rsa"]:
     raise ValueError(f"Key algorithm {KEY_ALGORITHM} not supported")
 
+if PKCS12_GENERATION not in ["eager", "lazy"]:
+    raise ValueError(f"PKCS12 generation {PKCS12_GENERATION} not supported")
+
+if KEY_UNLOCK_MAX_MINUTES < 0 or KEY_UNLOCK_IDLE_MINUTES < 0:
+    raise ValueError("key_unlock_max_minutes and key_unlock_idle_minutes should not be negative")
+
+if CERTIFICATE_JOB_TIMEOUT_MINUTES <= 0:
+    raise ValueError("async_job_timeout_minutes should be positive")
+
+if SIGNER_BACKEND not in ["pem", "soft_token"]:
+    raise ValueError(f"Signer {SIGNER_BACKEND} not supported")
+
+if SIGNER_BACKEND == "soft_token" and not (SOFT_TOKEN_DIR and SOFT_TOKEN_PIN):
+    raise ValueError("Signer soft_token requires soft_token_dir and soft_token_pin")
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql_psycopg2",
@@ -104,7 +173,6 @@ INSTALLED_APPS = [
     "rest_framework.authtoken",
     "corsheaders",
     "django_filters",
-    "django_property_filter",
     "django_countries",
     "drf_yasg",
     "dj_rest_auth",
@@ -145,7 +213,7 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PARSER_CLASSES": ["rest_framework.parsers.JSONParser"],
-    "EXCEPTION_HANDLER": "vuetifyforms.views.vue_exception_handler",
+    "EXCEPTION_HANDLER": "api.views.exception_handler",
 }
 
 REST_AUTH_SERIALIZERS = {
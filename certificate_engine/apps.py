@@ -1,7 +1,17 @@
 """App name"""
 
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CertificateEngineConfig(AppConfig):
     name = "certificate_engine"
+
+    def ready(self):
+        from certificate_engine.ssl.certificate_cache import certificate_cache
+        from certificate_engine.ssl.key import Key
+        from certificate_engine.ssl.key_pool import KeyPool
+
+        certificate_cache.resize(getattr(settings, "CERTIFICATE_CACHE_SIZE", certificate_cache.size))
+        if getattr(settings, "KEY_POOL_SIZE", 0) > 0:
+            Key.pool = KeyPool(settings.KEY_POOL_SIZE, max_workers=getattr(settings, "KEY_POOL_WORKERS", None))
@@ -1,15 +1,14 @@
 from __future__ import annotations
 
-import copy
 import datetime
 import ipaddress
-from typing import TYPE_CHECKING, List, Optional
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union
 
 import arrow
 from cryptography import x509
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import ed448, ed25519
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.types import CertificatePublicKeyTypes
 from cryptography.x509 import DirectoryName, GeneralName
 
 # noinspection PyProtectedMember,PyUnresolvedReferences
@@ -18,7 +17,9 @@ from cryptography.x509.extensions import _key_identifier_from_public_key
 # noinspection PyUnresolvedReferences
 from cryptography.x509.oid import AuthorityInformationAccessOID, ExtendedKeyUsageOID, NameOID
 
+from certificate_engine.ssl.certificate_cache import certificate_cache
 from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.signer import Signer, as_signer
 from certificate_engine.types import (
     CertificateBasePolicy,
     CertificateIntermediatePolicy,
@@ -29,7 +30,6 @@ from certificate_engine.types import (
 
 if TYPE_CHECKING:
     from x509_pki.models import Certificate as CertificateType
-    from x509_pki.models import DistinguishedName
     from x509_pki.models import DistinguishedName as DistinguishedNameType
 else:
     CertificateType = object
@@ -54,10 +54,62 @@ class CertificateError(ValueError):
     pass
 
 
+@dataclass(frozen=True)
+class PolicyRequest(object):
+    """
+    Immutable description of a certificate request, with the data the policies are checked against.
+
+    type - The type of the certificate
+    dn - Tuple with the (name, value) pairs of the distinguished name attributes
+    issuers - Tuple with the loaded certificates of the issuers, starting with the parent
+    """
+
+    type: str
+    dn: Tuple[Tuple[str, Any], ...]
+    issuers: Tuple[x509.Certificate, ...] = ()
+
+    def get(self, attr: str) -> Any:
+        for name, value in self.dn:
+            if name == attr:
+                return value
+        return None
+
+    @classmethod
+    def from_certificate(cls, cert: CertificateType, load: Callable[[str], x509.Certificate]) -> PolicyRequest:
+        """
+        Build the descriptor of a certificate request
+
+        Arguments: cert - The certificate request
+                   load - Function to load the pem of an issuer certificate
+        Returns:   The policy request
+        """
+        dn = []
+        for name, _ in CertificateBasePolicy.fields_dn + [("subjectAltNames", None)]:
+            value = getattr(cert.dn, name)
+            if name == "countryName" and value:
+                value = value.code
+            elif name == "subjectAltNames" and value is not None:
+                value = tuple(value)
+            dn.append((name, value))
+
+        issuers = []
+        parent = cert.parent
+        while parent:
+            if not parent.keystore.crt:
+                raise RuntimeError("Parent certificate object has not been set")
+            issuers.append(load(parent.keystore.crt))
+            parent = parent.parent
+        return cls(type=cert.type, dn=tuple(dn), issuers=tuple(issuers))
+
+
 class Certificate(object):
     _certificate: Optional[x509.Certificate] = None
     _builder: x509.CertificateBuilder
 
+    def __init__(self):
+        # Issuer certificates parsed while handling a request
+        self._parsed_certificates: Dict[str, x509.Certificate] = {}
+
     @property
     def certificate(self):
         if self._certificate is None:
@@ -65,7 +117,7 @@ class Certificate(object):
         return self._certificate
 
     @staticmethod
-    def _get_certificate_policy(cert: CertificateType) -> CertificateBasePolicy:
+    def _get_certificate_policy(cert: Union[CertificateType, PolicyRequest]) -> CertificateBasePolicy:
         return (
             CertificateRootPolicy()
             if cert.type == CertificateTypes.ROOT
@@ -88,26 +140,15 @@ class Certificate(object):
         return x509.Name(attributes)
 
     @staticmethod
-    def _check_common_name(cert: CertificateType, common_name: str):
-        if not cert.parent:
-            return
-        parent_crt = Certificate().load(cert.parent.keystore.crt).certificate
-        if parent_crt.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == common_name:
-            raise PolicyError("CommonName '{}' should not be equal to common name of parent".format(common_name))
-        Certificate._check_common_name(cert.parent, common_name)
-
-    @staticmethod
-    def _check_policies_optional(dn: DistinguishedName, cp: CertificateBasePolicy):
-        attributes = [attr for attr in cp.policy["optional"] + cp.policy["supplied"] + cp.policy["match"]]
-        for key in list(dn.__dict__):
-            if not key.startswith("_") and key not in attributes:
-                setattr(dn, key, None)
+    def _check_common_name(request: PolicyRequest, common_name: str):
+        for issuer_crt in request.issuers:
+            if issuer_crt.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == common_name:
+                raise PolicyError("CommonName '{}' should not be equal to common name of parent".format(common_name))
 
     @staticmethod
-    def _check_policies_supplied(dn: DistinguishedName, cp: CertificateBasePolicy):
-        # noinspection PyUnresolvedReferences
+    def _check_policies_supplied(request: PolicyRequest, cp: CertificateBasePolicy):
         for attr in cp.policy["supplied"]:
-            if not getattr(dn, attr):
+            if not request.get(attr):
                 raise PolicyError({f"dn__{attr}": f"Attribute '{attr}' is required by policy"})
 
     @staticmethod
@@ -118,30 +159,26 @@ class Certificate(object):
         raise ValueError(f"Attribute {attr} not found in certificate policy fields")
 
     @staticmethod
-    def _check_policies(cert: CertificateType):
-        dn = cert.dn
-        cp = Certificate._get_certificate_policy(cert)
-        Certificate._check_policies_optional(dn, cp)
-        Certificate._check_policies_supplied(dn, cp)
+    def _check_policies(request: PolicyRequest):
+        cp = Certificate._get_certificate_policy(request)
+        Certificate._check_policies_supplied(request, cp)
         if cp.policy["match"]:
-            if not cert.parent:
+            if not request.issuers:
                 raise RuntimeError("Parent certificate is required")
-            if not cert.parent.keystore.crt:
-                raise RuntimeError("Parent certificate object has not been set")
-            parent_crt = Certificate().load(cert.parent.keystore.crt).certificate
+            parent_crt = request.issuers[0]
             for attr in cp.policy["match"]:
                 x509_attr = Certificate._lookup_x509_attr(attr, cp)
-                if not parent_crt.subject.get_attributes_for_oid(x509_attr):
+                parent_attributes = parent_crt.subject.get_attributes_for_oid(x509_attr)
+                if not parent_attributes:
                     raise PolicyError("Attribute '{}' is not provided by parent".format(attr))
 
-                if parent_crt.subject.get_attributes_for_oid(x509_attr)[0].value != getattr(dn, attr):
+                parent_value = str(parent_attributes[0].value)
+                if parent_value != request.get(attr):
                     raise PolicyError(
                         "Certificate should match field '{}' "
-                        "(issuer certificate: {}, certificate: {})".format(
-                            attr, parent_crt.subject.get_attributes_for_oid(x509_attr)[0].value, getattr(dn, attr)
-                        )
+                        "(issuer certificate: {}, certificate: {})".format(attr, parent_value, request.get(attr))
                     )
-        Certificate._check_common_name(cert, getattr(dn, "commonName"))
+        Certificate._check_common_name(request, request.get("commonName"))
 
     @staticmethod
     def _check_issuer_provided(cert: CertificateType):
@@ -157,8 +194,8 @@ class Certificate(object):
     def _set_subject_name(self, cert: CertificateType) -> None:
         self._builder = self._builder.subject_name(Certificate.build_subject_names(cert))
 
-    def _set_public_key(self, cert: CertificateType, private_key: Key, issuer_key: Key) -> None:
-        self._builder = self._builder.public_key(private_key.key.public_key())
+    def _set_public_key(self, cert: CertificateType, public_key: CertificatePublicKeyTypes, issuer_key: Signer) -> None:
+        self._builder = self._builder.public_key(public_key)
         ca_issuer_cert_subject = ca_issuer_cert_serial_number = None
         if cert.type not in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
             ca_issuer_cert = cert.parent.parent if cert.parent.parent else cert.parent
@@ -167,14 +204,14 @@ class Certificate(object):
             ca_issuer_cert_serial_number = int(issuer_cert.serial)
         self._builder = self._builder.add_extension(
             x509.AuthorityKeyIdentifier(
-                key_identifier=_key_identifier_from_public_key(issuer_key.key.public_key()),
+                key_identifier=_key_identifier_from_public_key(issuer_key.public_key()),
                 authority_cert_issuer=ca_issuer_cert_subject,
                 authority_cert_serial_number=ca_issuer_cert_serial_number,
             ),
             critical=False,
         )
         self._builder = self._builder.add_extension(
-            x509.SubjectKeyIdentifier.from_public_key(private_key.key.public_key()),
+            x509.SubjectKeyIdentifier.from_public_key(public_key),
             critical=False,
         )
 
@@ -251,34 +288,26 @@ class Certificate(object):
             datetime.datetime(year=cert.expires_at.year, month=cert.expires_at.month, day=cert.expires_at.day)
         )
 
-    def _set_basic(self, cert: CertificateType, private_key: Key, issuer_key: Key) -> None:
+    def _set_basic(self, cert: CertificateType, public_key: CertificatePublicKeyTypes, issuer_key: Signer) -> None:
         self._builder = self._builder.serial_number(int(cert.serial))
         self._set_issuer_name(cert)
         self._set_dates(cert)
         self._set_subject_name(cert)
-        self._set_public_key(cert, private_key, issuer_key)
+        self._set_public_key(cert, public_key, issuer_key)
         self._set_crl_distribution_url(cert)
         self._set_ocsp_distribution_url(cert)
         self._set_basic_constraints(cert)
 
-    def _sign_certificate(self, private_key: Key) -> x509.Certificate:
-        algorithm = (
-            None if isinstance(private_key.key, (ed25519.Ed25519PrivateKey, ed448.Ed448PrivateKey)) else hashes.SHA256()
-        )
-
-        return self._builder.sign(private_key=private_key.key, algorithm=algorithm, backend=default_backend())
-
-    def _create_root_certificate(self, cert: CertificateType, private_key: Key) -> x509.Certificate:
-        Certificate._check_policies(cert)
+    def _build_root_certificate(self, cert: CertificateType, signer: Signer) -> None:
+        self.check_policies(cert)
 
         self._builder = x509.CertificateBuilder()
-        self._set_basic(cert, private_key, private_key)
+        self._set_basic(cert, signer.public_key(), signer)
         self._set_key_usage()
-        return self._sign_certificate(private_key)
 
-    def _create_intermediate_certificate(
-        self, cert: CertificateType, private_key: Key, issuer_key: Key
-    ) -> x509.Certificate:
+    def _build_intermediate_certificate(
+        self, cert: CertificateType, public_key: CertificatePublicKeyTypes, issuer_key: Signer
+    ) -> None:
         if cert.parent and cert.parent.type != CertificateTypes.ROOT:
             raise CertificateError(
                 "Parent is not a root certificate. "
@@ -290,19 +319,20 @@ class Certificate(object):
                 "Multiple levels of intermediate certificates are currently not supported"
             )
 
-        Certificate._check_policies(cert)
+        self.check_policies(cert)
 
         self._builder = x509.CertificateBuilder()
-        self._set_basic(cert, private_key, issuer_key)
+        self._set_basic(cert, public_key, issuer_key)
         self._set_key_usage()
-        return self._sign_certificate(issuer_key)
 
-    def _create_server_certificate(self, cert: CertificateType, private_key: Key, issuer_key: Key) -> x509.Certificate:
+    def _build_server_certificate(
+        self, cert: CertificateType, public_key: CertificatePublicKeyTypes, issuer_key: Signer
+    ) -> None:
         Certificate._check_issuer_provided(cert)
-        Certificate._check_policies(cert)
+        self.check_policies(cert)
 
         self._builder = x509.CertificateBuilder()
-        self._set_basic(cert, private_key, issuer_key)
+        self._set_basic(cert, public_key, issuer_key)
 
         self._builder = self._builder.add_extension(
             x509.KeyUsage(
@@ -345,14 +375,14 @@ class Certificate(object):
                 critical=False,
             )
 
-        return self._sign_certificate(issuer_key)
-
-    def _create_client_certificate(self, cert: CertificateType, private_key: Key, issuer_key: Key) -> x509.Certificate:
+    def _build_client_certificate(
+        self, cert: CertificateType, public_key: CertificatePublicKeyTypes, issuer_key: Signer
+    ) -> None:
         Certificate._check_issuer_provided(cert)
-        Certificate._check_policies(cert)
+        self.check_policies(cert)
 
         self._builder = x509.CertificateBuilder()
-        self._set_basic(cert, private_key, issuer_key)
+        self._set_basic(cert, public_key, issuer_key)
 
         self._builder = self._builder.add_extension(
             x509.KeyUsage(
@@ -389,13 +419,13 @@ class Certificate(object):
                 critical=False,
             )
 
-        return self._sign_certificate(issuer_key)
-
-    def _create_ocsp_certificate(self, cert: CertificateType, private_key: Key, issuer_key: Key) -> x509.Certificate:
+    def _build_ocsp_certificate(
+        self, cert: CertificateType, public_key: CertificatePublicKeyTypes, issuer_key: Signer
+    ) -> None:
         Certificate._check_issuer_provided(cert)
-        Certificate._check_policies(cert)
+        self.check_policies(cert)
         self._builder = x509.CertificateBuilder()
-        self._set_basic(cert, private_key, issuer_key)
+        self._set_basic(cert, public_key, issuer_key)
         self._builder = self._builder.add_extension(
             x509.KeyUsage(
                 digital_signature=True,
@@ -416,15 +446,13 @@ class Certificate(object):
             critical=True,
         )
 
-        return self._sign_certificate(issuer_key)
-
-    def _create_code_signing_certificate(
-        self, cert: CertificateType, private_key: Key, issuer_key: Key
-    ) -> x509.Certificate:
+    def _build_code_signing_certificate(
+        self, cert: CertificateType, public_key: CertificatePublicKeyTypes, issuer_key: Signer
+    ) -> None:
         Certificate._check_issuer_provided(cert)
-        Certificate._check_policies(cert)
+        self.check_policies(cert)
         self._builder = x509.CertificateBuilder()
-        self._set_basic(cert, private_key, issuer_key)
+        self._set_basic(cert, public_key, issuer_key)
         self._builder = self._builder.add_extension(
             x509.KeyUsage(
                 digital_signature=True,
@@ -445,10 +473,28 @@ class Certificate(object):
             critical=True,
         )
 
-        return self._sign_certificate(issuer_key)
+    def load_issuer_certificate(self, pem: str) -> x509.Certificate:
+        """
+        Load the certificate of an issuer, each certificate is parsed once by this handler
 
-    def check_policies(self, cert_request: CertificateType):
-        self._check_policies(copy.deepcopy(cert_request))
+        Arguments: pem - The certificate of the issuer as pem string
+        Returns:   The loaded certificate
+        """
+        crt = self._parsed_certificates.get(pem)
+        if crt is None:
+            crt = certificate_cache.load(pem)
+            self._parsed_certificates[pem] = crt
+        return crt
+
+    def check_policies(self, cert_request: Union[CertificateType, PolicyRequest]):
+        """
+        Check the distinguished name of a certificate request against the policy of its type
+
+        Arguments: cert_request - The certificate request or its policy request descriptor
+        """
+        if not isinstance(cert_request, PolicyRequest):
+            cert_request = PolicyRequest.from_certificate(cert_request, self.load_issuer_certificate)
+        self._check_policies(cert_request)
 
     @staticmethod
     def _get_issuer_key(cert_request, passphrase_issuer):
@@ -460,6 +506,12 @@ class Certificate(object):
             raise PassPhraseError("Bad passphrase, could not decode issuer key")
         return issuer_key
 
+    @staticmethod
+    def _get_issuer(cert_request, passphrase_issuer, issuer_key):
+        if issuer_key is None:
+            issuer_key = Certificate._get_issuer_key(cert_request, passphrase_issuer)
+        return as_signer(issuer_key) if issuer_key is not None else None
+
     @staticmethod
     def _get_key(key, passphrase):
         try:
@@ -467,39 +519,102 @@ class Certificate(object):
         except ValueError:
             raise PassPhraseError("Bad passphrase, could not decode private key")
 
-    def create_certificate(
+    def build_certificate(
         self,
         cert_request: CertificateType,
-        key: str,
+        key: Union[str, Key, CertificatePublicKeyTypes],
         passphrase: Optional[str] = None,
         passphrase_issuer: Optional[str] = None,
-    ) -> Certificate:
+        issuer_key: Optional[Union[Key, Signer]] = None,
+    ) -> Tuple[x509.CertificateBuilder, Signer]:
         """
-        Create a certificate.
+        Build a certificate without signing it.
 
         Arguments: cert_request - The certificate request, containing all the information
+                   key - The key of the certificate (pem string or loaded key), or the public key
+                         when the private key is held by the requester
                    passphrase - The passphrase of the key of the certificate
                    passphrase_issuer - The passphrase of the key of the signing certificate
-        Returns:   The certificate object
+                   issuer_key - Optional already decrypted key or signer of the signing certificate
+        Returns:   Tuple with the builder with all fields of the certificate set and the signer to sign it with
         """
 
-        private_key = self._get_key(key, passphrase)
-        issuer_key = self._get_issuer_key(cert_request, passphrase_issuer)
+        private_key = self._get_key(key, passphrase) if isinstance(key, str) else key
+        public_key = private_key.key.public_key() if isinstance(private_key, Key) else private_key
 
         if cert_request.type == CertificateTypes.ROOT:
-            self._certificate = self._create_root_certificate(cert_request, private_key)
-        elif cert_request.type == CertificateTypes.INTERMEDIATE:
-            self._certificate = self._create_intermediate_certificate(cert_request, private_key, issuer_key)
+            if not isinstance(private_key, Key):
+                raise CertificateError("The private key is required to self-sign a root certificate")
+            signer = as_signer(private_key)
+            self._build_root_certificate(cert_request, signer)
+            return self._builder, signer
+
+        issuer = self._get_issuer(cert_request, passphrase_issuer, issuer_key)
+        if cert_request.type == CertificateTypes.INTERMEDIATE:
+            self._build_intermediate_certificate(cert_request, public_key, issuer)
         elif cert_request.type == CertificateTypes.SERVER_CERT:
-            self._certificate = self._create_server_certificate(cert_request, private_key, issuer_key)
+            self._build_server_certificate(cert_request, public_key, issuer)
         elif cert_request.type == CertificateTypes.CLIENT_CERT:
-            self._certificate = self._create_client_certificate(cert_request, private_key, issuer_key)
+            self._build_client_certificate(cert_request, public_key, issuer)
         elif cert_request.type == CertificateTypes.CODE_SIGNING_CERT:
-            self._certificate = self._create_code_signing_certificate(cert_request, private_key, issuer_key)
+            self._build_code_signing_certificate(cert_request, public_key, issuer)
         elif cert_request.type == CertificateTypes.OCSP:
-            self._certificate = self._create_ocsp_certificate(cert_request, private_key, issuer_key)
+            self._build_ocsp_certificate(cert_request, public_key, issuer)
+        else:
+            raise CertificateError(f"Certificate type {cert_request.type} not supported")
+        return self._builder, issuer
+
+    def create_certificate(
+        self,
+        cert_request: CertificateType,
+        key: Union[str, Key, CertificatePublicKeyTypes],
+        passphrase: Optional[str] = None,
+        passphrase_issuer: Optional[str] = None,
+        issuer_key: Optional[Union[Key, Signer]] = None,
+    ) -> Certificate:
+        """
+        Create a certificate.
+
+        Arguments: cert_request - The certificate request, containing all the information
+                   key - The key of the certificate (pem string or loaded key), or the public key
+                         when the private key is held by the requester
+                   passphrase - The passphrase of the key of the certificate
+                   passphrase_issuer - The passphrase of the key of the signing certificate
+                   issuer_key - Optional already decrypted key or signer of the signing certificate
+        Returns:   The certificate object
+        """
+        builder, signer = self.build_certificate(cert_request, key, passphrase, passphrase_issuer, issuer_key)
+        self._certificate = signer.sign_certificate(builder)
         return self
 
+    @staticmethod
+    def create_certificates(
+        cert_requests: List[Tuple[CertificateType, Union[Key, CertificatePublicKeyTypes]]],
+        issuer_key: Union[Key, Signer],
+    ) -> List[Certificate]:
+        """
+        Create certificates issued by the same authority, which are signed in one batch.
+
+        Arguments: cert_requests - List with tuples of the certificate request and the loaded key, or the public key
+                                   when the private key is held by the requester
+                   issuer_key - The decrypted key or signer of the signing certificate
+        Returns:   List with the certificate objects
+        """
+        if any(cert_request.type == CertificateTypes.ROOT for cert_request, _ in cert_requests):
+            raise CertificateError("Root certificates are self-signed and can not be signed in a batch")
+        signer = as_signer(issuer_key)
+        # The issuer certificates are parsed once for all certificates
+        builder = Certificate()
+        builders = [
+            builder.build_certificate(cert_request, key, issuer_key=signer)[0] for cert_request, key in cert_requests
+        ]
+        certificates = []
+        for signed in signer.sign_certificates(builders):
+            certificate = Certificate()
+            certificate._certificate = signed
+            certificates.append(certificate)
+        return certificates
+
     def serialize(self, encoding: serialization.Encoding = serialization.Encoding.PEM) -> str:
         """
         Serialize certificate
@@ -523,5 +638,5 @@ class Certificate(object):
         Returns:   Self
         """
 
-        self._certificate = x509.load_pem_x509_certificate(pem.encode("utf8"), backend=default_backend())
+        self._certificate = certificate_cache.load(pem)
         return self
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+
+class CertificateCache(object):
+    """
+    Process-wide least recently used cache of parsed certificates, keyed by the SHA256 fingerprint of the pem.
+
+    Parsed certificates are immutable, so the same object is handed out to every caller. As the key is derived
+    from the content, a changed certificate is a new entry and entries never have to be invalidated.
+    """
+
+    def __init__(self, size: int):
+        if size < 0:
+            raise ValueError("Size of certificate cache should not be negative")
+        self.size = size
+        self._lock = threading.Lock()
+        self._certificates: "OrderedDict[bytes, x509.Certificate]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _fingerprint(pem: str) -> bytes:
+        return hashlib.sha256(pem.strip().encode("utf8")).digest()
+
+    def load(self, pem: str) -> x509.Certificate:
+        """
+        Get a parsed certificate, the certificate is parsed when not cached
+
+        Arguments: pem - The certificate as pem string
+        Returns:   The loaded certificate
+        """
+        fingerprint = self._fingerprint(pem)
+        with self._lock:
+            certificate = self._certificates.get(fingerprint)
+            if certificate is not None:
+                self._certificates.move_to_end(fingerprint)
+                self._hits += 1
+                return certificate
+            self._misses += 1
+
+        # Parse outside the lock, a concurrent parse of the same certificate only costs a duplicate parse
+        certificate = x509.load_pem_x509_certificate(pem.encode("utf8"), backend=default_backend())
+        if self.size:
+            with self._lock:
+                self._certificates[fingerprint] = certificate
+                self._certificates.move_to_end(fingerprint)
+                while len(self._certificates) > self.size:
+                    self._certificates.popitem(last=False)
+                    self._evictions += 1
+        return certificate
+
+    def resize(self, size: int) -> None:
+        """
+        Change the max nr of cached certificates, the least recently used certificates are evicted
+
+        Arguments: size - Max nr of certificates, 0 disables the cache
+        """
+        if size < 0:
+            raise ValueError("Size of certificate cache should not be negative")
+        with self._lock:
+            self.size = size
+            while len(self._certificates) > size:
+                self._certificates.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """
+        Remove all certificates from the cache and reset the counters
+        """
+        with self._lock:
+            self._certificates.clear()
+            self._hits = self._misses = self._evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Cache size and usage counters
+
+        Returns:   dict with size, entries, hits, misses and evictions
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "entries": len(self._certificates),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def __contains__(self, pem: str) -> bool:
+        with self._lock:
+            return self._fingerprint(pem) in self._certificates
+
+
+# Shared by the certificate engine, resized by the certificate engine app from the settings
+certificate_cache = CertificateCache(256)
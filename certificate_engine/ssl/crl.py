@@ -1,15 +1,15 @@
 import datetime
-from typing import TYPE_CHECKING, List, Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 
 import pytz
 from cryptography import x509
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import ed448, ed25519
+from cryptography.hazmat.primitives import serialization
 from cryptography.x509 import CertificateRevocationList, RevokedCertificate
 
 from certificate_engine.ssl.certificate import Certificate, PassPhraseError
+from certificate_engine.ssl.certificate_cache import certificate_cache
 from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.signer import Signer, as_signer
 
 if TYPE_CHECKING:
     from x509_pki.models import Certificate as CertificateType
@@ -17,34 +17,53 @@ else:
     CertificateType = object
 
 
-def revocation_builder(pem: str, timestamp: datetime.datetime) -> RevokedCertificate:
-    certificate = x509.load_pem_x509_certificate(pem.encode("utf8"), backend=default_backend())
-    revoked_cert = (
-        x509.RevokedCertificateBuilder().serial_number(certificate.serial_number).revocation_date(timestamp).build()
-    )
+def revocation_builder(certificate: Union[str, int], timestamp: datetime.datetime) -> RevokedCertificate:
+    """
+    Create revoked certificate entry
+
+    Arguments: certificate - The serial number of the certificate, or the certificate (pem string)
+               timestamp - The revocation date
+    Returns:   The revoked certificate object
+    """
+    if isinstance(certificate, str):
+        serial_number = certificate_cache.load(certificate).serial_number
+    else:
+        serial_number = certificate
+    revoked_cert = x509.RevokedCertificateBuilder().serial_number(serial_number).revocation_date(timestamp).build()
     return revoked_cert
 
 
 def revocation_list_builder(
-    certificates: List[Tuple[str, datetime.datetime]],
+    certificates: List[Tuple[Union[str, int], datetime.datetime]],
     issuer_cert: CertificateType,
     passphrase: Optional[str] = None,
     last_update: Optional[datetime.datetime] = None,
     next_update: Optional[datetime.datetime] = None,
+    crl_number: Optional[int] = None,
+    delta_crl_indicator: Optional[int] = None,
+    freshest_crl_url: Optional[str] = None,
+    issuer_key: Optional[Union[Key, Signer]] = None,
 ) -> CertificateRevocationList:
     """
     Create certificate revocation list
 
-    Arguments: certificates - The certificates in tuples with revocation date
-               ca - The authority certificate (pem bytes)
-               key - The authority private key (pem bytes)
+    Arguments: certificates - The serial numbers (or pem strings) of the certificates in tuples with revocation date
+               issuer_cert - The authority certificate
                passphrase - The passphrase of the key of the certificate
+               last_update - Optional issue date of the list, defaults to now
+               next_update - Optional date of the next update, defaults to tomorrow
+               crl_number - Optional sequence number of the list (CRLNumber extension)
+               delta_crl_indicator - Optional CRL number of the complete list this delta list is based on
+               freshest_crl_url - Optional location of the delta list (FreshestCRL extension)
+               issuer_key - Optional already decrypted key or signer of the authority
     Returns:   The certificate revocation list object
     """
-    try:
-        ca_key = Key().load(issuer_cert.keystore.key, passphrase)
-    except ValueError:
-        raise PassPhraseError("Bad passphrase, could not decode private key")
+    ca_key = issuer_key
+    if ca_key is None:
+        try:
+            ca_key = Key().load(issuer_cert.keystore.key, passphrase)
+        except ValueError:
+            raise PassPhraseError("Bad passphrase, could not decode private key")
 
     one_day = datetime.timedelta(1, 0, 0)
 
@@ -56,16 +75,30 @@ def revocation_list_builder(
     builder = builder.last_update(last_update)
     builder = builder.next_update(next_update)
 
-    for pem, timestamp in certificates:
-        revoked_cert = revocation_builder(pem, timestamp)
+    for certificate, timestamp in certificates:
+        revoked_cert = revocation_builder(certificate, timestamp)
         builder = builder.add_revoked_certificate(revoked_cert)
 
-    algorithm = None if isinstance(ca_key.key, (ed25519.Ed25519PrivateKey, ed448.Ed448PrivateKey)) else hashes.SHA256()
-    crl = builder.sign(
-        private_key=ca_key.key,
-        algorithm=algorithm,
-    )
-    return crl
+    if crl_number is not None:
+        builder = builder.add_extension(x509.CRLNumber(crl_number), critical=False)
+    if delta_crl_indicator is not None:
+        builder = builder.add_extension(x509.DeltaCRLIndicator(delta_crl_indicator), critical=True)
+    if freshest_crl_url:
+        builder = builder.add_extension(
+            x509.FreshestCRL(
+                [
+                    x509.DistributionPoint(
+                        full_name=[x509.UniformResourceIdentifier(freshest_crl_url)],
+                        relative_name=None,
+                        reasons=None,
+                        crl_issuer=None,
+                    )
+                ]
+            ),
+            critical=False,
+        )
+
+    return as_signer(ca_key).sign_crl(builder)
 
 
 def serialize(crl: CertificateRevocationList, encoding: serialization.Encoding = serialization.Encoding.PEM) -> str:
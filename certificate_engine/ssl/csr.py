@@ -0,0 +1,53 @@
+from typing import Any, Dict, List
+
+from cryptography import x509
+from cryptography.exceptions import UnsupportedAlgorithm
+
+from certificate_engine.ssl.certificate import CertificateError
+from certificate_engine.types import CertificateBasePolicy
+
+
+def load_csr(pem: str) -> x509.CertificateSigningRequest:
+    """
+    Load a PKCS#10 certificate signing request and check that it is signed by the key it contains
+
+    Arguments: pem - The certificate signing request as pem string
+    Returns:   The loaded certificate signing request
+    """
+    try:
+        csr = x509.load_pem_x509_csr(pem.encode("utf8"))
+        # Parse the extensions, malformed extensions are only detected when they are used
+        csr.extensions
+        valid = csr.is_signature_valid
+    except (ValueError, UnsupportedAlgorithm):
+        raise CertificateError("Could not load certificate signing request")
+    if not valid:
+        raise CertificateError("Signature of certificate signing request is not valid")
+    return csr
+
+
+def get_csr_subject(csr: x509.CertificateSigningRequest) -> Dict[str, Any]:
+    """
+    Get the distinguished name requested by a certificate signing request
+
+    Arguments: csr - The loaded certificate signing request
+    Returns:   Dict with the distinguished name attributes and the subjectAltNames of the request
+    """
+    dn: Dict[str, Any] = {}
+    for name, oid in CertificateBasePolicy.fields_dn:
+        attributes = csr.subject.get_attributes_for_oid(oid)
+        if attributes:
+            dn[name] = str(attributes[0].value)
+
+    alt_names: List[str] = []
+    try:
+        extension = csr.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+    except x509.ExtensionNotFound:
+        pass
+    else:
+        alt_names += extension.value.get_values_for_type(x509.DNSName)
+        alt_names += [str(address) for address in extension.value.get_values_for_type(x509.IPAddress)]
+        alt_names += extension.value.get_values_for_type(x509.RFC822Name)
+    if alt_names:
+        dn["subjectAltNames"] = alt_names
+    return dn
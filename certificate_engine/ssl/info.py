@@ -1,36 +1,314 @@
-import os
-import subprocess
-import tempfile
+import datetime
+import ipaddress
+from typing import Callable, Dict, List, Union
 
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, rsa
+from cryptography.x509.oid import AuthorityInformationAccessOID, ExtendedKeyUsageOID, ExtensionOID, NameOID
 
-def get_certificate_info(crt: str) -> str:
+from certificate_engine.ssl.certificate_cache import certificate_cache
+
+# Text dump of certificates in the format of 'openssl x509 -text -noout' (OpenSSL 3)
+
+_NAME_LABELS = {
+    NameOID.COUNTRY_NAME: "C",
+    NameOID.STATE_OR_PROVINCE_NAME: "ST",
+    NameOID.LOCALITY_NAME: "L",
+    NameOID.ORGANIZATION_NAME: "O",
+    NameOID.ORGANIZATIONAL_UNIT_NAME: "OU",
+    NameOID.COMMON_NAME: "CN",
+    NameOID.EMAIL_ADDRESS: "emailAddress",
+}
+
+_SIGNATURE_ALGORITHM_LABELS = {
+    "1.2.840.113549.1.1.5": "sha1WithRSAEncryption",
+    "1.2.840.113549.1.1.11": "sha256WithRSAEncryption",
+    "1.2.840.113549.1.1.12": "sha384WithRSAEncryption",
+    "1.2.840.113549.1.1.13": "sha512WithRSAEncryption",
+    "1.2.840.10045.4.3.2": "ecdsa-with-SHA256",
+    "1.2.840.10045.4.3.3": "ecdsa-with-SHA384",
+    "1.2.840.10045.4.3.4": "ecdsa-with-SHA512",
+    "1.3.101.112": "ED25519",
+    "1.3.101.113": "ED448",
+}
+
+_EXTENSION_LABELS = {
+    ExtensionOID.AUTHORITY_KEY_IDENTIFIER: "X509v3 Authority Key Identifier",
+    ExtensionOID.SUBJECT_KEY_IDENTIFIER: "X509v3 Subject Key Identifier",
+    ExtensionOID.CRL_DISTRIBUTION_POINTS: "X509v3 CRL Distribution Points",
+    ExtensionOID.AUTHORITY_INFORMATION_ACCESS: "Authority Information Access",
+    ExtensionOID.BASIC_CONSTRAINTS: "X509v3 Basic Constraints",
+    ExtensionOID.KEY_USAGE: "X509v3 Key Usage",
+    ExtensionOID.EXTENDED_KEY_USAGE: "X509v3 Extended Key Usage",
+    ExtensionOID.SUBJECT_ALTERNATIVE_NAME: "X509v3 Subject Alternative Name",
+}
+
+_KEY_USAGE_LABELS = [
+    ("digital_signature", "Digital Signature"),
+    ("content_commitment", "Non Repudiation"),
+    ("key_encipherment", "Key Encipherment"),
+    ("data_encipherment", "Data Encipherment"),
+    ("key_agreement", "Key Agreement"),
+    ("key_cert_sign", "Certificate Sign"),
+    ("crl_sign", "CRL Sign"),
+]
+
+_EXTENDED_KEY_USAGE_LABELS = {
+    ExtendedKeyUsageOID.SERVER_AUTH: "TLS Web Server Authentication",
+    ExtendedKeyUsageOID.CLIENT_AUTH: "TLS Web Client Authentication",
+    ExtendedKeyUsageOID.CODE_SIGNING: "Code Signing",
+    ExtendedKeyUsageOID.EMAIL_PROTECTION: "E-mail Protection",
+    ExtendedKeyUsageOID.TIME_STAMPING: "Time Stamping",
+    ExtendedKeyUsageOID.OCSP_SIGNING: "OCSP Signing",
+}
+
+_ACCESS_METHOD_LABELS = {
+    AuthorityInformationAccessOID.OCSP: "OCSP",
+    AuthorityInformationAccessOID.CA_ISSUERS: "CA Issuers",
+}
+
+_CURVE_LABELS = {
+    "secp256r1": ("prime256v1", "P-256"),
+    "secp384r1": ("secp384r1", "P-384"),
+    "secp521r1": ("secp521r1", "P-521"),
+}
+
+_RFC2253_SPECIAL_CHARS = set(',+"\\<>;')
+
+
+def _load(crt: Union[str, x509.Certificate]) -> x509.Certificate:
+    if isinstance(crt, x509.Certificate):
+        return crt
+    return certificate_cache.load(crt)
+
+
+def _hex(data: bytes, upper: bool = False) -> str:
+    return ":".join(f"{b:02X}" if upper else f"{b:02x}" for b in data)
+
+
+def _hex_block(data: bytes, indent: int, per_line: int) -> List[str]:
+    lines = []
+    for i in range(0, len(data), per_line):
+        line = _hex(data[i:][:per_line])
+        if i + per_line < len(data):
+            line += ":"
+        lines.append(" " * indent + line)
+    return lines
+
+
+def _int_bytes(value: int) -> bytes:
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+
+
+def _name_attribute_label(attribute: x509.NameAttribute) -> str:
+    return _NAME_LABELS.get(attribute.oid, attribute.oid.dotted_string)
+
+
+def _name_attribute_value(attribute: x509.NameAttribute) -> str:
+    return attribute.value if isinstance(attribute.value, str) else attribute.value.decode("utf8")
+
+
+def _format_name(name: x509.Name) -> str:
+    # Format of the 'oneline' name option: values with RFC 2253 special characters are quoted
+    parts = []
+    for attribute in name:
+        value = _name_attribute_value(attribute)
+        if (
+            _RFC2253_SPECIAL_CHARS.intersection(value)
+            or value.startswith("#")
+            or value.startswith(" ")
+            or value.endswith(" ")
+        ):
+            value = '"{}"'.format(value.replace("\\", "\\\\").replace('"', '\\"'))
+        parts.append(f"{_name_attribute_label(attribute)} = {value}")
+    return ", ".join(parts)
+
+
+def _format_name_oneline(name: x509.Name) -> str:
+    return "".join(f"/{_name_attribute_label(a)}={_name_attribute_value(a)}" for a in name)
+
+
+def _format_date(date: datetime.datetime) -> str:
+    return date.strftime("%b ") + f"{date.day:2d}" + date.strftime(" %H:%M:%S %Y GMT")
+
+
+def _format_serial(serial_number: int) -> List[str]:
+    if 0 <= serial_number < 2**63:
+        return [f"        Serial Number: {serial_number} (0x{serial_number:x})"]
+    return ["        Serial Number:", "            " + _hex(_int_bytes(serial_number))]
+
+
+def _format_signature_algorithm(certificate: x509.Certificate) -> str:
+    oid = certificate.signature_algorithm_oid
+    return _SIGNATURE_ALGORITHM_LABELS.get(oid.dotted_string, oid.dotted_string)
+
+
+def _format_public_key(certificate: x509.Certificate) -> List[str]:
+    public_key = certificate.public_key()
+    indent = " " * 16
+    if isinstance(public_key, rsa.RSAPublicKey):
+        numbers = public_key.public_numbers()
+        modulus = numbers.n.to_bytes(public_key.key_size // 8 + 1, "big")
+        if modulus[1] < 0x80:
+            modulus = modulus[1:]
+        return [
+            "            Public Key Algorithm: rsaEncryption",
+            f"{indent}Public-Key: ({public_key.key_size} bit)",
+            f"{indent}Modulus:",
+            *_hex_block(modulus, 20, 15),
+            f"{indent}Exponent: {numbers.e} (0x{numbers.e:x})",
+        ]
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        point = public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+        asn1_oid, nist_curve = _CURVE_LABELS.get(public_key.curve.name, (public_key.curve.name, None))
+        lines = [
+            "            Public Key Algorithm: id-ecPublicKey",
+            f"{indent}Public-Key: ({public_key.key_size} bit)",
+            f"{indent}pub:",
+            *_hex_block(point, 20, 15),
+            f"{indent}ASN1 OID: {asn1_oid}",
+        ]
+        if nist_curve:
+            lines.append(f"{indent}NIST CURVE: {nist_curve}")
+        return lines
+    if isinstance(public_key, (ed25519.Ed25519PublicKey, ed448.Ed448PublicKey)):
+        label = "ED25519" if isinstance(public_key, ed25519.Ed25519PublicKey) else "ED448"
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return [
+            f"            Public Key Algorithm: {label}",
+            f"{indent}{label} Public-Key:",
+            f"{indent}pub:",
+            *_hex_block(raw, 20, 15),
+        ]
+    raise NotImplementedError(f"Public key type {type(public_key).__name__} not supported")
+
+
+def _format_general_name(general_name: x509.GeneralName) -> str:
+    if isinstance(general_name, x509.DNSName):
+        return f"DNS:{general_name.value}"
+    if isinstance(general_name, x509.RFC822Name):
+        return f"email:{general_name.value}"
+    if isinstance(general_name, x509.UniformResourceIdentifier):
+        return f"URI:{general_name.value}"
+    if isinstance(general_name, x509.DirectoryName):
+        return f"DirName:{_format_name_oneline(general_name.value)}"
+    if isinstance(general_name, x509.IPAddress):
+        address = general_name.value
+        if isinstance(address, ipaddress.IPv6Address):
+            return "IP Address:" + ":".join(f"{int(address.exploded.split(':')[i], 16):X}" for i in range(8))
+        return f"IP Address:{address}"
+    return f"othername:{general_name.value}"
+
+
+def _format_authority_key_identifier(value: x509.AuthorityKeyIdentifier) -> List[str]:
+    if value.authority_cert_issuer is None and value.authority_cert_serial_number is None:
+        return [_hex(value.key_identifier or b"", upper=True)]
+    lines = []
+    if value.key_identifier:
+        lines.append("keyid:" + _hex(value.key_identifier, upper=True))
+    for general_name in value.authority_cert_issuer or []:
+        lines.append(_format_general_name(general_name))
+    if value.authority_cert_serial_number is not None:
+        lines.append("serial:" + _hex(_int_bytes(value.authority_cert_serial_number), upper=True))
+    return lines
+
+
+def _format_crl_distribution_points(value: x509.CRLDistributionPoints) -> List[str]:
+    lines = []
+    for distribution_point in value:
+        if distribution_point.full_name:
+            lines.append("Full Name:")
+            lines.extend(f"  {_format_general_name(n)}" for n in distribution_point.full_name)
+    return lines
+
+
+def _format_key_usage(value: x509.KeyUsage) -> List[str]:
+    usages = [label for attr, label in _KEY_USAGE_LABELS if getattr(value, attr)]
+    if value.key_agreement:
+        if value.encipher_only:
+            usages.append("Encipher Only")
+        if value.decipher_only:
+            usages.append("Decipher Only")
+    return [", ".join(usages)]
+
+
+def _format_basic_constraints(value: x509.BasicConstraints) -> List[str]:
+    line = "CA:TRUE" if value.ca else "CA:FALSE"
+    if value.path_length is not None:
+        line += f", pathlen:{value.path_length}"
+    return [line]
+
+
+_EXTENSION_FORMATTERS: Dict[x509.ObjectIdentifier, Callable[..., List[str]]] = {
+    ExtensionOID.AUTHORITY_KEY_IDENTIFIER: _format_authority_key_identifier,
+    ExtensionOID.SUBJECT_KEY_IDENTIFIER: lambda value: [_hex(value.digest, upper=True)],
+    ExtensionOID.CRL_DISTRIBUTION_POINTS: _format_crl_distribution_points,
+    ExtensionOID.AUTHORITY_INFORMATION_ACCESS: lambda value: [
+        f"{_ACCESS_METHOD_LABELS.get(d.access_method, d.access_method.dotted_string)} - "
+        f"{_format_general_name(d.access_location)}"
+        for d in value
+    ],
+    ExtensionOID.BASIC_CONSTRAINTS: _format_basic_constraints,
+    ExtensionOID.KEY_USAGE: _format_key_usage,
+    ExtensionOID.EXTENDED_KEY_USAGE: lambda value: [
+        ", ".join(_EXTENDED_KEY_USAGE_LABELS.get(usage, usage.dotted_string) for usage in value)
+    ],
+    ExtensionOID.SUBJECT_ALTERNATIVE_NAME: lambda value: [", ".join(_format_general_name(n) for n in value)],
+}
+
+
+def _format_extensions(certificate: x509.Certificate) -> List[str]:
+    if not len(certificate.extensions):
+        return []
+    lines = ["        X509v3 extensions:"]
+    for extension in certificate.extensions:
+        label = _EXTENSION_LABELS.get(extension.oid, extension.oid.dotted_string)
+        lines.append(f"            {label}: {'critical' if extension.critical else ''}")
+        formatter = _EXTENSION_FORMATTERS.get(extension.oid)
+        if formatter:
+            values = formatter(extension.value)
+        else:
+            values = _hex_block(extension.value.public_bytes(), 0, 18)
+        lines.extend(f"                {value}" for value in values)
+    return lines
+
+
+def get_certificate_info(crt: Union[str, x509.Certificate]) -> str:
     """
     Get Info of certificates
 
-    Arguments: pem - string with certificate
+    Arguments: crt - string with pem certificate or certificate object
     Returns:   string
     """
-    f = tempfile.NamedTemporaryFile(delete=False)
-    path = f.name
-    f.write(crt.encode("utf8"))
-    f.close()
-    cert_txt = subprocess.check_output(["openssl", "x509", "-text", "-noout", "-in", path])
-    os.unlink(path)
-    return cert_txt.decode("utf8")
+    certificate = _load(crt)
+    signature_algorithm = _format_signature_algorithm(certificate)
+    lines = [
+        "Certificate:",
+        "    Data:",
+        f"        Version: {certificate.version.value + 1} (0x{certificate.version.value:x})",
+        *_format_serial(certificate.serial_number),
+        f"        Signature Algorithm: {signature_algorithm}",
+        f"        Issuer: {_format_name(certificate.issuer)}",
+        "        Validity",
+        f"            Not Before: {_format_date(certificate.not_valid_before_utc)}",
+        f"            Not After : {_format_date(certificate.not_valid_after_utc)}",
+        f"        Subject: {_format_name(certificate.subject)}",
+        "        Subject Public Key Info:",
+        *_format_public_key(certificate),
+        *_format_extensions(certificate),
+        f"    Signature Algorithm: {signature_algorithm}",
+        "    Signature Value:",
+        *_hex_block(certificate.signature, 8, 18),
+    ]
+    return "\n".join(lines) + "\n"
 
 
-def get_certificate_fingerprint(crt: str) -> str:
+def get_certificate_fingerprint(crt: Union[str, x509.Certificate]) -> str:
     """
     Get Fingerprint of certificates
 
-    Arguments: pem - string with certificate
+    Arguments: crt - string with pem certificate or certificate object
     Returns:   string
     """
-    f = tempfile.NamedTemporaryFile(delete=False)
-    path = f.name
-    f.write(crt.encode("utf8"))
-    f.close()
-    cert_txt = subprocess.check_output(["openssl", "x509", "-fingerprint", "-sha1", "-noout", "-in", path])
-    os.unlink(path)
-    fingerprint = cert_txt.decode("utf8")
-    return fingerprint.split("=")[1].strip()
+    return _hex(_load(crt).fingerprint(hashes.SHA1()), upper=True)
@@ -1,17 +1,74 @@
-from typing import List, Optional, cast
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, cast
 
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives._serialization import PrivateFormat
-from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
-from cryptography.hazmat.primitives.asymmetric.types import CertificateIssuerPrivateKeyTypes
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.asymmetric.types import CertificateIssuerPrivateKeyTypes, CertificatePublicKeyTypes
 from cryptography.hazmat.primitives.serialization import pkcs12
 from typing_extensions import get_args
 
+if TYPE_CHECKING:
+    from certificate_engine.ssl.key_pool import KeyPool
+
+# Curves of ECDSA keys by key size
+EC_CURVES = {256: ec.SECP256R1, 384: ec.SECP384R1}
+
+# Supported key sizes per key algorithm, None for algorithms with a fixed key size
+KEY_SIZES: Dict[str, List[Optional[int]]] = {
+    "rsa": [2048, 3072, 4096],
+    "ecdsa": list(EC_CURVES),
+    "ed25519": [None],
+}
+
+
+def generate_private_key(key_algorithm: str, key_size: Optional[int]) -> CertificateIssuerPrivateKeyTypes:
+    """
+    Generate a new private key, without consulting the key pool.
+
+    Arguments: key_algorithm - the used key algorithm, currently rsa, ecdsa, ed25519 supported
+               key_size - Number of bits to use in the key (RSA), or the size of the curve (ECDSA, 256 or 384)
+    Returns:   The private key
+    """
+    if key_algorithm == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate()
+    elif key_algorithm == "rsa":
+        if not key_size:
+            raise ValueError("Key size is required for RSA keys")
+        return rsa.generate_private_key(public_exponent=65537, key_size=key_size, backend=default_backend())
+    elif key_algorithm == "ecdsa":
+        if key_size not in EC_CURVES:
+            raise ValueError(f"Key size {key_size} not supported for ECDSA keys, use 256 or 384")
+        return ec.generate_private_key(EC_CURVES[key_size](), backend=default_backend())
+    raise NotImplementedError(f"Key algorithm {key_algorithm} not implemented")
+
+
+def get_public_key_parameters(public_key: CertificatePublicKeyTypes) -> Tuple[str, Optional[int]]:
+    """
+    Get the key algorithm and key size of a public key
+
+    Arguments: public_key - The public key
+    Returns:   Tuple with key algorithm and key size (None for Ed25519 keys)
+    """
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return "ed25519", None
+    elif isinstance(public_key, rsa.RSAPublicKey):
+        return "rsa", public_key.key_size
+    elif isinstance(public_key, ec.EllipticCurvePublicKey):
+        if not any(isinstance(public_key.curve, curve) for curve in EC_CURVES.values()):
+            raise ValueError(f"Curve {public_key.curve.name} not supported for ECDSA keys")
+        return "ecdsa", public_key.curve.key_size
+    raise ValueError(f"Key type {type(public_key).__name__} not supported")
+
 
 class Key(object):
     _key: Optional[CertificateIssuerPrivateKeyTypes] = None
+    # Optional pool with pre-generated keys, configured by the certificate engine app
+    pool: Optional["KeyPool"] = None
+
+    def __init__(self, key: Optional[CertificateIssuerPrivateKeyTypes] = None):
+        self._key = key
 
     @property
     def key(self) -> CertificateIssuerPrivateKeyTypes:
@@ -19,20 +76,16 @@ class Key(object):
             raise RuntimeError("No key object")
         return self._key
 
-    def create_key(self, key_algorithm: str, key_size: int) -> "Key":
+    def create_key(self, key_algorithm: str, key_size: Optional[int]) -> "Key":
         """
-        Create a public/private key pair.
+        Create a public/private key pair. A pre-generated key is taken from the key pool when available.
 
-        Arguments: key_size - Number of bits to use in the key (only RSA)
-                   key_algorithm = the used key algorithm, currently rsa, ed25519 supported
+        Arguments: key_size - Number of bits to use in the key (RSA), or the size of the curve (ECDSA, 256 or 384)
+                   key_algorithm = the used key algorithm, currently rsa, ecdsa, ed25519 supported
         Returns:   The private key
         """
-        if key_algorithm == "ed25519":
-            self._key = ed25519.Ed25519PrivateKey.generate()
-        elif key_algorithm == "rsa":
-            self._key = rsa.generate_private_key(public_exponent=65537, key_size=key_size, backend=default_backend())
-        else:
-            raise NotImplementedError(f"Key algorithm {key_algorithm} not implemented")
+        key = Key.pool.pop(key_algorithm, key_size) if Key.pool else None
+        self._key = key if key is not None else generate_private_key(key_algorithm, key_size)
         return self
 
     def serialize_pkcs12(
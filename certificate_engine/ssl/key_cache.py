@@ -0,0 +1,111 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from certificate_engine.ssl.key import Key
+
+
+class _CachedKey(object):
+    def __init__(self, key: Key, digest: bytes, deadline: float):
+        self.key = key
+        self.digest = digest
+        self.deadline = deadline
+        self.last_used = time.monotonic()
+
+
+class KeyCache(object):
+    """
+    In-process cache of decrypted private keys, keyed by an id and a hash of the passphrase.
+
+    A key is only returned when the same passphrase is provided as the one used to cache it. Keys are
+    kept as parsed key objects, so they are not decoded again on every use. A key is evicted after its
+    deadline, after being idle for the idle timeout, or when it is explicitly evicted. Expired keys are
+    evicted when accessed, and otherwise by a single sweeper thread which runs while keys are cached.
+    """
+
+    def __init__(self, idle_timeout: float):
+        if idle_timeout <= 0:
+            raise ValueError("Idle timeout of key cache should be positive")
+        self.idle_timeout = idle_timeout
+        self._secret = os.urandom(32)
+        self._lock = threading.Lock()
+        self._keys: Dict[int, _CachedKey] = {}
+        self._sweeper: Optional[threading.Thread] = None
+
+    def _digest(self, passphrase: Optional[str]) -> bytes:
+        return hmac.new(self._secret, (passphrase or "").encode("utf-8"), hashlib.sha256).digest()
+
+    def _expires_at(self, entry: _CachedKey) -> float:
+        return min(entry.deadline, entry.last_used + self.idle_timeout)
+
+    def _evict_expired(self) -> Optional[float]:
+        # Evict the expired keys, returns the time the next key expires or None when the cache is empty
+        now = time.monotonic()
+        for key_id in [key_id for key_id, entry in self._keys.items() if self._expires_at(entry) <= now]:
+            self._evict(key_id)
+        return min((self._expires_at(entry) for entry in self._keys.values()), default=None)
+
+    def _sweep(self) -> None:
+        while True:
+            with self._lock:
+                expires_at = self._evict_expired()
+                if expires_at is None:
+                    self._sweeper = None
+                    return
+            time.sleep(max(expires_at - time.monotonic(), 0))
+
+    def _evict(self, key_id: int) -> None:
+        self._keys.pop(key_id, None)
+
+    def put(self, key_id: int, passphrase: Optional[str], key: Key, ttl: float) -> None:
+        """
+        Cache a decrypted key
+
+        Arguments: key_id - id of the key, i.e. the id of the certificate
+                   passphrase - the passphrase of the key
+                   key - the decrypted key
+                   ttl - maximum number of seconds to keep the key
+        """
+        entry = _CachedKey(key, self._digest(passphrase), time.monotonic() + ttl)
+        with self._lock:
+            self._evict(key_id)
+            self._keys[key_id] = entry
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep, name="key-cache-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def get(self, key_id: int, passphrase: Optional[str]) -> Optional[Key]:
+        """
+        Get a cached key
+
+        Arguments: key_id - id of the key, i.e. the id of the certificate
+                   passphrase - the passphrase of the key
+        Returns:   The decrypted key, or None when not cached or cached with another passphrase
+        """
+        digest = self._digest(passphrase)
+        with self._lock:
+            entry = self._keys.get(key_id)
+            if entry is None or not hmac.compare_digest(entry.digest, digest):
+                return None
+            if self._expires_at(entry) <= time.monotonic():
+                self._evict(key_id)
+                return None
+            entry.last_used = time.monotonic()
+            return entry.key
+
+    def evict(self, key_id: int) -> None:
+        """
+        Remove a key from the cache
+
+        Arguments: key_id - id of the key, i.e. the id of the certificate
+        """
+        with self._lock:
+            self._evict(key_id)
+
+    def __contains__(self, key_id: int) -> bool:
+        with self._lock:
+            self._evict_expired()
+            return key_id in self._keys
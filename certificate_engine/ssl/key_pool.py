@@ -0,0 +1,203 @@
+import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import partial
+from typing import Deque, Dict, List, Optional, Tuple, cast
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.types import CertificateIssuerPrivateKeyTypes
+
+from certificate_engine.ssl.key import Key, generate_private_key
+
+KeyType = Tuple[str, Optional[int]]
+
+logger = logging.getLogger(__name__)
+
+
+def _generate_key_der(key_algorithm: str, key_size: Optional[int]) -> bytes:
+    """
+    Generate a private key in a worker process
+
+    Arguments: key_algorithm - the used key algorithm
+               key_size - Number of bits to use in the key (only RSA)
+    Returns:   DER encoded PKCS8 private key
+    """
+    return generate_private_key(key_algorithm, key_size).private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+def _load_key_der(der: bytes) -> CertificateIssuerPrivateKeyTypes:
+    return cast(CertificateIssuerPrivateKeyTypes, serialization.load_der_private_key(der, password=None))
+
+
+def _generate_keys(
+    executor: Executor, key_algorithm: str, key_size: Optional[int], count: int
+) -> List[CertificateIssuerPrivateKeyTypes]:
+    return [_load_key_der(der) for der in executor.map(_generate_key_der, [key_algorithm] * count, [key_size] * count)]
+
+
+def create_keys(
+    key_algorithm: str, key_size: Optional[int], count: int, max_workers: Optional[int] = None
+) -> List[Key]:
+    """
+    Create multiple public/private key pairs. Keys are taken from the key pool when available,
+    the remaining keys are generated in parallel by the worker processes of the key pool, or by
+    worker processes started for this call when no key pool is configured.
+
+    Arguments: key_algorithm - the used key algorithm
+               key_size - Number of bits to use in the key (only RSA)
+               count - Number of keys
+               max_workers - optional number of worker processes started when no key pool is configured,
+                             defaults to the number of CPUs
+    Returns:   List with the keys
+    """
+    keys: List[CertificateIssuerPrivateKeyTypes] = []
+    while Key.pool and len(keys) < count:
+        key = Key.pool.pop(key_algorithm, key_size)
+        if key is None:
+            break
+        keys.append(key)
+
+    missing = count - len(keys)
+    # Only RSA key generation is expensive enough to pay off the start of worker processes
+    if missing > 1 and key_algorithm == "rsa":
+        if Key.pool:
+            keys += _generate_keys(Key.pool.executor, key_algorithm, key_size, missing)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                keys += _generate_keys(executor, key_algorithm, key_size, missing)
+    else:
+        keys += [generate_private_key(key_algorithm, key_size) for _ in range(missing)]
+
+    return [Key(key) for key in keys]
+
+
+class KeyPool(object):
+    """
+    Pool of pre-generated private keys per (algorithm, size).
+
+    Keys are generated in background worker processes and kept in memory of the
+    process owning the pool. Taking a key is O(1); every take tops the pool up to
+    its watermark again.
+    """
+
+    def __init__(self, watermark: int, max_workers: Optional[int] = None, executor: Optional[Executor] = None):
+        if watermark < 1:
+            raise ValueError("Watermark of key pool should be at least 1")
+        self.watermark = watermark
+        self.max_workers = max_workers
+        self._executor = executor
+        self._lock = threading.Condition()
+        self._keys: Dict[KeyType, Deque[CertificateIssuerPrivateKeyTypes]] = defaultdict(deque)
+        self._pending: Dict[KeyType, int] = defaultdict(int)
+        self._hits: Dict[KeyType, int] = defaultdict(int)
+        self._misses: Dict[KeyType, int] = defaultdict(int)
+        self._errors: Dict[KeyType, int] = defaultdict(int)
+
+    @property
+    def executor(self) -> Executor:
+        # Created lazily, so the worker processes belong to the application server process using the pool
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def pop(self, key_algorithm: str, key_size: Optional[int]) -> Optional[CertificateIssuerPrivateKeyTypes]:
+        """
+        Take a pre-generated key from the pool and schedule a refill
+
+        Arguments: key_algorithm - the used key algorithm
+                   key_size - Number of bits to use in the key (only RSA)
+        Returns:   The private key, or None when no key is ready
+        """
+        key_type = (key_algorithm, key_size)
+        with self._lock:
+            keys = self._keys[key_type]
+            key = keys.popleft() if keys else None
+            if key is None:
+                self._misses[key_type] += 1
+            else:
+                self._hits[key_type] += 1
+        self.refill(key_algorithm, key_size)
+        return key
+
+    def refill(self, key_algorithm: str, key_size: Optional[int]) -> None:
+        """
+        Schedule generation of keys until the pool reaches its watermark
+
+        Arguments: key_algorithm - the used key algorithm
+                   key_size - Number of bits to use in the key (only RSA)
+        """
+        key_type = (key_algorithm, key_size)
+        with self._lock:
+            missing = self.watermark - len(self._keys[key_type]) - self._pending[key_type]
+            if missing <= 0:
+                return
+            self._pending[key_type] += missing
+        for _ in range(missing):
+            future = self.executor.submit(_generate_key_der, key_algorithm, key_size)
+            future.add_done_callback(partial(self._store, key_type))
+
+    def _store(self, key_type: KeyType, future: Future) -> None:
+        key = None
+        if not future.cancelled() and future.exception() is None:
+            key = _load_key_der(future.result())
+        with self._lock:
+            self._pending[key_type] -= 1
+            if key is None:
+                self._errors[key_type] += 1
+            else:
+                self._keys[key_type].append(key)
+            self._lock.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait until all scheduled key generations are finished
+
+        Arguments: timeout - optional maximum number of seconds to wait
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: not any(self._pending.values()), timeout=timeout)
+
+    def depth(self, key_algorithm: str, key_size: Optional[int]) -> int:
+        with self._lock:
+            return len(self._keys[(key_algorithm, key_size)])
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Pool depth and usage counters per key type
+
+        Returns:   dict with depth, pending, hits, misses and errors per key type, i.e. 'rsa-2048'
+        """
+        with self._lock:
+            key_types = set(self._keys) | set(self._pending) | set(self._hits) | set(self._misses)
+            return {
+                f"{key_algorithm}-{key_size}" if key_size else key_algorithm: {
+                    "depth": len(self._keys[(key_algorithm, key_size)]),
+                    "pending": self._pending[(key_algorithm, key_size)],
+                    "hits": self._hits[(key_algorithm, key_size)],
+                    "misses": self._misses[(key_algorithm, key_size)],
+                    "errors": self._errors[(key_algorithm, key_size)],
+                }
+                for key_algorithm, key_size in key_types
+            }
+
+    def log_stats(self) -> None:
+        """
+        Log the depth and usage counters of the pool per key type
+        """
+        for key_type, stats in sorted(self.stats().items()):
+            logger.info(
+                f"Key pool {key_type}: depth {stats['depth']}, pending {stats['pending']}, hits {stats['hits']}, "
+                f"misses {stats['misses']}, errors {stats['errors']}"
+            )
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        with self._lock:
+            self._keys.clear()
@@ -0,0 +1,88 @@
+import datetime
+import hashlib
+from typing import Optional, Tuple, Union
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509 import ocsp
+
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.signer import Signer, as_signer
+
+
+def get_issuer_hashes(issuer: x509.Certificate) -> Tuple[bytes, bytes]:
+    """
+    Get the SHA1 hashes which identify an authority in OCSP requests
+
+    Arguments: issuer - The authority certificate
+    Returns:   Tuple with the hash of the subject name and the hash of the public key of the authority
+    """
+    name_hash = hashlib.sha1(issuer.subject.public_bytes(), usedforsecurity=False).digest()
+    key_hash = x509.SubjectKeyIdentifier.from_public_key(issuer.public_key()).digest
+    return name_hash, key_hash
+
+
+def ocsp_response_builder(
+    serial_number: int,
+    issuer: x509.Certificate,
+    responder: x509.Certificate,
+    responder_key: Union[Key, Signer],
+    this_update: datetime.datetime,
+    next_update: datetime.datetime,
+    revoked_at: Optional[datetime.datetime] = None,
+    issuer_hashes: Optional[Tuple[bytes, bytes]] = None,
+) -> bytes:
+    """
+    Create a signed OCSP response with the status of a certificate
+
+    Arguments: serial_number - The serial number of the certificate
+               issuer - The authority of the certificate
+               responder - The certificate signing the response, the authority or its OCSP signing certificate
+               responder_key - The decrypted key or signer of the responder
+               this_update - The date at which the status is known to be correct
+               next_update - The date at which newer information will be available
+               revoked_at - Optional revocation date, the certificate is revoked when provided
+               issuer_hashes - Optional precomputed result of get_issuer_hashes
+    Returns:   The DER encoded OCSP response
+    """
+    name_hash, key_hash = issuer_hashes or get_issuer_hashes(issuer)
+    builder = ocsp.OCSPResponseBuilder().add_response_by_hash(
+        issuer_name_hash=name_hash,
+        issuer_key_hash=key_hash,
+        serial_number=serial_number,
+        algorithm=hashes.SHA1(),
+        cert_status=ocsp.OCSPCertStatus.REVOKED if revoked_at else ocsp.OCSPCertStatus.GOOD,
+        this_update=this_update,
+        next_update=next_update,
+        revocation_time=revoked_at,
+        revocation_reason=None,
+    )
+    if responder != issuer:
+        # Clients need the delegated responder certificate to verify the response
+        builder = builder.certificates([responder])
+
+    response = as_signer(responder_key).sign_ocsp_response(builder, responder)
+    return response.public_bytes(serialization.Encoding.DER)
+
+
+def ocsp_error_response(status: ocsp.OCSPResponseStatus) -> bytes:
+    """
+    Create an unsigned OCSP response with an error status
+
+    Arguments: status - The response status, any status other than successful
+    Returns:   The DER encoded OCSP response
+    """
+    return ocsp.OCSPResponseBuilder.build_unsuccessful(status).public_bytes(serialization.Encoding.DER)
+
+
+def load_ocsp_request(data: bytes) -> Optional[ocsp.OCSPRequest]:
+    """
+    Parse a DER encoded OCSP request
+
+    Arguments: data - The DER encoded OCSP request
+    Returns:   The OCSP request, or None when the request is malformed or asks for more than one certificate
+    """
+    try:
+        return ocsp.load_der_ocsp_request(data)
+    except (ValueError, NotImplementedError):
+        return None
@@ -0,0 +1,310 @@
+import datetime
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple, Type, Union
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.types import (
+    CertificateIssuerPrivateKeyTypes,
+    CertificateIssuerPublicKeyTypes,
+    CertificatePublicKeyTypes,
+)
+from cryptography.x509 import ocsp
+
+from certificate_engine.ssl.key import Key
+
+CERTIFICATE = "certificate"
+CRL = "crl"
+OCSP_RESPONSE = "ocsp_response"
+
+
+def get_signature_hash(key: Union[CertificateIssuerPrivateKeyTypes, CertificateIssuerPublicKeyTypes]):
+    """
+    Get the hash algorithm used to sign with a key
+
+    Arguments: key - The private or public key
+    Returns:   The hash algorithm, None for EdDSA keys which have a fixed hash
+    """
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed448.Ed448PrivateKey)):
+        return None
+    if isinstance(key, (ed25519.Ed25519PublicKey, ed448.Ed448PublicKey)):
+        return None
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and key.curve.key_size >= 384:
+        # Match the strength of the hash to the strength of the curve
+        return hashes.SHA384()
+    return hashes.SHA256()
+
+
+def sign_tbs(key: CertificateIssuerPrivateKeyTypes, data: bytes) -> bytes:
+    """
+    Sign the to-be-signed part of a certificate or CRL, as builder.sign() does
+
+    Arguments: key - The private key of the authority
+               data - The DER encoded to-be-signed structure
+    Returns:   The signature
+    """
+    if isinstance(key, rsa.RSAPrivateKey):
+        return key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+    if isinstance(key, ec.EllipticCurvePrivateKey):
+        return key.sign(data, ec.ECDSA(get_signature_hash(key)))
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed448.Ed448PrivateKey)):
+        return key.sign(data)
+    raise TypeError(f"Signing with {type(key).__name__} is not supported")
+
+
+class Signer(ABC):
+    """
+    Signs certificates and certificate revocation lists with the key of an authority
+    """
+
+    @abstractmethod
+    def public_key(self) -> CertificateIssuerPublicKeyTypes:
+        """
+        Returns:   The public key of the authority
+        """
+
+    @abstractmethod
+    def sign_certificate(self, builder: x509.CertificateBuilder) -> x509.Certificate:
+        """
+        Sign a certificate
+
+        Arguments: builder - The builder with all fields of the certificate set
+        Returns:   The signed certificate
+        """
+
+    def sign_certificates(self, builders: List[x509.CertificateBuilder]) -> List[x509.Certificate]:
+        """
+        Sign certificates in one batch
+
+        Arguments: builders - The builders with all fields of the certificates set
+        Returns:   List with the signed certificates
+        """
+        return [self.sign_certificate(builder) for builder in builders]
+
+    @abstractmethod
+    def sign_crl(self, builder: x509.CertificateRevocationListBuilder) -> x509.CertificateRevocationList:
+        """
+        Sign a certificate revocation list
+
+        Arguments: builder - The builder with all fields of the list set
+        Returns:   The signed list
+        """
+
+    @abstractmethod
+    def sign_ocsp_response(self, builder: ocsp.OCSPResponseBuilder, responder: x509.Certificate) -> ocsp.OCSPResponse:
+        """
+        Sign an OCSP response, identifying the responder by the hash of its key
+
+        Arguments: builder - The builder with all fields of the response set, except the responder id
+                   responder - The certificate of the key signing the response
+        Returns:   The signed response
+        """
+
+
+class KeySigner(Signer):
+    """
+    Signs with a decrypted key in the current process
+    """
+
+    def __init__(self, key: Key):
+        self.key = key
+
+    def public_key(self) -> CertificateIssuerPublicKeyTypes:
+        return self.key.key.public_key()
+
+    def sign_certificate(self, builder: x509.CertificateBuilder) -> x509.Certificate:
+        return builder.sign(private_key=self.key.key, algorithm=get_signature_hash(self.key.key))
+
+    def sign_crl(self, builder: x509.CertificateRevocationListBuilder) -> x509.CertificateRevocationList:
+        return builder.sign(private_key=self.key.key, algorithm=get_signature_hash(self.key.key))
+
+    def sign_ocsp_response(self, builder: ocsp.OCSPResponseBuilder, responder: x509.Certificate) -> ocsp.OCSPResponse:
+        builder = builder.responder_id(ocsp.OCSPResponderEncoding.HASH, responder)
+        return builder.sign(private_key=self.key.key, algorithm=get_signature_hash(self.key.key))
+
+
+def as_signer(key: Union[Key, Signer]) -> Signer:
+    """
+    Get the signer of a key
+
+    Arguments: key - A decrypted key or a signer
+    Returns:   The signer
+    """
+    return key if isinstance(key, Signer) else KeySigner(key)
+
+
+def _der_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes([length])
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([0x80 | len(encoded)]) + encoded
+
+
+def _der_header(data: bytes, offset: int) -> Tuple[int, int]:
+    # Returns the start and end of the content of the tag-length-value element at offset
+    length = data[offset + 1]
+    start = offset + 2
+    if length & 0x80:
+        end = start + (length & 0x7F)
+        length = int.from_bytes(data[start:end], "big")
+        start = end
+    if start + length > len(data):
+        raise ValueError("DER element exceeds the data")
+    return start, start + length
+
+
+def _der_element(tag: int, content: bytes) -> bytes:
+    return bytes([tag]) + _der_length(len(content)) + content
+
+
+def _der_children(der: bytes) -> List[bytes]:
+    # Split the content of a constructed element into its tag-length-value elements, all tags are a single byte
+    start, end = _der_header(der, 0)
+    if end != len(der):
+        raise ValueError("Unexpected data after DER element")
+    children = []
+    while start < end:
+        _, child_end = _der_header(der, start)
+        children.append(der[start:child_end])
+        start = child_end
+    return children
+
+
+def _der_signed(der: bytes, tbs: bytes, signature: bytes) -> bytes:
+    # Certificates, CRLs and basic OCSP responses are a sequence of the to-be-signed structure, the signature
+    # algorithm, the signature and for OCSP responses optionally the certificates of the responder
+    children = _der_children(der)
+    if len(children) < 3:
+        raise ValueError("Unexpected structure of signed DER element")
+    children[0] = tbs
+    children[2] = _der_element(0x03, b"\x00" + signature)
+    return _der_element(der[0], b"".join(children))
+
+
+def _der_signed_ocsp_response(der: bytes, tbs: bytes, signature: bytes) -> bytes:
+    # The basic OCSP response is wrapped in: sequence(status, [0] sequence(type, octet string(basic response)))
+    status, explicit = _der_children(der)
+    [response_bytes] = _der_children(explicit)
+    response_type, octets = _der_children(response_bytes)
+    start, end = _der_header(octets, 0)
+    basic = _der_element(octets[0], _der_signed(octets[start:end], tbs, signature))
+    response_bytes = _der_element(response_bytes[0], response_type + basic)
+    return _der_element(der[0], status + _der_element(explicit[0], response_bytes))
+
+
+def _der_replace_key_hash(
+    tbs: bytes, public_key: CertificatePublicKeyTypes, other_public_key: CertificatePublicKeyTypes
+) -> bytes:
+    # The responder id of an OCSP response is [2] explicit octet string with the SHA1 hash of the key
+    def responder_id(key: CertificatePublicKeyTypes) -> bytes:
+        return _der_element(0xA2, _der_element(0x04, x509.SubjectKeyIdentifier.from_public_key(key).digest))
+
+    if tbs.count(responder_id(public_key)) != 1:
+        raise ValueError("Responder id not found in OCSP response")
+    return tbs.replace(responder_id(public_key), responder_id(other_public_key))
+
+
+class TbsSigner(Signer):
+    """
+    Signer which only signs the DER encoded to-be-signed structures, i.e. with a key held by another process.
+
+    The structure is built with a throwaway key of the same type as the key of the authority, and for ECDSA with
+    the same curve. As the signature algorithm does not depend on the size of RSA keys, it is the same structure as
+    signed by the authority. The signature of the authority then replaces the throwaway signature.
+    """
+
+    _throwaway_keys: Dict[Tuple[Type, Optional[str]], CertificateIssuerPrivateKeyTypes] = {}
+    _throwaway_lock = threading.Lock()
+
+    def __init__(self, public_key: CertificateIssuerPublicKeyTypes):
+        self._public_key = public_key
+
+    def public_key(self) -> CertificateIssuerPublicKeyTypes:
+        return self._public_key
+
+    @abstractmethod
+    def sign_tbs(self, items: List[Tuple[str, bytes]]) -> List[bytes]:
+        """
+        Sign to-be-signed structures in one batch
+
+        Arguments: items - List with tuples of the kind (CERTIFICATE, CRL or OCSP_RESPONSE) and the DER encoded
+                           structure
+        Returns:   List with the signatures
+        """
+
+    def _throwaway_key(self) -> CertificateIssuerPrivateKeyTypes:
+        key_type: Optional[Type] = None
+        for key_type in [rsa.RSAPublicKey, ec.EllipticCurvePublicKey, ed25519.Ed25519PublicKey, ed448.Ed448PublicKey]:
+            if isinstance(self._public_key, key_type):
+                break
+        else:
+            raise TypeError(f"Signing with {type(self._public_key).__name__} is not supported")
+        curve = self._public_key.curve if isinstance(self._public_key, ec.EllipticCurvePublicKey) else None
+        cache_key = (key_type, curve.name if curve else None)
+        with TbsSigner._throwaway_lock:
+            key = TbsSigner._throwaway_keys.get(cache_key)
+            if key is None:
+                if key_type is rsa.RSAPublicKey:
+                    key = rsa.generate_private_key(public_exponent=65537, key_size=1024)
+                elif curve is not None:
+                    key = ec.generate_private_key(type(curve)())
+                elif key_type is ed25519.Ed25519PublicKey:
+                    key = ed25519.Ed25519PrivateKey.generate()
+                else:
+                    key = ed448.Ed448PrivateKey.generate()
+                TbsSigner._throwaway_keys[cache_key] = key
+        return key
+
+    def sign_certificate(self, builder: x509.CertificateBuilder) -> x509.Certificate:
+        [certificate] = self.sign_certificates([builder])
+        return certificate
+
+    def sign_certificates(self, builders: List[x509.CertificateBuilder]) -> List[x509.Certificate]:
+        if not builders:
+            return []
+        key = self._throwaway_key()
+        unsigned = [builder.sign(private_key=key, algorithm=get_signature_hash(key)) for builder in builders]
+        signatures = self.sign_tbs([(CERTIFICATE, certificate.tbs_certificate_bytes) for certificate in unsigned])
+        return [
+            x509.load_der_x509_certificate(
+                _der_signed(
+                    certificate.public_bytes(encoding=serialization.Encoding.DER),
+                    certificate.tbs_certificate_bytes,
+                    signature,
+                )
+            )
+            for certificate, signature in zip(unsigned, signatures)
+        ]
+
+    def sign_crl(self, builder: x509.CertificateRevocationListBuilder) -> x509.CertificateRevocationList:
+        key = self._throwaway_key()
+        unsigned = builder.sign(private_key=key, algorithm=get_signature_hash(key))
+        der = unsigned.public_bytes(encoding=serialization.Encoding.DER)
+        [signature] = self.sign_tbs([(CRL, unsigned.tbs_certlist_bytes)])
+        return x509.load_der_x509_crl(_der_signed(der, unsigned.tbs_certlist_bytes, signature))
+
+    def sign_ocsp_response(self, builder: ocsp.OCSPResponseBuilder, responder: x509.Certificate) -> ocsp.OCSPResponse:
+        # The builder only signs for the key of the responder certificate, so the response is built for a throwaway
+        # certificate of the throwaway key. Its key hash has the same length as the hash of the responder key.
+        key = self._throwaway_key()
+        name = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, "throwaway")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        throwaway = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(1)
+            .not_valid_before(now)
+            .not_valid_after(now)
+            .sign(private_key=key, algorithm=get_signature_hash(key))
+        )
+        unsigned = builder.responder_id(ocsp.OCSPResponderEncoding.HASH, throwaway).sign(
+            private_key=key, algorithm=get_signature_hash(key)
+        )
+        tbs = _der_replace_key_hash(unsigned.tbs_response_bytes, throwaway.public_key(), responder.public_key())
+        der = unsigned.public_bytes(encoding=serialization.Encoding.DER)
+        [signature] = self.sign_tbs([(OCSP_RESPONSE, tbs)])
+        return ocsp.load_der_ocsp_response(_der_signed_ocsp_response(der, tbs, signature))
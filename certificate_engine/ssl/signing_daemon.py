@@ -0,0 +1,311 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives.asymmetric.types import CertificateIssuerPublicKeyTypes
+
+from certificate_engine.ssl.certificate import PassPhraseError
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.signer import CERTIFICATE, CRL, OCSP_RESPONSE, TbsSigner, sign_tbs
+from certificate_engine.ssl.soft_token import SoftTokenSession
+
+logger = logging.getLogger(__name__)
+
+# Messages are JSON objects preceded by their length as 4 byte unsigned integer
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+SOCKET_TIMEOUT = 60
+
+UNKNOWN_KEY = "unknown_key"
+BAD_PASSPHRASE = "bad_passphrase"
+BAD_REQUEST = "bad_request"
+UNAVAILABLE = "unavailable"
+
+
+class SigningError(RuntimeError):
+    """
+    The signing daemon could not handle a request
+    """
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def send_message(sock: socket.socket, message: dict) -> None:
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(struct.pack("!I", len(data)) + data)
+
+
+def _receive_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def receive_message(sock: socket.socket) -> Optional[dict]:
+    """
+    Read a message from a socket
+
+    Arguments: sock - The connected socket
+    Returns:   The message, None when the connection has been closed
+    """
+    header = _receive_exactly(sock, 4)
+    if header is None:
+        return None
+    (size,) = struct.unpack("!I", header)
+    if size > MAX_MESSAGE_SIZE:
+        raise SigningError(BAD_REQUEST, f"Message of {size} bytes exceeds the maximum size")
+    data = _receive_exactly(sock, size)
+    if data is None:
+        return None
+    message: dict = json.loads(data)
+    return message
+
+
+class _SigningRequestHandler(socketserver.BaseRequestHandler):
+    server: "_SigningServer"
+
+    def handle(self):
+        while True:
+            try:
+                request = receive_message(self.request)
+            except (SigningError, ValueError) as e:
+                send_message(self.request, {"error": BAD_REQUEST, "message": str(e)})
+                return
+            if request is None:
+                return
+            send_message(self.request, self.server.daemon.dispatch(request))
+
+
+class _SigningServer(socketserver.UnixStreamServer):
+    def __init__(self, socket_path: str, daemon: "SigningDaemon"):
+        self.daemon = daemon
+        super().__init__(socket_path, _SigningRequestHandler)
+
+
+class SigningDaemon(object):
+    """
+    Signing service on a Unix socket, holding the decrypted keys of the authorities.
+
+    The daemon only uses keys of its own store: keys added with add_key, and the keys of a soft token session.
+    Requests refer to a key by its id and have to provide the passphrase of the key, the keys themselves never
+    leave the daemon. With multiple processes, the processes accept connections on the same socket.
+    A sign request contains a batch of to-be-signed structures, which are signed in one round trip.
+    """
+
+    def __init__(self, socket_path: str, processes: int = 1, session: Optional[SoftTokenSession] = None):
+        """
+        Arguments: socket_path - The path of the Unix socket
+                   processes - Nr of signing processes
+                   session - Optional logged in soft token session, of which the keys are used by their label
+        """
+        self.socket_path = socket_path
+        self.processes = processes
+        self.session = session
+        self._secret = os.urandom(32)
+        self._lock = threading.Lock()
+        self._keys: Dict[int, Tuple[Key, bytes]] = {}
+        self._server: Optional[_SigningServer] = None
+        self._workers: List[int] = []
+        self._stopping = False
+
+    def _digest(self, passphrase: Optional[str]) -> bytes:
+        return hmac.new(self._secret, (passphrase or "").encode("utf-8"), hashlib.sha256).digest()
+
+    def add_key(self, key_id: int, key: Key, passphrase: Optional[str]) -> None:
+        """
+        Hold the decrypted key of an authority
+
+        Arguments: key_id - id of the key, i.e. the id of the certificate
+                   key - The decrypted key
+                   passphrase - The passphrase requests have to provide to use the key
+        """
+        with self._lock:
+            self._keys[key_id] = (key, self._digest(passphrase))
+
+    def _get_key(self, key_id: int, passphrase: Optional[str]) -> Key:
+        with self._lock:
+            entry = self._keys.get(key_id)
+        if entry is None:
+            if self.session is not None and str(key_id) in self.session:
+                try:
+                    return self.session.signer(str(key_id), passphrase).key
+                except PassPhraseError:
+                    raise SigningError(BAD_PASSPHRASE, "Bad passphrase, could not decode issuer key")
+            raise SigningError(UNKNOWN_KEY, f"Key {key_id} is not held by the signing daemon")
+        key, digest = entry
+        if not hmac.compare_digest(digest, self._digest(passphrase)):
+            raise SigningError(BAD_PASSPHRASE, "Bad passphrase, could not decode issuer key")
+        return key
+
+    def _sign(self, request: dict) -> dict:
+        key = self._get_key(int(request["key"]), request.get("passphrase"))
+        signatures = []
+        for item in request["items"]:
+            if item["kind"] not in [CERTIFICATE, CRL, OCSP_RESPONSE]:
+                raise SigningError(BAD_REQUEST, f"Cannot sign {item['kind']}")
+            signature = sign_tbs(key.key, base64.b64decode(item["data"]))
+            signatures.append(base64.b64encode(signature).decode("ascii"))
+        logger.info(f"Signed {len(signatures)} structures with key {request['key']}")
+        return {"signatures": signatures}
+
+    def _check(self, request: dict) -> dict:
+        try:
+            self._get_key(int(request["key"]), request.get("passphrase"))
+        except SigningError as e:
+            if e.code != BAD_PASSPHRASE:
+                raise
+            return {"valid": False}
+        return {"valid": True}
+
+    def dispatch(self, request: dict) -> dict:
+        """
+        Handle a request
+
+        Arguments: request - The request, with the operation (sign or check), the key id and the passphrase
+        Returns:   The response, containing an error code and message when the request failed
+        """
+        operations = {"sign": self._sign, "check": self._check}
+        try:
+            operation = operations.get(str(request.get("op")))
+            if operation is None:
+                raise SigningError(BAD_REQUEST, f"Unknown operation {request.get('op')}")
+            return operation(request)
+        except SigningError as e:
+            return {"error": e.code, "message": str(e)}
+        except (KeyError, ValueError, TypeError) as e:
+            return {"error": BAD_REQUEST, "message": f"Invalid request: {e}"}
+
+    def _serve_worker(self, server: _SigningServer) -> None:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+
+    def _start_worker(self, server: _SigningServer) -> None:
+        pid = os.fork()
+        if pid == 0:
+            self._serve_worker(server)
+        self._workers.append(pid)
+
+    def _stop_workers(self, *args) -> None:
+        self._stopping = True
+        for pid in self._workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def serve(self) -> None:
+        """
+        Listen on the socket until stopped. With multiple processes, the worker processes are restarted when they
+        exit unexpectedly, until the daemon receives SIGTERM or SIGINT.
+        """
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = self._server = _SigningServer(self.socket_path, self)
+        os.chmod(self.socket_path, 0o600)
+        try:
+            if self.processes <= 1:
+                server.serve_forever()
+                return
+            signal.signal(signal.SIGTERM, self._stop_workers)
+            signal.signal(signal.SIGINT, self._stop_workers)
+            for _ in range(self.processes):
+                self._start_worker(server)
+            while self._workers:
+                pid, _ = os.wait()
+                if pid in self._workers:
+                    self._workers.remove(pid)
+                    if not self._stopping:
+                        logger.warning(f"Signing process {pid} exited, starting a new one")
+                        self._start_worker(server)
+        finally:
+            server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        """
+        Stop serving, the single process daemon is stopped from another thread
+        """
+        if self.processes > 1:
+            self._stop_workers()
+        elif self._server:
+            self._server.shutdown()
+
+
+class RemoteSigner(TbsSigner):
+    """
+    Signs with a key held by the signing daemon, the key is referred to by its id
+    """
+
+    def __init__(
+        self, socket_path: str, key_id: int, passphrase: Optional[str], public_key: CertificateIssuerPublicKeyTypes
+    ):
+        """
+        Arguments: socket_path - The socket of the signing daemon
+                   key_id - id of the key, i.e. the id of the certificate
+                   passphrase - The passphrase of the key
+                   public_key - The public key of the authority
+        """
+        super().__init__(public_key)
+        self.socket_path = socket_path
+        self.key_id = key_id
+        self.passphrase = passphrase
+
+    def _request(self, sock: socket.socket, request: dict) -> dict:
+        send_message(sock, dict(request, key=self.key_id, passphrase=self.passphrase))
+        response = receive_message(sock)
+        if response is None:
+            raise SigningError(UNAVAILABLE, "Signing daemon closed the connection")
+        if "error" in response:
+            if response["error"] == BAD_PASSPHRASE:
+                raise PassPhraseError(response["message"])
+            raise SigningError(response["error"], response["message"])
+        return response
+
+    def _call(self, request: dict) -> dict:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(SOCKET_TIMEOUT)
+                sock.connect(self.socket_path)
+                return self._request(sock, request)
+        except OSError as e:
+            raise SigningError(UNAVAILABLE, f"Signing daemon not available: {e}")
+
+    def sign_tbs(self, items: List[Tuple[str, bytes]]) -> List[bytes]:
+        response = self._call(
+            {
+                "op": "sign",
+                "items": [{"kind": kind, "data": base64.b64encode(data).decode("ascii")} for kind, data in items],
+            }
+        )
+        return [base64.b64decode(signature) for signature in response["signatures"]]
+
+    def check_passphrase(self) -> bool:
+        """
+        Check the passphrase of the key with the signing daemon
+
+        Returns:   True when the passphrase is valid
+        """
+        try:
+            return bool(self._call({"op": "check"})["valid"])
+        except PassPhraseError:
+            return False
@@ -0,0 +1,230 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, List, Optional, Set
+
+from certificate_engine.ssl.certificate import PassPhraseError
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.signer import KeySigner
+
+LABEL_RE = re.compile(r"^[0-9A-Za-z_.-]+$")
+
+# Cost parameters of the hash of the passphrases, checked once per session
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+class TokenError(RuntimeError):
+    """
+    The soft token could not be used
+    """
+
+
+def _hash_passphrase(passphrase: Optional[str], salt: bytes) -> bytes:
+    return hashlib.scrypt((passphrase or "").encode("utf-8"), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+
+
+class SoftToken(object):
+    """
+    Software token storing private keys in a directory, in the way of a PKCS#11 token like SoftHSM.
+
+    Every key has a label and is stored encrypted with the PIN of the token. Next to the key, a hash of
+    the passphrase callers have to provide to use the key is stored. Keys are used through a session,
+    which decrypts the keys once and keeps them in memory until the session is closed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, label: str, extension: str) -> str:
+        if not LABEL_RE.match(label):
+            raise TokenError(f"Invalid label '{label}'")
+        return os.path.join(self.path, f"{label}.{extension}")
+
+    def _write(self, path: str, data: str) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def labels(self) -> List[str]:
+        """
+        Returns:   The labels of the keys in the token
+        """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name[: -len(".key")] for name in os.listdir(self.path) if name.endswith(".key"))
+
+    def __contains__(self, label: str) -> bool:
+        return os.path.exists(self._file(label, "key"))
+
+    def import_key(self, label: str, key: Key, pin: str, passphrase: Optional[str]) -> None:
+        """
+        Store a key in the token, replacing a key with the same label
+
+        Arguments: label - The label of the key, i.e. the id of the certificate
+                   key - The decrypted key
+                   pin - The PIN of the token
+                   passphrase - The passphrase to use the key
+        """
+        if not pin:
+            raise TokenError("A PIN is required to store keys")
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        salt = os.urandom(16)
+        self._write(
+            self._file(label, "json"),
+            json.dumps({"salt": salt.hex(), "passphrase": _hash_passphrase(passphrase, salt).hex()}),
+        )
+        self._write(self._file(label, "key"), key.serialize(pin))
+
+    def delete_key(self, label: str) -> None:
+        """
+        Remove a key from the token
+
+        Arguments: label - The label of the key
+        """
+        for extension in ["key", "json"]:
+            try:
+                os.unlink(self._file(label, extension))
+            except FileNotFoundError:
+                pass
+
+    def open_session(self, pin: str) -> "SoftTokenSession":
+        """
+        Log in to the token, which decrypts all keys of the token
+
+        Arguments: pin - The PIN of the token
+        Returns:   The session
+        """
+        return SoftTokenSession(self, pin)
+
+
+class SoftTokenSession(object):
+    """
+    Logged in session of a soft token, keeping the decrypted keys of the token in memory
+    """
+
+    def __init__(self, token: SoftToken, pin: str):
+        self.token = token
+        self._pin = pin
+        self._lock = threading.Lock()
+        self._keys: Dict[str, Key] = {}
+        self._passphrases: Dict[str, Dict[str, str]] = {}
+        self._secret = os.urandom(32)
+        self._verified: Set[bytes] = set()
+        for label in token.labels():
+            self._load(label)
+
+    def _load(self, label: str) -> None:
+        with open(self.token._file(label, "key")) as f:
+            pem = f.read()
+        with open(self.token._file(label, "json")) as f:
+            passphrase = json.load(f)
+        try:
+            key = Key().load(pem, self._pin)
+        except (ValueError, TypeError):
+            raise TokenError("Invalid PIN for token")
+        self._keys[label] = key
+        self._passphrases[label] = passphrase
+
+    def _get_key(self, label: str) -> Key:
+        with self._lock:
+            key = self._keys.get(label)
+            if key is None and label in self.token:
+                # Imported after the session has been opened
+                self._load(label)
+                key = self._keys[label]
+        if key is None:
+            raise TokenError(f"No key with label '{label}' in token")
+        return key
+
+    def __contains__(self, label: str) -> bool:
+        return label in self._keys or label in self.token
+
+    def check_passphrase(self, label: str, passphrase: Optional[str]) -> bool:
+        """
+        Check the passphrase of a key, the slow hash is only computed for the first use of a passphrase
+
+        Arguments: label - The label of the key
+                   passphrase - The passphrase of the key
+        Returns:   True when the passphrase is valid
+        """
+        self._get_key(label)
+        digest = hmac.new(self._secret, f"{label}\0{passphrase or ''}".encode("utf-8"), hashlib.sha256).digest()
+        with self._lock:
+            if digest in self._verified:
+                return True
+            stored = self._passphrases[label]
+        valid = hmac.compare_digest(
+            _hash_passphrase(passphrase, bytes.fromhex(stored["salt"])), bytes.fromhex(stored["passphrase"])
+        )
+        if valid:
+            with self._lock:
+                self._verified.add(digest)
+        return valid
+
+    def signer(self, label: str, passphrase: Optional[str]) -> "TokenSigner":
+        """
+        Get the signer of a key
+
+        Arguments: label - The label of the key
+                   passphrase - The passphrase of the key
+        Returns:   The signer
+        """
+        if not self.check_passphrase(label, passphrase):
+            raise PassPhraseError("Bad passphrase, could not decode issuer key")
+        return TokenSigner(self._get_key(label))
+
+    def close(self) -> None:
+        """
+        Log out, removing the decrypted keys from memory
+        """
+        with self._lock:
+            self._keys.clear()
+            self._verified.clear()
+
+
+class TokenSigner(KeySigner):
+    """
+    Signs with a key of a soft token session, the key stays in the session
+    """
+
+
+_sessions: Dict[str, SoftTokenSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(path: str, pin: str) -> SoftTokenSession:
+    """
+    Get the session of the soft token of this process, the token is logged in on first use
+
+    Arguments: path - The directory of the token
+               pin - The PIN of the token
+    Returns:   The session
+    """
+    with _sessions_lock:
+        session = _sessions.get(path)
+        if session is None:
+            session = _sessions[path] = SoftToken(path).open_session(pin)
+        return session
+
+
+def close_sessions() -> None:
+    """
+    Close the sessions of this process
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,87 @@
+import datetime
+from unittest import mock
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.x509.oid import NameOID
+from django.test import SimpleTestCase
+
+from certificate_engine.ssl.certificate_cache import CertificateCache
+
+
+def make_pem(common_name):
+    key = ed25519.Ed25519PrivateKey.generate()
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    crt = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, None)
+    )
+    return crt.public_bytes(serialization.Encoding.PEM).decode("utf8")
+
+
+class CertificateCacheTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pems = [make_pem(f"cert{i}") for i in range(3)]
+
+    def setUp(self):
+        self.cache = CertificateCache(2)
+
+    def test_invalid_size(self):
+        with self.assertRaisesMessage(ValueError, "Size of certificate cache should not be negative"):
+            CertificateCache(-1)
+
+    def test_load(self):
+        crt = self.cache.load(self.pems[0])
+        self.assertEqual(crt.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value, "cert0")
+        self.assertIs(self.cache.load(self.pems[0]), crt)
+        self.assertIn(self.pems[0], self.cache)
+        self.assertEqual(self.cache.stats(), {"size": 2, "entries": 1, "hits": 1, "misses": 1, "evictions": 0})
+
+    def test_parsed_once(self):
+        with mock.patch(
+            "certificate_engine.ssl.certificate_cache.x509.load_pem_x509_certificate",
+            wraps=x509.load_pem_x509_certificate,
+        ) as load:
+            for _ in range(5):
+                self.cache.load(self.pems[0])
+                self.cache.load(self.pems[1])
+        self.assertEqual(load.call_count, 2)
+
+    def test_least_recently_used_evicted(self):
+        self.cache.load(self.pems[0])
+        self.cache.load(self.pems[1])
+        self.cache.load(self.pems[0])
+        self.cache.load(self.pems[2])
+        self.assertIn(self.pems[0], self.cache)
+        self.assertNotIn(self.pems[1], self.cache)
+        self.assertIn(self.pems[2], self.cache)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_resize(self):
+        self.cache.load(self.pems[0])
+        self.cache.load(self.pems[1])
+        self.cache.resize(1)
+        self.assertNotIn(self.pems[0], self.cache)
+        self.assertIn(self.pems[1], self.cache)
+
+    def test_disabled(self):
+        cache = CertificateCache(0)
+        self.assertIsNotNone(cache.load(self.pems[0]))
+        self.assertNotIn(self.pems[0], cache)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_clear(self):
+        self.cache.load(self.pems[0])
+        self.cache.load(self.pems[0])
+        self.cache.clear()
+        self.assertEqual(self.cache.stats(), {"size": 2, "entries": 0, "hits": 0, "misses": 0, "evictions": 0})
@@ -120,6 +120,40 @@ class CRLClientServerTest(CertificateTestCase):
             crl.get_revoked_certificate_by_serial_number(cert.serial_number).revocation_date_utc, revoke_date
         )
 
+    def test_revocation_builder_serial_number(self):
+        timestamp = timezone.now()
+        cert, pem = self.make_server_certificate()
+        revoked_cert = revocation_builder(cert.serial_number, timestamp)
+        self.assertEqual(revoked_cert.serial_number, cert.serial_number)
+        self.assertEqual(revoked_cert.revocation_date_utc, timestamp)
+
+    def test_revocation_list_builder_crl_number(self):
+        cert, pem = self.make_server_certificate()
+        revoke_date = timezone.now().replace(microsecond=0)
+        crl = revocation_list_builder(
+            [(cert.serial_number, revoke_date)],
+            self.int_certificate,
+            crl_number=5,
+            freshest_crl_url="https://example.com/crl/int-delta.crl",
+        )
+        self.assertEqual(crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number, 5)
+        self.assertEqual(
+            crl.extensions.get_extension_for_class(x509.FreshestCRL).value[0].full_name[0].value,
+            "https://example.com/crl/int-delta.crl",
+        )
+        with self.assertRaises(x509.ExtensionNotFound):
+            crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator)
+        self.assertEqual(
+            crl.get_revoked_certificate_by_serial_number(cert.serial_number).revocation_date_utc, revoke_date
+        )
+
+    def test_revocation_list_builder_delta_crl(self):
+        crl = revocation_list_builder([], self.int_certificate, crl_number=6, delta_crl_indicator=5)
+        self.assertEqual(crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number, 6)
+        delta_crl_indicator = crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator)
+        self.assertTrue(delta_crl_indicator.critical)
+        self.assertEqual(delta_crl_indicator.value.crl_number, 5)
+
     def test_revocation_list_builder_one_cert_passphrase(self):
         subject = DistinguishedNameFactory(
             countryName=self.root_certificate.dn.countryName,
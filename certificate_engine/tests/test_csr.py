@@ -0,0 +1,104 @@
+# coding: utf-8
+from ipaddress import IPv4Address
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import dsa, ec, ed25519, rsa
+from cryptography.x509.oid import NameOID
+from django.test import SimpleTestCase, TestCase
+
+from certificate_engine.ssl.certificate import Certificate, CertificateError
+from certificate_engine.ssl.csr import get_csr_subject, load_csr
+from certificate_engine.ssl.key import Key, get_public_key_parameters
+from certificate_engine.tests.test_ecdsa_key import EcdsaCertificateTestMixin
+from x509_pki.tests.factories import CertificateFactory
+
+
+def make_csr(key, subject, alt_names=None):
+    builder = x509.CertificateSigningRequestBuilder().subject_name(subject)
+    if alt_names:
+        builder = builder.add_extension(x509.SubjectAlternativeName(alt_names), critical=False)
+    return builder.sign(key, None if isinstance(key, ed25519.Ed25519PrivateKey) else hashes.SHA256())
+
+
+class CsrTest(SimpleTestCase):
+    def setUp(self):
+        self.key = ed25519.Ed25519PrivateKey.generate()
+
+    def test_load_csr(self):
+        csr = make_csr(self.key, x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "www.repleo.nl")]))
+        loaded = load_csr(csr.public_bytes(serialization.Encoding.PEM).decode("utf8"))
+        self.assertEqual(loaded.public_key(), self.key.public_key())
+
+    def test_load_invalid_csr(self):
+        with self.assertRaisesMessage(CertificateError, "Could not load certificate signing request"):
+            load_csr("-----BEGIN CERTIFICATE REQUEST-----\nAAAA\n-----END CERTIFICATE REQUEST-----\n")
+
+    def test_load_csr_invalid_signature(self):
+        csr = make_csr(self.key, x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "www.repleo.nl")]))
+        der = bytearray(csr.public_bytes(serialization.Encoding.DER))
+        der[-1] ^= 0xFF
+        pem = x509.load_der_x509_csr(bytes(der)).public_bytes(serialization.Encoding.PEM).decode("utf8")
+        with self.assertRaisesMessage(CertificateError, "Signature of certificate signing request is not valid"):
+            load_csr(pem)
+
+    def test_get_csr_subject(self):
+        subject = x509.Name(
+            [
+                x509.NameAttribute(NameOID.COUNTRY_NAME, "NL"),
+                x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "Noord Holland"),
+                x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Repleo"),
+                x509.NameAttribute(NameOID.COMMON_NAME, "www.repleo.nl"),
+                x509.NameAttribute(NameOID.EMAIL_ADDRESS, "info@repleo.nl"),
+            ]
+        )
+        alt_names = [
+            x509.DNSName("www.repleo.nl"),
+            x509.IPAddress(IPv4Address("192.168.1.1")),
+            x509.RFC822Name("info@repleo.nl"),
+            x509.UniformResourceIdentifier("https://www.repleo.nl"),
+        ]
+        self.assertEqual(
+            get_csr_subject(make_csr(self.key, subject, alt_names)),
+            {
+                "countryName": "NL",
+                "stateOrProvinceName": "Noord Holland",
+                "organizationName": "Repleo",
+                "commonName": "www.repleo.nl",
+                "emailAddress": "info@repleo.nl",
+                "subjectAltNames": ["www.repleo.nl", "192.168.1.1", "info@repleo.nl"],
+            },
+        )
+
+    def test_get_public_key_parameters(self):
+        self.assertEqual(get_public_key_parameters(self.key.public_key()), ("ed25519", None))
+        key = ec.generate_private_key(ec.SECP384R1())
+        self.assertEqual(get_public_key_parameters(key.public_key()), ("ecdsa", 384))
+        key = rsa.generate_private_key(65537, 2048)
+        self.assertEqual(get_public_key_parameters(key.public_key()), ("rsa", 2048))
+
+        with self.assertRaisesMessage(ValueError, "Curve secp256k1 not supported for ECDSA keys"):
+            get_public_key_parameters(ec.generate_private_key(ec.SECP256K1()).public_key())
+        with self.assertRaisesMessage(ValueError, "Key type DSAPublicKey not supported"):
+            get_public_key_parameters(dsa.generate_private_key(2048).public_key())
+
+
+class CsrCertificateTest(EcdsaCertificateTestMixin, TestCase):
+    def setUp(self):
+        self.make_authorities()
+
+    def test_create_certificate_for_public_key(self):
+        public_key = ec.generate_private_key(ec.SECP256R1()).public_key()
+        crt = Certificate().create_certificate(self.make_server_request("www.repleo.nl"), public_key).certificate
+        crt.verify_directly_issued_by(x509.load_pem_x509_certificate(self.int_certificate.keystore.crt.encode("utf8")))
+        self.assertEqual(crt.public_key(), public_key)
+        self.assertEqual(
+            crt.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value,
+            x509.SubjectKeyIdentifier.from_public_key(public_key),
+        )
+
+    def test_create_root_certificate_for_public_key(self):
+        root_certificate = CertificateFactory(name="test_csr_root_certificate")
+        public_key = Key().create_key("ed25519", None).key.public_key()
+        with self.assertRaisesMessage(CertificateError, "The private key is required to self-sign a root certificate"):
+            Certificate().create_certificate(root_certificate, public_key)
@@ -0,0 +1,184 @@
+# coding: utf-8
+import os
+import time
+from unittest import skipUnless
+
+import arrow
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import pkcs12
+from django.db.models import signals
+from django.test import TestCase
+from django.utils import timezone
+from factory.django import mute_signals
+
+from certificate_engine.ssl.certificate import Certificate
+from certificate_engine.ssl.crl import revocation_list_builder
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.signer import KeySigner
+from certificate_engine.tests.test_signing_daemon import LocalTbsSigner, certificate_builder
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import KeyStore
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory
+
+
+class KeyEcdsaTest(TestCase):
+    def test_generate_private_key(self):
+        for key_size, curve in [(256, ec.SECP256R1), (384, ec.SECP384R1)]:
+            keyhandler = Key()
+            keyhandler.create_key("ecdsa", key_size)
+            self.assertIsInstance(keyhandler.key, ec.EllipticCurvePrivateKey)
+            self.assertIsInstance(keyhandler.key.curve, curve)
+            data = b"testdata"
+            signature = keyhandler.key.sign(data, ec.ECDSA(hashes.SHA256()))
+            # would throw InvalidSignature if not correct
+            keyhandler.key.public_key().verify(signature, data, ec.ECDSA(hashes.SHA256()))
+
+    def test_generate_private_key_unsupported_size(self):
+        with self.assertRaisesMessage(ValueError, "Key size 521 not supported for ECDSA keys, use 256 or 384"):
+            Key().create_key("ecdsa", 521)
+        with self.assertRaisesMessage(ValueError, "Key size None not supported for ECDSA keys, use 256 or 384"):
+            Key().create_key("ecdsa", None)
+
+    def test_serialize_keys_passphrase(self):
+        key = Key()
+        key.create_key("ecdsa", 256)
+        pem = key.serialize("test_store_keys_passphrase")
+        prvkey = key.load(pem, "test_store_keys_passphrase")
+        self.assertIsInstance(prvkey.key, ec.EllipticCurvePrivateKey)
+
+    def test_check_passphrase(self):
+        key = Key()
+        key.create_key("ecdsa", 384)
+        pem = key.serialize("check_passphrase")
+        self.assertTrue(key.check_passphrase(pem, "check_passphrase"))
+        self.assertFalse(key.check_passphrase(pem, "test_check_passphrase_invalid"))
+
+    def test_signature_hash(self):
+        for key_size, algorithm in [(256, hashes.SHA256), (384, hashes.SHA384)]:
+            key = Key().create_key("ecdsa", key_size)
+            certificate = KeySigner(key).sign_certificate(certificate_builder(key.key.public_key()))
+            self.assertIsInstance(certificate.signature_hash_algorithm, algorithm)
+
+            # The throwaway key of the signer of the signing daemon has to produce the same signature algorithm
+            certificate = LocalTbsSigner(key.key).sign_certificate(certificate_builder(key.key.public_key()))
+            self.assertIsInstance(certificate.signature_hash_algorithm, algorithm)
+            key.key.public_key().verify(certificate.signature, certificate.tbs_certificate_bytes, ec.ECDSA(algorithm()))
+
+
+class EcdsaCertificateTestMixin:
+    def make_authorities(self):
+        self.root_key = Key().create_key("ecdsa", 384)
+        self.root_certificate = CertificateFactory(
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord Holland",
+                organizationName="Repleo",
+                commonName="BounCA test CA",
+            ),
+            name="test_ecdsa_root_certificate",
+            expires_at=arrow.get(timezone.now()).shift(days=+30).date(),
+        )
+        with mute_signals(signals.post_save):
+            self.root_certificate.save()
+        root_certhandler = Certificate()
+        root_certhandler.create_certificate(self.root_certificate, self.root_key)
+        KeyStore(
+            certificate=self.root_certificate, crt=root_certhandler.serialize(), key=self.root_key.serialize()
+        ).save()
+
+        self.int_key = Key().create_key("ecdsa", 384)
+        self.int_certificate = CertificateFactory(
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord Holland",
+                organizationName="Repleo",
+                commonName="BounCA test Int CA",
+            ),
+            name="test_ecdsa_intermediate_certificate",
+            type=CertificateTypes.INTERMEDIATE,
+            parent=self.root_certificate,
+            expires_at=arrow.get(timezone.now()).shift(days=+5).date(),
+        )
+        with mute_signals(signals.post_save):
+            self.int_certificate.save()
+        int_certhandler = Certificate()
+        int_certhandler.create_certificate(self.int_certificate, self.int_key)
+        KeyStore(certificate=self.int_certificate, crt=int_certhandler.serialize(), key=self.int_key.serialize()).save()
+
+    def make_server_request(self, name):
+        certificate = CertificateFactory(
+            type=CertificateTypes.SERVER_CERT,
+            name=name,
+            parent=self.int_certificate,
+            dn=DistinguishedNameFactory(commonName=name, subjectAltNames=[name]),
+            crl_distribution_url=None,
+            ocsp_distribution_host=None,
+            expires_at=arrow.get(timezone.now()).shift(days=+3).date(),
+        )
+        with mute_signals(signals.post_save):
+            certificate.save()
+        return certificate
+
+
+class EcdsaCertificateTest(EcdsaCertificateTestMixin, TestCase):
+    def setUp(self):
+        self.make_authorities()
+
+    def test_certificate_chain(self):
+        key = Key().create_key("ecdsa", 256)
+        crt = Certificate().create_certificate(self.make_server_request("www.repleo.nl"), key).certificate
+        root_crt = x509.load_pem_x509_certificate(self.root_certificate.keystore.crt.encode("utf8"))
+        int_crt = x509.load_pem_x509_certificate(self.int_certificate.keystore.crt.encode("utf8"))
+
+        int_crt.verify_directly_issued_by(root_crt)
+        crt.verify_directly_issued_by(int_crt)
+        self.assertIsInstance(int_crt.signature_hash_algorithm, hashes.SHA384)
+        self.assertIsInstance(crt.signature_hash_algorithm, hashes.SHA384)
+        self.assertIsInstance(crt.public_key(), ec.EllipticCurvePublicKey)
+        self.assertEqual(crt.public_key().curve.name, "secp256r1")
+
+    def test_revocation_list(self):
+        crl = revocation_list_builder([(1234, timezone.now())], self.int_certificate, issuer_key=self.int_key)
+        int_crt = x509.load_pem_x509_certificate(self.int_certificate.keystore.crt.encode("utf8"))
+        self.assertTrue(crl.is_signature_valid(int_crt.public_key()))
+        self.assertIsInstance(crl.signature_hash_algorithm, hashes.SHA384)
+        self.assertIsNotNone(crl.get_revoked_certificate_by_serial_number(1234))
+
+    def test_serialize_pkcs12(self):
+        key = Key().create_key("ecdsa", 256)
+        crt = Certificate().create_certificate(self.make_server_request("www.repleo.nl"), key).certificate
+        data = key.serialize_pkcs12("www.repleo.nl", crt, "welkom")
+        pkcs12_key, pkcs12_crt, _ = pkcs12.load_key_and_certificates(data, b"welkom")
+        self.assertIsInstance(pkcs12_key, ec.EllipticCurvePrivateKey)
+        self.assertEqual(pkcs12_key.private_numbers(), key.key.private_numbers())
+        self.assertEqual(pkcs12_crt, crt)
+
+
+@skipUnless(os.environ.get("BOUNCA_BENCHMARK"), "set BOUNCA_BENCHMARK to run the benchmarks")
+class IssuanceBenchmarkTest(EcdsaCertificateTestMixin, TestCase):
+    number = 20
+
+    def setUp(self):
+        self.make_authorities()
+
+    def test_issuance(self):
+        # Key generation and signing of server certificates, with authorities of the same algorithm
+        for key_algorithm, authority_size, leaf_size in [
+            ("rsa", 4096, 2048),
+            ("ecdsa", 384, 256),
+            ("ecdsa", 256, 256),
+            ("ed25519", None, None),
+        ]:
+            issuer_key = Key().create_key(key_algorithm, authority_size)
+            requests = [self.make_server_request(f"{key_algorithm}-{authority_size}-{i}") for i in range(self.number)]
+            start = time.perf_counter()
+            for request in requests:
+                key = Key().create_key(key_algorithm, leaf_size)
+                Certificate().create_certificate(request, key, issuer_key=issuer_key)
+            seconds = time.perf_counter() - start
+            print(
+                f"issuance {key_algorithm} {authority_size}/{leaf_size}: {self.number / seconds:.1f} certificates/s "
+                f"({seconds / self.number * 1000:.1f}ms per certificate)"
+            )
@@ -0,0 +1,130 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock, skipIf
+
+import arrow
+from django.test import TestCase
+from django.utils import timezone
+
+from certificate_engine.ssl.info import get_certificate_fingerprint, get_certificate_info
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+def openssl_x509(crt, *args):
+    f = tempfile.NamedTemporaryFile(delete=False)
+    path = f.name
+    f.write(crt.encode("utf8"))
+    f.close()
+    try:
+        return subprocess.check_output(["openssl", "x509", *args, "-noout", "-in", path]).decode("utf8")
+    finally:
+        os.unlink(path)
+
+
+@skipIf(shutil.which("openssl") is None, "openssl command line tool not available")
+class CertificateInfoOpensslCompatibilityTest(TestCase):
+    """
+    The in-process certificate info should be equal to the output of the openssl command line tool
+    """
+
+    key_algorithm = "rsa"
+
+    @classmethod
+    def setUpTestData(cls):
+        with mock.patch("x509_pki.models.settings.KEY_ALGORITHM", cls.key_algorithm):
+            cls.certificates = cls.make_certificates()
+
+    @classmethod
+    def make_certificates(cls):
+        owner = UserFactory.create(username=f"info_{cls.key_algorithm}")
+        root = CertificateFactory(
+            type=CertificateTypes.ROOT,
+            name=f"info root {cls.key_algorithm}",
+            owner=owner,
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                localityName="Amsterdam",
+                organizationName="Repleo, Inc",
+                organizationalUnitName="IT Department",
+                emailAddress="info@repleo.nl",
+                commonName="ca.bounca.org",
+            ),
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+        )
+        root.save()
+        intermediate = CertificateFactory(
+            type=CertificateTypes.INTERMEDIATE,
+            name=f"info intermediate {cls.key_algorithm}",
+            owner=owner,
+            parent=root,
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo, Inc",
+                commonName="int.bounca.org",
+            ),
+            crl_distribution_url="https://example.com/crl/int.crl",
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+        )
+        intermediate.save()
+        certificates = [root, intermediate]
+        for cert_type, subject_alt_names in [
+            (CertificateTypes.SERVER_CERT, ["www.repleo.nl", "127.0.0.1"]),
+            (CertificateTypes.CLIENT_CERT, ["info@repleo.nl"]),
+            (CertificateTypes.CODE_SIGNING_CERT, ["code.repleo.nl"]),
+            (CertificateTypes.OCSP, ["ocsp.repleo.nl"]),
+        ]:
+            certificate = CertificateFactory(
+                type=cert_type,
+                name=f"info {cert_type} {cls.key_algorithm}",
+                owner=owner,
+                parent=intermediate,
+                expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+                dn=DistinguishedNameFactory(
+                    commonName=f"{cert_type.lower()}.bounca.org",
+                    organizationalUnitName="Ops + Dev",
+                    subjectAltNames=subject_alt_names,
+                ),
+                crl_distribution_url=None,
+                ocsp_distribution_host=None,
+                passphrase_issuer="welkom1234",
+            )
+            certificate.save()
+            certificates.append(certificate)
+        return [Certificate.objects.get(pk=c.pk) for c in certificates]
+
+    def test_certificate_info(self):
+        for certificate in self.certificates:
+            with self.subTest(type=certificate.type):
+                self.assertEqual(
+                    get_certificate_info(certificate.keystore.crt), openssl_x509(certificate.keystore.crt, "-text")
+                )
+
+    def test_certificate_fingerprint(self):
+        for certificate in self.certificates:
+            with self.subTest(type=certificate.type):
+                self.assertEqual(
+                    get_certificate_fingerprint(certificate.keystore.crt),
+                    openssl_x509(certificate.keystore.crt, "-fingerprint", "-sha1").split("=")[1].strip(),
+                )
+                self.assertEqual(
+                    certificate.keystore.fingerprint, get_certificate_fingerprint(certificate.keystore.crt)
+                )
+
+
+class CertificateInfoOpensslCompatibilityEd25519Test(CertificateInfoOpensslCompatibilityTest):
+    key_algorithm = "ed25519"
+
+
+class CertificateInfoOpensslCompatibilityEcdsaTest(CertificateInfoOpensslCompatibilityTest):
+    key_algorithm = "ecdsa"
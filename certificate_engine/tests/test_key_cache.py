@@ -0,0 +1,70 @@
+import time
+
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from django.test import SimpleTestCase
+
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.key_cache import KeyCache
+
+
+class KeyCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = KeyCache(idle_timeout=60)
+        self.key = Key(ed25519.Ed25519PrivateKey.generate())
+
+    def test_invalid_idle_timeout(self):
+        with self.assertRaisesMessage(ValueError, "Idle timeout of key cache should be positive"):
+            KeyCache(idle_timeout=0)
+
+    def test_get(self):
+        self.cache.put(1, "welkom123", self.key, 60)
+        key = self.cache.get(1, "welkom123")
+        self.assertEqual(key.key.public_key(), self.key.key.public_key())
+        # The parsed key is cached
+        self.assertIs(self.cache.get(1, "welkom123"), key)
+        self.assertIsNone(self.cache.get(2, "welkom123"))
+
+    def test_get_wrong_passphrase(self):
+        self.cache.put(1, "welkom123", self.key, 60)
+        self.assertIsNone(self.cache.get(1, "welkom1234"))
+        self.assertIsNone(self.cache.get(1, None))
+        self.assertIn(1, self.cache)
+
+    def test_evict(self):
+        self.cache.put(1, "welkom123", self.key, 60)
+        self.cache.evict(1)
+        self.assertNotIn(1, self.cache)
+        self.assertIsNone(self.cache.get(1, "welkom123"))
+
+    def test_deadline(self):
+        self.cache.put(1, "welkom123", self.key, 0.1)
+        time.sleep(0.3)
+        self.assertNotIn(1, self.cache)
+
+    def test_sweeper(self):
+        self.cache.put(1, "welkom123", self.key, 0.1)
+        sweeper = self.cache._sweeper
+        self.cache.put(2, "welkom123", self.key, 0.2)
+        # One sweeper for all keys, which evicts them without being accessed
+        self.assertIs(self.cache._sweeper, sweeper)
+        sweeper.join(1)
+        self.assertFalse(sweeper.is_alive())
+        self.assertEqual(self.cache._keys, {})
+        self.assertIsNone(self.cache._sweeper)
+
+    def test_idle_timeout(self):
+        cache = KeyCache(idle_timeout=0.2)
+        cache.put(1, "welkom123", self.key, 60)
+        time.sleep(0.1)
+        self.assertIsNotNone(cache.get(1, "welkom123"))
+        time.sleep(0.15)
+        self.assertIsNotNone(cache.get(1, "welkom123"))
+        time.sleep(0.4)
+        self.assertNotIn(1, cache)
+        self.assertIsNone(cache.get(1, "welkom123"))
+
+    def test_put_replaces_key(self):
+        self.cache.put(1, "welkom123", self.key, 60)
+        self.cache.put(1, "welkom1234", Key(ed25519.Ed25519PrivateKey.generate()), 60)
+        self.assertIsNone(self.cache.get(1, "welkom123"))
+        self.assertIsNotNone(self.cache.get(1, "welkom1234"))
@@ -0,0 +1,150 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from django.test import TestCase
+
+from certificate_engine.ssl.key import Key, generate_private_key
+from certificate_engine.ssl.key_pool import KeyPool, create_keys
+
+
+class KeyPoolTest(TestCase):
+    def setUp(self):
+        self.pool = KeyPool(2, executor=ThreadPoolExecutor(max_workers=2))
+
+    def tearDown(self):
+        self.pool.shutdown()
+        Key.pool = None
+
+    def test_invalid_watermark(self):
+        with self.assertRaisesMessage(ValueError, "Watermark of key pool should be at least 1"):
+            KeyPool(0)
+
+    def test_pop_empty_pool(self):
+        self.assertIsNone(self.pool.pop("ed25519", None))
+        self.pool.wait()
+        self.assertEqual(self.pool.depth("ed25519", None), 2)
+        self.assertDictEqual(
+            self.pool.stats(), {"ed25519": {"depth": 2, "pending": 0, "hits": 0, "misses": 1, "errors": 0}}
+        )
+
+    def test_pop_refilled_pool(self):
+        self.pool.refill("ed25519", None)
+        self.pool.wait()
+        key = self.pool.pop("ed25519", None)
+        self.assertIsInstance(key, ed25519.Ed25519PrivateKey)
+        self.pool.wait()
+        self.assertDictEqual(
+            self.pool.stats(), {"ed25519": {"depth": 2, "pending": 0, "hits": 1, "misses": 0, "errors": 0}}
+        )
+
+    def test_pop_keys_unique(self):
+        self.pool.refill("ed25519", None)
+        self.pool.wait()
+        key1 = self.pool.pop("ed25519", None)
+        key2 = self.pool.pop("ed25519", None)
+        self.assertNotEqual(key1.public_key(), key2.public_key())
+
+    def test_pop_per_key_type(self):
+        self.pool.refill("rsa", 2048)
+        self.pool.wait()
+        self.assertEqual(self.pool.depth("rsa", 2048), 2)
+        self.assertEqual(self.pool.depth("rsa", 4096), 0)
+        key = self.pool.pop("rsa", 2048)
+        self.assertIsInstance(key, rsa.RSAPrivateKey)
+        self.assertEqual(key.key_size, 2048)
+
+    def test_generation_error(self):
+        self.pool.refill("dsa", 2048)
+        self.pool.wait()
+        self.assertDictEqual(
+            self.pool.stats(), {"dsa-2048": {"depth": 0, "pending": 0, "hits": 0, "misses": 0, "errors": 2}}
+        )
+
+    def test_create_key_from_pool(self):
+        self.pool.refill("ed25519", None)
+        self.pool.wait()
+        Key.pool = self.pool
+        keyhandler = Key().create_key("ed25519", None)
+        self.assertIsInstance(keyhandler.key, ed25519.Ed25519PrivateKey)
+        self.assertEqual(self.pool.stats()["ed25519"]["hits"], 1)
+
+    def test_create_key_empty_pool(self):
+        Key.pool = self.pool
+        keyhandler = Key().create_key("ed25519", None)
+        self.assertIsInstance(keyhandler.key, ed25519.Ed25519PrivateKey)
+        self.assertEqual(self.pool.stats()["ed25519"]["misses"], 1)
+
+    def test_process_pool(self):
+        pool = KeyPool(1, max_workers=1)
+        try:
+            pool.refill("ed25519", None)
+            pool.wait()
+            self.assertIsInstance(pool.pop("ed25519", None), ed25519.Ed25519PrivateKey)
+        finally:
+            pool.shutdown()
+
+    def test_create_keys(self):
+        keys = create_keys("rsa", 2048, 3, max_workers=2)
+        self.assertEqual(len(keys), 3)
+        for key in keys:
+            self.assertIsInstance(key, Key)
+            self.assertIsInstance(key.key, rsa.RSAPrivateKey)
+            self.assertEqual(key.key.key_size, 2048)
+        self.assertEqual(len({key.key.public_key().public_numbers().n for key in keys}), 3)
+
+    def test_create_keys_pool_executor(self):
+        # Keys missing in the pool are generated by the workers of the pool, no worker processes are started
+        Key.pool = self.pool
+        with patch("certificate_engine.ssl.key_pool.ProcessPoolExecutor") as process_pool_executor:
+            keys = create_keys("rsa", 2048, 3)
+        process_pool_executor.assert_not_called()
+        self.assertEqual(len({key.key.public_key().public_numbers().n for key in keys}), 3)
+
+    def test_create_keys_from_pool(self):
+        self.pool.refill("ed25519", None)
+        self.pool.wait()
+        Key.pool = self.pool
+        keys = create_keys("ed25519", None, 3)
+        self.assertEqual(len(keys), 3)
+        # Refills run in the background, the third key is either a refilled key or generated directly
+        stats = self.pool.stats()["ed25519"]
+        self.assertGreaterEqual(stats["hits"], 2)
+        self.assertEqual(stats["hits"] + stats["misses"], 3)
+
+
+@skipUnless(os.environ.get("BOUNCA_BENCHMARK"), "set BOUNCA_BENCHMARK to run the benchmarks")
+class KeyPoolBenchmarkTest(TestCase):
+    number = 20
+
+    def tearDown(self):
+        Key.pool = None
+
+    def test_create_key(self):
+        # Latency of taking a key from a filled pool, compared to generating the key synchronously
+        for key_algorithm, key_size in [("rsa", 2048), ("rsa", 4096), ("ecdsa", 256), ("ed25519", None)]:
+            start = time.perf_counter()
+            for _ in range(self.number):
+                generate_private_key(key_algorithm, key_size)
+            synchronous = (time.perf_counter() - start) / self.number
+
+            Key.pool = KeyPool(self.number)
+            try:
+                Key.pool.refill(key_algorithm, key_size)
+                Key.pool.wait()
+                start = time.perf_counter()
+                for _ in range(self.number):
+                    Key().create_key(key_algorithm, key_size)
+                pooled = (time.perf_counter() - start) / self.number
+                self.assertEqual(
+                    Key.pool.stats()[f"{key_algorithm}-{key_size}" if key_size else key_algorithm]["misses"], 0
+                )
+            finally:
+                Key.pool.shutdown()
+            print(
+                f"create key {key_algorithm} {key_size}: synchronous {synchronous * 1000:.2f}ms, "
+                f"pooled {pooled * 1000:.3f}ms per key"
+            )
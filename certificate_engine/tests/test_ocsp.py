@@ -0,0 +1,105 @@
+# coding: utf-8
+import datetime
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import NameOID
+from django.test import SimpleTestCase
+
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.ocsp import (
+    get_issuer_hashes,
+    load_ocsp_request,
+    ocsp_error_response,
+    ocsp_response_builder,
+)
+
+
+def make_certificate(common_name, key, issuer=None, issuer_key=None):
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    return (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(issuer.subject if issuer else subject)
+        .public_key(key.key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .sign((issuer_key or key).key, hashes.SHA256())
+    )
+
+
+class OcspResponseTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.issuer_key = Key().create_key("rsa", 2048)
+        cls.issuer = make_certificate("BounCA test CA", cls.issuer_key)
+        cls.responder_key = Key().create_key("ed25519", None)
+        cls.responder = make_certificate("BounCA test OCSP", cls.responder_key, cls.issuer, cls.issuer_key)
+        cls.certificate = make_certificate("www.repleo.nl", Key().create_key("rsa", 2048), cls.issuer, cls.issuer_key)
+        cls.this_update = datetime.datetime.now(tz=datetime.timezone.utc).replace(microsecond=0)
+        cls.next_update = cls.this_update + datetime.timedelta(hours=24)
+
+    def make_request(self, algorithm=None):
+        builder = ocsp.OCSPRequestBuilder().add_certificate(self.certificate, self.issuer, algorithm or hashes.SHA1())
+        return builder.build()
+
+    def test_get_issuer_hashes(self):
+        request = self.make_request()
+        self.assertEqual(get_issuer_hashes(self.issuer), (request.issuer_name_hash, request.issuer_key_hash))
+
+    def test_good_response_delegated_responder(self):
+        data = ocsp_response_builder(
+            self.certificate.serial_number,
+            self.issuer,
+            self.responder,
+            self.responder_key,
+            self.this_update,
+            self.next_update,
+        )
+        response = ocsp.load_der_ocsp_response(data)
+        request = self.make_request()
+        self.assertEqual(response.response_status, ocsp.OCSPResponseStatus.SUCCESSFUL)
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.GOOD)
+        self.assertEqual(response.serial_number, self.certificate.serial_number)
+        self.assertEqual(response.issuer_key_hash, request.issuer_key_hash)
+        self.assertEqual(response.issuer_name_hash, request.issuer_name_hash)
+        self.assertEqual(response.this_update_utc, self.this_update)
+        self.assertEqual(response.next_update_utc, self.next_update)
+        self.assertEqual(response.certificates, [self.responder])
+        self.assertEqual(
+            response.responder_key_hash, x509.SubjectKeyIdentifier.from_public_key(self.responder.public_key()).digest
+        )
+        self.responder.public_key().verify(response.signature, response.tbs_response_bytes)
+
+    def test_revoked_response_signed_by_issuer(self):
+        revoked_at = self.this_update - datetime.timedelta(hours=1)
+        data = ocsp_response_builder(
+            self.certificate.serial_number,
+            self.issuer,
+            self.issuer,
+            self.issuer_key,
+            self.this_update,
+            self.next_update,
+            revoked_at=revoked_at,
+        )
+        response = ocsp.load_der_ocsp_response(data)
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+        self.assertEqual(response.revocation_time_utc, revoked_at)
+        self.assertEqual(response.certificates, [])
+        self.issuer.public_key().verify(
+            response.signature, response.tbs_response_bytes, padding.PKCS1v15(), response.signature_hash_algorithm
+        )
+
+    def test_error_response(self):
+        response = ocsp.load_der_ocsp_response(ocsp_error_response(ocsp.OCSPResponseStatus.UNAUTHORIZED))
+        self.assertEqual(response.response_status, ocsp.OCSPResponseStatus.UNAUTHORIZED)
+
+    def test_load_ocsp_request(self):
+        request = load_ocsp_request(self.make_request().public_bytes(serialization.Encoding.DER))
+        self.assertEqual(request.serial_number, self.certificate.serial_number)
+        self.assertIsNone(load_ocsp_request(b"not an ocsp request"))
@@ -0,0 +1,145 @@
+# coding: utf-8
+import dataclasses
+import os
+import timeit
+from unittest import mock, skipUnless
+
+import arrow
+from cryptography import x509
+from django.test import TestCase
+from django.utils import timezone
+
+from certificate_engine.ssl.certificate import Certificate, PolicyError, PolicyRequest
+from certificate_engine.ssl.certificate_cache import certificate_cache
+from certificate_engine.types import CertificateTypes
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+class PolicyTestMixin:
+    @classmethod
+    def make_authorities(cls):
+        cls.user = UserFactory()
+        cls.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="ca"
+            ),
+        )
+        cls.ca.save()
+        cls.int = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="int"
+            ),
+        )
+        cls.int.save()
+
+    @classmethod
+    def make_request(cls, certificate_type, common_name, parent=None, **dn):
+        return CertificateFactory.build(
+            type=certificate_type,
+            parent=parent,
+            owner=cls.user,
+            dn=DistinguishedNameFactory.build(commonName=common_name, **dn),
+        )
+
+
+class PolicyRequestTest(PolicyTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.make_authorities()
+
+    def test_from_certificate(self):
+        cert = self.make_request(
+            CertificateTypes.SERVER_CERT, "www.repleo.nl", self.int, subjectAltNames=["www.repleo.nl"]
+        )
+        request = PolicyRequest.from_certificate(cert, Certificate().load_issuer_certificate)
+        self.assertEqual(request.type, CertificateTypes.SERVER_CERT)
+        self.assertEqual(request.get("commonName"), "www.repleo.nl")
+        self.assertEqual(request.get("subjectAltNames"), ("www.repleo.nl",))
+        self.assertEqual(request.get("countryName"), cert.dn.countryName.code)
+        self.assertEqual(
+            [crt.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value for crt in request.issuers],
+            ["int", "ca"],
+        )
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            request.type = CertificateTypes.ROOT  # type: ignore[misc]
+
+    def test_issuers_parsed_once(self):
+        certificate_cache.clear()
+        certhandler = Certificate()
+        with mock.patch(
+            "certificate_engine.ssl.certificate_cache.x509.load_pem_x509_certificate",
+            wraps=x509.load_pem_x509_certificate,
+        ) as load:
+            for common_name in ["www.repleo.nl", "mail.repleo.nl"]:
+                cert = self.make_request(
+                    CertificateTypes.SERVER_CERT, common_name, self.int, subjectAltNames=[common_name]
+                )
+                certhandler.check_policies(cert)
+        self.assertEqual(load.call_count, 2)
+
+    def test_request_not_modified(self):
+        cert = self.make_request(
+            CertificateTypes.ROOT,
+            "root",
+            countryName="NL",
+            stateOrProvinceName="Noord-Holland",
+            organizationName="Repleo",
+            subjectAltNames=["root.repleo.nl"],
+        )
+        Certificate().check_policies(cert)
+        self.assertEqual(cert.dn.subjectAltNames, ["root.repleo.nl"])
+
+    def test_common_name_of_ancestor(self):
+        cert = self.make_request(CertificateTypes.SERVER_CERT, "ca", self.int, subjectAltNames=["ca"])
+        with self.assertRaisesMessage(PolicyError, "CommonName 'ca' should not be equal to common name of parent"):
+            Certificate().check_policies(cert)
+
+    def test_match_parent(self):
+        cert = self.make_request(
+            CertificateTypes.INTERMEDIATE,
+            "int2",
+            self.ca,
+            countryName="NL",
+            stateOrProvinceName="Utrecht",
+            organizationName="Repleo",
+        )
+        with self.assertRaisesMessage(
+            PolicyError,
+            "Certificate should match field 'stateOrProvinceName' (issuer certificate: Noord-Holland, "
+            "certificate: Utrecht)",
+        ):
+            Certificate().check_policies(cert)
+
+
+@skipUnless(os.environ.get("BOUNCA_BENCHMARK"), "set BOUNCA_BENCHMARK to run the benchmarks")
+class PolicyBenchmarkTest(PolicyTestMixin, TestCase):
+    number = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.make_authorities()
+
+    def test_check_policies(self):
+        dn = {"countryName": "NL", "stateOrProvinceName": "Noord-Holland", "organizationName": "Repleo"}
+        requests = {
+            "root": self.make_request(CertificateTypes.ROOT, "root", **dn),
+            "intermediate": self.make_request(CertificateTypes.INTERMEDIATE, "int2", self.ca, **dn),
+            "server": self.make_request(CertificateTypes.SERVER_CERT, "www", self.int, subjectAltNames=["www"]),
+            "client": self.make_request(CertificateTypes.CLIENT_CERT, "client", self.int, subjectAltNames=["a@b.nl"]),
+            "ocsp": self.make_request(CertificateTypes.OCSP, "ocsp", self.int, subjectAltNames=["ocsp"]),
+        }
+        for name, cert in requests.items():
+            seconds = timeit.timeit(lambda: Certificate().check_policies(cert), number=self.number)
+            print(f"check_policies {name}: {seconds / self.number * 1e6:.1f}us per certificate")
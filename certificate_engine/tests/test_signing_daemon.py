@@ -0,0 +1,286 @@
+import datetime
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, rsa
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import NameOID
+from django.test import SimpleTestCase
+
+from certificate_engine.ssl.certificate import PassPhraseError
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.ocsp import get_issuer_hashes, ocsp_response_builder
+from certificate_engine.ssl.signer import (
+    KeySigner,
+    TbsSigner,
+    _der_children,
+    _der_element,
+    _der_header,
+    sign_tbs,
+)
+from certificate_engine.ssl.signing_daemon import UNKNOWN_KEY, RemoteSigner, SigningDaemon, SigningError
+from certificate_engine.ssl.soft_token import SoftToken
+
+
+class LocalTbsSigner(TbsSigner):
+    def __init__(self, key):
+        super().__init__(key.public_key())
+        self.key = key
+
+    def sign_tbs(self, items):
+        return [sign_tbs(self.key, data) for _, data in items]
+
+
+def certificate_builder(public_key, common_name="Test CA"):
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(public_key)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+    )
+
+
+def crl_builder(revoked=0):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    builder = (
+        x509.CertificateRevocationListBuilder()
+        .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Test CA")]))
+        .last_update(now)
+        .next_update(now + datetime.timedelta(days=1))
+    )
+    for serial in range(1, revoked + 1):
+        builder = builder.add_revoked_certificate(
+            x509.RevokedCertificateBuilder().serial_number(serial).revocation_date(now).build()
+        )
+    return builder
+
+
+class TbsSignerTest(SimpleTestCase):
+    def test_key_types(self):
+        keys = [
+            rsa.generate_private_key(public_exponent=65537, key_size=2048),
+            ec.generate_private_key(ec.SECP384R1()),
+            ed25519.Ed25519PrivateKey.generate(),
+            ed448.Ed448PrivateKey.generate(),
+        ]
+        for key in keys:
+            with self.subTest(key=type(key).__name__):
+                signer = LocalTbsSigner(key)
+                crt = signer.sign_certificate(certificate_builder(key.public_key()))
+                crt.verify_directly_issued_by(crt)
+                self.assertEqual(crt.public_key(), key.public_key())
+                crl = signer.sign_crl(crl_builder(revoked=200))
+                self.assertTrue(crl.is_signature_valid(key.public_key()))
+                self.assertEqual(len(crl), 200)
+
+    def test_der_lengths(self):
+        for length in [0, 1, 127, 128, 255, 256, 65535, 65536, 2**24]:
+            with self.subTest(length=length):
+                element = _der_element(0x04, b"\x00" * length)
+                self.assertEqual(_der_header(element, 0), (len(element) - length, len(element)))
+                self.assertEqual(_der_children(_der_element(0x30, element + element)), [element, element])
+        with self.assertRaisesMessage(ValueError, "DER element exceeds the data"):
+            _der_header(_der_element(0x04, b"\x00" * 200)[:-1], 0)
+
+    def test_long_structures(self):
+        # The signed structures are rebuilt with the real signature, in short and long form lengths up to three bytes
+        keys = [
+            rsa.generate_private_key(public_exponent=65537, key_size=2048),
+            ec.generate_private_key(ec.SECP256R1()),
+            ec.generate_private_key(ec.SECP384R1()),
+            ed25519.Ed25519PrivateKey.generate(),
+        ]
+        for key in keys:
+            signer = LocalTbsSigner(key)
+            key_signer = KeySigner(Key(key))
+            length_sizes = set()
+            for size in [1, 5, 10, 5000]:
+                with self.subTest(key=type(key).__name__, size=size):
+                    builder = certificate_builder(key.public_key()).add_extension(
+                        x509.SubjectAlternativeName([x509.DNSName(f"host-{i}.repleo.nl") for i in range(size)]),
+                        critical=False,
+                    )
+                    crt = signer.sign_certificate(builder)
+                    crt.verify_directly_issued_by(crt)
+                    self.assertEqual(
+                        crt.tbs_certificate_bytes, key_signer.sign_certificate(builder).tbs_certificate_bytes
+                    )
+                    length_sizes.add(crt.tbs_certificate_bytes[1])
+
+                    builder = crl_builder(revoked=size)
+                    crl = signer.sign_crl(builder)
+                    self.assertTrue(crl.is_signature_valid(key.public_key()))
+                    self.assertEqual(crl.tbs_certlist_bytes, key_signer.sign_crl(builder).tbs_certlist_bytes)
+                    self.assertEqual(len(crl), size)
+                    length_sizes.add(crl.tbs_certlist_bytes[1])
+            self.assertTrue({0x81, 0x82, 0x83} <= length_sizes, length_sizes)
+            self.assertTrue(any(length < 0x80 for length in length_sizes), length_sizes)
+
+    def test_sign_ocsp_response(self):
+        keys = [
+            rsa.generate_private_key(public_exponent=65537, key_size=2048),
+            ec.generate_private_key(ec.SECP256R1()),
+            ed25519.Ed25519PrivateKey.generate(),
+        ]
+        for key in keys:
+            with self.subTest(key=type(key).__name__):
+                crt = KeySigner(Key(key)).sign_certificate(certificate_builder(key.public_key()))
+                now = datetime.datetime.now(datetime.timezone.utc)
+                der = ocsp_response_builder(1, crt, crt, LocalTbsSigner(key), now, now, revoked_at=now)
+                response = ocsp.load_der_ocsp_response(der)
+                self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+                expected = KeySigner(Key(key)).sign_ocsp_response(
+                    ocsp.OCSPResponseBuilder().add_response_by_hash(
+                        *get_issuer_hashes(crt),
+                        serial_number=1,
+                        algorithm=hashes.SHA1(),
+                        cert_status=ocsp.OCSPCertStatus.REVOKED,
+                        this_update=now,
+                        next_update=now,
+                        revocation_time=now,
+                        revocation_reason=None,
+                    ),
+                    crt,
+                )
+                self.assertEqual(response.tbs_response_bytes, expected.tbs_response_bytes)
+                if isinstance(key, ed25519.Ed25519PrivateKey):
+                    # Ed25519 signatures are deterministic
+                    self.assertEqual(der, expected.public_bytes(serialization.Encoding.DER))
+
+    def test_sign_certificates(self):
+        key = ec.generate_private_key(ec.SECP256R1())
+        signer = LocalTbsSigner(key)
+        builders = [certificate_builder(key.public_key(), f"Test {i}") for i in range(3)]
+        with mock.patch.object(signer, "sign_tbs", wraps=signer.sign_tbs) as sign_tbs:
+            certificates = signer.sign_certificates(builders)
+        sign_tbs.assert_called_once()
+        self.assertEqual(len(sign_tbs.call_args.args[0]), 3)
+        for i, crt in enumerate(certificates):
+            crt.verify_directly_issued_by(crt)
+            self.assertEqual(crt.subject.rfc4514_string(), f"CN=Test {i}")
+        self.assertEqual(signer.sign_certificates([]), [])
+
+    def test_same_as_key_signer(self):
+        key = ed25519.Ed25519PrivateKey.generate()
+        builder = certificate_builder(key.public_key())
+        self.assertEqual(LocalTbsSigner(key).sign_certificate(builder), KeySigner(Key(key)).sign_certificate(builder))
+
+
+class SigningDaemonTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = Key().create_key("rsa", 2048)
+        cls.pem = cls.key.serialize("welkom123")
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.socket_path = os.path.join(directory, "signing.sock")
+
+    def start_daemon(self, processes=1, add_key=True, session=None):
+        daemon = SigningDaemon(self.socket_path, processes=processes, session=session)
+        if add_key:
+            # Before the start, so it is held by all processes
+            daemon.add_key(1, self.key, "welkom123")
+        if processes > 1:
+            process = multiprocessing.get_context("fork").Process(target=daemon.serve)
+            process.start()
+            self.addCleanup(process.join)
+            self.addCleanup(process.terminate)
+        else:
+            thread = threading.Thread(target=daemon.serve, daemon=True)
+            thread.start()
+            self.addCleanup(thread.join)
+            self.addCleanup(daemon.shutdown)
+        for _ in range(100):
+            if os.path.exists(self.socket_path):
+                break
+            time.sleep(0.05)
+        return daemon
+
+    def signer(self, passphrase="welkom123", key_id=1):
+        return RemoteSigner(self.socket_path, key_id, passphrase, self.key.key.public_key())
+
+    def test_sign(self):
+        self.start_daemon()
+        crt = self.signer().sign_certificate(certificate_builder(self.key.key.public_key()))
+        crt.verify_directly_issued_by(crt)
+        crl = self.signer().sign_crl(crl_builder(revoked=10))
+        self.assertTrue(crl.is_signature_valid(self.key.key.public_key()))
+        self.assertEqual(oct(os.stat(self.socket_path).st_mode & 0o777), "0o600")
+
+    def test_sign_batch(self):
+        self.start_daemon()
+        signatures = self.signer().sign_tbs([("certificate", b"a"), ("crl", b"b"), ("certificate", b"c")])
+        self.assertEqual(len(signatures), 3)
+        self.assertEqual(signatures[2], sign_tbs(self.key.key, b"c"))
+
+    def test_bad_passphrase(self):
+        self.start_daemon()
+        with self.assertRaisesMessage(PassPhraseError, "Bad passphrase, could not decode issuer key"):
+            self.signer("wrong").sign_crl(crl_builder())
+        self.assertTrue(self.signer().check_passphrase())
+        self.assertFalse(self.signer("wrong").check_passphrase())
+
+    def test_unknown_key(self):
+        self.start_daemon(add_key=False)
+        with self.assertRaises(SigningError) as e:
+            self.signer().sign_crl(crl_builder())
+        self.assertEqual(e.exception.code, UNKNOWN_KEY)
+
+    def test_soft_token(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        token = SoftToken(directory)
+        token.import_key("2", self.key, "1234", "welkom123")
+        session = token.open_session("1234")
+        self.addCleanup(session.close)
+        self.start_daemon(add_key=False, session=session)
+        crl = self.signer(key_id=2).sign_crl(crl_builder())
+        self.assertTrue(crl.is_signature_valid(self.key.key.public_key()))
+        self.assertTrue(self.signer(key_id=2).check_passphrase())
+        self.assertFalse(self.signer("wrong", key_id=2).check_passphrase())
+        with self.assertRaisesMessage(PassPhraseError, "Bad passphrase, could not decode issuer key"):
+            self.signer("wrong", key_id=2).sign_crl(crl_builder())
+        with self.assertRaises(SigningError) as e:
+            self.signer(key_id=3).sign_crl(crl_builder())
+        self.assertEqual(e.exception.code, UNKNOWN_KEY)
+
+        # Imported while the daemon is running
+        token.import_key("3", self.key, "1234", "welkom123")
+        crl = self.signer(key_id=3).sign_crl(crl_builder())
+        self.assertTrue(crl.is_signature_valid(self.key.key.public_key()))
+
+    def test_no_unlock(self):
+        # Keys are only taken from the store of the daemon, not sent by the application
+        daemon = SigningDaemon(self.socket_path)
+        response = daemon.dispatch({"op": "unlock", "key": 1, "pem": self.pem, "passphrase": "welkom123"})
+        self.assertEqual(response["error"], "bad_request")
+
+    def test_bad_request(self):
+        daemon = SigningDaemon(self.socket_path)
+        self.assertEqual(daemon.dispatch({"op": "delete"})["error"], "bad_request")
+        self.assertEqual(daemon.dispatch({"op": "sign"})["error"], "bad_request")
+
+    def test_unavailable(self):
+        with self.assertRaisesMessage(SigningError, "Signing daemon not available"):
+            self.signer().sign_crl(crl_builder())
+
+    def test_multiple_processes(self):
+        self.start_daemon(processes=2)
+        for _ in range(5):
+            crl = self.signer().sign_crl(crl_builder())
+            self.assertTrue(crl.is_signature_valid(self.key.key.public_key()))
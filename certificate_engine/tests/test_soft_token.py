@@ -0,0 +1,103 @@
+import os
+import shutil
+import stat
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from certificate_engine.ssl import soft_token
+from certificate_engine.ssl.certificate import PassPhraseError
+from certificate_engine.ssl.key import Key
+from certificate_engine.ssl.soft_token import SoftToken, TokenError, close_sessions, get_session
+from certificate_engine.tests.test_signing_daemon import certificate_builder, crl_builder
+
+
+class SoftTokenTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "token")
+        self.token = SoftToken(self.path)
+        self.key = Key().create_key("ed25519", None)
+        self.token.import_key("1", self.key, "1234", "welkom123")
+        self.addCleanup(close_sessions)
+
+    def test_import_key(self):
+        self.assertEqual(self.token.labels(), ["1"])
+        self.assertIn("1", self.token)
+        self.assertNotIn("2", self.token)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o700)
+        with open(os.path.join(self.path, "1.key")) as f:
+            pem = f.read()
+        self.assertIn("ENCRYPTED PRIVATE KEY", pem)
+        self.assertTrue(Key.check_passphrase(pem, "1234"))
+        with open(os.path.join(self.path, "1.json")) as f:
+            self.assertNotIn("welkom123", f.read())
+
+    def test_import_key_without_pin(self):
+        with self.assertRaisesMessage(TokenError, "A PIN is required to store keys"):
+            self.token.import_key("2", self.key, "", "welkom123")
+
+    def test_invalid_label(self):
+        with self.assertRaisesMessage(TokenError, "Invalid label '../1'"):
+            self.token.import_key("../1", self.key, "1234", "welkom123")
+
+    def test_delete_key(self):
+        self.token.delete_key("1")
+        self.token.delete_key("1")
+        self.assertEqual(self.token.labels(), [])
+
+    def test_open_session_bad_pin(self):
+        with self.assertRaisesMessage(TokenError, "Invalid PIN for token"):
+            self.token.open_session("4321")
+
+    def test_sign(self):
+        session = self.token.open_session("1234")
+        signer = session.signer("1", "welkom123")
+        public_key = self.key.key.public_key()
+
+        certificate = signer.sign_certificate(certificate_builder(public_key))
+        public_key.verify(certificate.signature, certificate.tbs_certificate_bytes)
+        crl = signer.sign_crl(crl_builder(revoked=2))
+        self.assertTrue(crl.is_signature_valid(public_key))
+
+    def test_bad_passphrase(self):
+        session = self.token.open_session("1234")
+        self.assertFalse(session.check_passphrase("1", "welkom"))
+        with self.assertRaisesMessage(PassPhraseError, "Bad passphrase, could not decode issuer key"):
+            session.signer("1", "welkom")
+
+    def test_unknown_key(self):
+        session = self.token.open_session("1234")
+        self.assertNotIn("2", session)
+        with self.assertRaisesMessage(TokenError, "No key with label '2' in token"):
+            session.signer("2", "welkom123")
+
+    def test_passphrase_hashed_once(self):
+        session = self.token.open_session("1234")
+        with mock.patch("certificate_engine.ssl.soft_token._hash_passphrase", wraps=soft_token._hash_passphrase) as h:
+            for _ in range(3):
+                self.assertTrue(session.check_passphrase("1", "welkom123"))
+                self.assertFalse(session.check_passphrase("1", "welkom"))
+        # A wrong passphrase is hashed every time
+        self.assertEqual(h.call_count, 4)
+
+    def test_key_imported_in_open_session(self):
+        session = self.token.open_session("1234")
+        key = Key().create_key("rsa", 2048)
+        self.token.import_key("2", key, "1234", "welkom1234")
+        self.assertIn("2", session)
+        certificate = session.signer("2", "welkom1234").sign_certificate(certificate_builder(key.key.public_key()))
+        self.assertEqual(certificate.public_key(), key.key.public_key())
+
+    def test_close_session(self):
+        session = self.token.open_session("1234")
+        session.close()
+        self.assertEqual(session._keys, {})
+
+    def test_get_session(self):
+        session = get_session(self.path, "1234")
+        self.assertIs(get_session(self.path, "1234"), session)
+        close_sessions()
+        self.assertIsNot(get_session(self.path, "1234"), session)
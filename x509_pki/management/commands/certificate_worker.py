@@ -0,0 +1,81 @@
+import multiprocessing
+import os
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from certificate_engine.ssl.key import Key
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, claim_certificate_job, get_key_parameters, run_certificate_job
+
+
+def prewarm_key_pool():
+    """
+    Fill the key pool up to its watermark with keys of the default type of client and server certificates,
+    so the first jobs do not wait for key generation
+    """
+    if Key.pool:
+        Key.pool.refill(*get_key_parameters(Certificate(type=CertificateTypes.SERVER_CERT)))
+
+
+def process_certificate_jobs(once=False, poll_interval=1.0):
+    """
+    Process pending certificate jobs
+
+    Arguments: once - Stop when there are no pending jobs left, instead of polling for new jobs
+               poll_interval - Nr of seconds to wait before checking the queue again when it is empty
+    Returns:   Nr of processed jobs
+    """
+    prewarm_key_pool()
+    processed = 0
+    idle = True
+    while True:
+        job = claim_certificate_job()
+        if job:
+            run_certificate_job(job)
+            processed += 1
+            idle = False
+            continue
+        if not idle and Key.pool:
+            Key.pool.log_stats()
+        idle = True
+        if once:
+            return processed
+        time.sleep(poll_interval)
+
+
+def _worker(once, poll_interval):
+    django.setup()
+    process_certificate_jobs(once, poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Generate the certificates requested asynchronously"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=os.cpu_count() or 1, help="Nr of worker processes (default: nr of CPUs)"
+        )
+        parser.add_argument("--once", action="store_true", help="Stop when there are no pending jobs left")
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="Seconds to wait when there are no pending jobs"
+        )
+
+    def handle(self, *args, **options):
+        if options["processes"] <= 1:
+            processed = process_certificate_jobs(options["once"], options["poll_interval"])
+            self.stdout.write(f"Processed {processed} certificate jobs")
+            return
+
+        # Worker processes should not share the database connection of this process
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_worker, args=(options["once"], options["poll_interval"]))
+            for _ in range(options["processes"])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
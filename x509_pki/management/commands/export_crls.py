@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bounca import settings
+from x509_pki.models import CrlStore, export_revocation_list
+
+
+class Command(BaseCommand):
+    help = "Write the current CRLs of all authorities to the CRL export directory"
+
+    def handle(self, *args, **options):
+        if not settings.CRL_EXPORT_DIR:
+            raise CommandError("No CRL export directory configured, set crl_export_dir in services.yaml")
+        exported = 0
+        for crlstore in CrlStore.objects.select_related("certificate").exclude(crl=None):
+            if crlstore.certificate.crl_distribution_url:
+                export_revocation_list(crlstore)
+                exported += 1
+        self.stdout.write(f"Exported {exported} CRLs")
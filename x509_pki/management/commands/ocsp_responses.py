@@ -0,0 +1,44 @@
+import getpass
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from certificate_engine.ssl.certificate import PassPhraseError
+from x509_pki.models import Certificate, CertificateTypes, update_ocsp_responses
+
+
+class Command(BaseCommand):
+    help = (
+        "Sign the OCSP responses of the certificates issued by the authority of an OCSP signing certificate, "
+        "which have no response yet or of which the response expires within the refresh window"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("certificate", type=int, help="Id of the OCSP signing certificate")
+        parser.add_argument(
+            "--passphrase-file",
+            help="File containing the passphrase of the key of the OCSP signing certificate, "
+            "asked for when not provided",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            responder = Certificate.objects.select_related("keystore", "parent__keystore").get(
+                pk=options["certificate"], type=CertificateTypes.OCSP
+            )
+        except Certificate.DoesNotExist:
+            raise CommandError(f"OCSP signing certificate {options['certificate']} not found")
+
+        if options["passphrase_file"]:
+            with open(options["passphrase_file"]) as f:
+                passphrase = f.readline().rstrip("\n")
+        else:
+            passphrase = getpass.getpass("Passphrase: ")
+
+        try:
+            signed = update_ocsp_responses(responder, passphrase)
+        except PassPhraseError as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError(e.message)
+        self.stdout.write(f"Signed {signed} OCSP responses")
@@ -0,0 +1,176 @@
+import datetime
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from yamlreader import YamlReaderError, yaml_load
+
+from bounca import settings
+from certificate_engine.ssl.certificate import PassPhraseError
+from x509_pki.models import Certificate, CertificateTypes
+
+logger = logging.getLogger(__name__)
+
+
+def get_expiring_authorities(within=None):
+    """
+    Get the authorities of which the CRL expires within a period
+
+    Arguments: within - Optional period as timedelta, all authorities are returned when not provided
+    Returns:   Queryset with the authorities
+    """
+    authorities = Certificate.objects.filter(
+        type__in=[CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE],
+        revoked_at__isnull=True,
+        expires_at__gt=timezone.now().date(),
+        keystore__isnull=False,
+    )
+    if within is not None:
+        authorities = authorities.filter(
+            Q(crlstore__isnull=True)
+            | Q(crlstore__next_update__isnull=True)
+            | Q(crlstore__next_update__lte=timezone.now() + within)
+        )
+    return authorities.order_by("id")
+
+
+def refresh_revocation_list(pk, passphrase):
+    """
+    Generate the complete certificate revocation list of an authority
+
+    Arguments: pk - The id of the authority
+               passphrase - The passphrase of the key of the authority
+    Returns:   Tuple with the id of the authority, the nr of seconds it took and the error or None
+    """
+    start = time.monotonic()
+    error = None
+    try:
+        certificate = Certificate.objects.select_related("keystore").get(pk=pk)
+        certificate.passphrase_in = passphrase
+        certificate.renew_revocation_list()
+    except PassPhraseError as e:
+        error = str(e)
+    except ValidationError as e:
+        error = e.message
+    except Exception as e:
+        # i.e. signing or database errors, the CRLs of the other authorities are still refreshed
+        logger.exception(f"Failed to refresh CRL of authority {pk}")
+        error = f"{e.__class__.__name__}: {e}"
+    return pk, time.monotonic() - start, error
+
+
+def _init_worker():
+    # Processes of the pool should not share the database connection of the parent process
+    connections.close_all()
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = "Regenerate the CRLs of the root and intermediate authorities which expire soon"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--passphrase-file",
+            required=True,
+            help="YAML file mapping the ids of the authorities to the passphrases of their keys",
+        )
+        parser.add_argument(
+            "--within",
+            type=float,
+            help="Refresh the CRLs which expire within this nr of hours (default: half of the CRL validity)",
+        )
+        parser.add_argument("--all", action="store_true", help="Refresh all CRLs")
+        parser.add_argument(
+            "--processes", type=int, default=os.cpu_count() or 1, help="Nr of signing processes (default: nr of CPUs)"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running and check the CRLs every this nr of minutes, instead of checking once",
+        )
+
+    @staticmethod
+    def _load_passphrases(path):
+        try:
+            passphrases = yaml_load(path)
+        except YamlReaderError as e:
+            raise CommandError(f"Could not read passphrase file: {e}")
+        if not isinstance(passphrases, dict):
+            raise CommandError("Passphrase file should map the ids of the authorities to their passphrases")
+        return {int(pk): str(passphrase) for pk, passphrase in passphrases.items()}
+
+    def refresh(self, passphrases, within, processes):
+        """
+        Refresh the expiring CRLs
+
+        Arguments: passphrases - dict with the passphrases of the authorities
+                   within - Optional period as timedelta, all CRLs are refreshed when not provided
+                   processes - Nr of signing processes
+        Returns:   Nr of CRLs which failed to refresh
+        """
+        start = time.monotonic()
+        authorities = dict(get_expiring_authorities(within).values_list("id", "name"))
+        jobs = []
+        for pk, name in authorities.items():
+            if pk in passphrases:
+                jobs.append((pk, passphrases[pk]))
+            else:
+                self.stderr.write(f"Skipped CRL of {name} ({pk}), no passphrase")
+
+        if processes <= 1 or len(jobs) <= 1:
+            results = (refresh_revocation_list(*job) for job in jobs)
+            refreshed, failed = self._report(authorities, results)
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=min(processes, len(jobs)), initializer=_init_worker) as executor:
+                futures = {executor.submit(refresh_revocation_list, *job): job[0] for job in jobs}
+                refreshed, failed = self._report(
+                    authorities, (self._result(futures[future], future) for future in as_completed(futures))
+                )
+        self.stdout.write(f"Refreshed {refreshed} of {len(authorities)} CRLs in {time.monotonic() - start:.2f}s")
+        return failed
+
+    @staticmethod
+    def _result(pk, future):
+        # The signing process itself can fail, i.e. when it is killed
+        try:
+            return future.result()
+        except Exception as e:
+            logger.exception(f"Failed to refresh CRL of authority {pk}")
+            return pk, 0.0, f"{e.__class__.__name__}: {e}"
+
+    def _report(self, authorities, results):
+        refreshed = 0
+        failed = 0
+        for pk, seconds, error in results:
+            if error:
+                self.stderr.write(f"Failed to refresh CRL of {authorities[pk]} ({pk}): {error}")
+                failed += 1
+            else:
+                self.stdout.write(f"Refreshed CRL of {authorities[pk]} ({pk}) in {seconds:.2f}s")
+                refreshed += 1
+        return refreshed, failed
+
+    def handle(self, *args, **options):
+        passphrases = self._load_passphrases(options["passphrase_file"])
+        if options["all"]:
+            within = None
+        elif options["within"] is not None:
+            within = datetime.timedelta(hours=options["within"])
+        else:
+            within = datetime.timedelta(days=settings.CRL_UPDATE_DAYS_FUTURE / 2)
+
+        while True:
+            failed = self.refresh(passphrases, within, options["processes"])
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"] * 60)
+        if failed:
+            raise CommandError(f"Failed to refresh {failed} CRLs")
@@ -0,0 +1,88 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from yamlreader import YamlReaderError, yaml_load
+
+from bounca import settings
+from certificate_engine.ssl.certificate import PassPhraseError
+from certificate_engine.ssl.signing_daemon import SigningDaemon
+from certificate_engine.ssl.soft_token import SoftToken, TokenError
+from x509_pki.models import Certificate, CertificateTypes
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the signing daemon, which holds the decrypted keys of the authorities and signs certificates, CRLs "
+        "and OCSP responses for the application processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket", help="Path of the Unix socket (default: signing_socket of the certificate engine settings)"
+        )
+        parser.add_argument(
+            "--processes", type=int, default=os.cpu_count() or 1, help="Nr of signing processes (default: nr of CPUs)"
+        )
+        parser.add_argument(
+            "--passphrase-file",
+            help="YAML file mapping the ids of the authorities to the passphrases of their keys, to unlock the keys "
+            "at startup",
+        )
+        parser.add_argument(
+            "--soft-token",
+            action="store_true",
+            help="Sign with the keys in the soft token (soft_token_dir and soft_token_pin of the certificate engine "
+            "settings), keys imported while running are loaded on their first use",
+        )
+
+    @staticmethod
+    def _load_passphrases(path):
+        try:
+            passphrases = yaml_load(path)
+        except YamlReaderError as e:
+            raise CommandError(f"Could not read passphrase file: {e}")
+        if not isinstance(passphrases, dict):
+            raise CommandError("Passphrase file should map the ids of the authorities to their passphrases")
+        return {int(pk): str(passphrase) for pk, passphrase in passphrases.items()}
+
+    def unlock_keys(self, daemon, passphrases):
+        authorities = Certificate.objects.select_related("keystore").filter(
+            pk__in=passphrases,
+            type__in=[CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE],
+            revoked_at__isnull=True,
+            keystore__isnull=False,
+        )
+        for authority in authorities:
+            try:
+                key = authority.get_private_key(passphrases[authority.pk])
+            except PassPhraseError as e:
+                raise CommandError(f"Could not unlock key of {authority.name} ({authority.pk}): {e}")
+            daemon.add_key(authority.pk, key, passphrases[authority.pk])
+            self.stdout.write(f"Unlocked key of {authority.name} ({authority.pk})")
+
+    def handle(self, *args, **options):
+        socket_path = options["socket"] or settings.SIGNING_SOCKET
+        if not socket_path:
+            raise CommandError("No socket provided and no signing_socket configured")
+
+        if not (options["passphrase_file"] or options["soft_token"]):
+            raise CommandError("Provide the keys of the authorities with --passphrase-file or --soft-token")
+        session = None
+        if options["soft_token"]:
+            if not (settings.SOFT_TOKEN_DIR and settings.SOFT_TOKEN_PIN):
+                raise CommandError("No soft_token_dir and soft_token_pin configured")
+            try:
+                session = SoftToken(settings.SOFT_TOKEN_DIR).open_session(settings.SOFT_TOKEN_PIN)
+            except TokenError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Opened soft token with {len(session.token.labels())} keys")
+
+        daemon = SigningDaemon(socket_path, processes=options["processes"], session=session)
+        if options["passphrase_file"]:
+            self.unlock_keys(daemon, self._load_passphrases(options["passphrase_file"]))
+        # The signing processes do not use the database
+        connections.close_all()
+
+        self.stdout.write(f"Signing daemon listening on {socket_path} with {options['processes']} processes")
+        daemon.serve()
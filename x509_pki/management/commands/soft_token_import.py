@@ -0,0 +1,54 @@
+import getpass
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bounca import settings
+from certificate_engine.ssl.certificate import PassPhraseError
+from certificate_engine.ssl.soft_token import SoftToken
+from x509_pki.models import Certificate, CertificateTypes
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the key of an authority into the soft token, so it is signed with the key kept in memory by the "
+        "soft token signer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("certificate", type=int, help="Id of the root or intermediate authority")
+        parser.add_argument(
+            "--passphrase-file",
+            help="File containing the passphrase of the key of the authority, asked for when not provided",
+        )
+        parser.add_argument("--delete", action="store_true", help="Remove the key of the authority from the token")
+
+    def handle(self, *args, **options):
+        if not (settings.SOFT_TOKEN_DIR and settings.SOFT_TOKEN_PIN):
+            raise CommandError("No soft_token_dir and soft_token_pin configured")
+        token = SoftToken(settings.SOFT_TOKEN_DIR)
+        label = str(options["certificate"])
+
+        if options["delete"]:
+            token.delete_key(label)
+            self.stdout.write(f"Removed key {label} from the soft token")
+            return
+
+        try:
+            authority = Certificate.objects.select_related("keystore").get(
+                pk=options["certificate"], type__in=[CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]
+            )
+        except Certificate.DoesNotExist:
+            raise CommandError(f"Authority {options['certificate']} not found")
+
+        if options["passphrase_file"]:
+            with open(options["passphrase_file"]) as f:
+                passphrase = f.readline().rstrip("\n")
+        else:
+            passphrase = getpass.getpass("Passphrase: ")
+
+        try:
+            key = authority.get_private_key(passphrase)
+        except PassPhraseError as e:
+            raise CommandError(str(e))
+        token.import_key(label, key, settings.SOFT_TOKEN_PIN, passphrase)
+        self.stdout.write(f"Imported key of {authority.name} ({authority.pk}) into the soft token")
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0006_keystore_p12_legacy"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crlstore",
+            name="base_crl_number",
+            field=models.PositiveBigIntegerField(
+                default=0, editable=False, help_text="CRL number of the last generated complete crl"
+            ),
+        ),
+        migrations.AddField(
+            model_name="crlstore",
+            name="base_update",
+            field=models.DateTimeField(
+                blank=True, editable=False, help_text="Date at which last complete crl has been generated", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="crlstore",
+            name="crl_number",
+            field=models.PositiveBigIntegerField(
+                default=0, editable=False, help_text="CRL number of the last generated complete or delta crl"
+            ),
+        ),
+        migrations.AddField(
+            model_name="crlstore",
+            name="delta_crl",
+            field=models.TextField(blank=True, null=True, verbose_name="Serialized delta CRL certificate"),
+        ),
+        migrations.AddIndex(
+            model_name="certificate",
+            index=models.Index(
+                condition=models.Q(("revoked_at__isnull", False)),
+                fields=["parent", "revoked_at"],
+                include=("serial",),
+                name="x509_pki_certificate_revoked",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0007_crlstore_delta_crl"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="certificate",
+            name="unlocked_until",
+            field=models.DateTimeField(
+                blank=True,
+                default=None,
+                editable=False,
+                help_text="The decrypted key of the authority is kept in memory until this date",
+                null=True,
+            ),
+        ),
+    ]
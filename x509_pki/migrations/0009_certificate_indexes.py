@@ -0,0 +1,66 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Trigram indexes for the search fields of the certificate list, which are queried with
+# UPPER(field::text) LIKE UPPER('%...%') by icontains. They require the pg_trgm extension, which
+# is not available on every PostgreSQL installation. Searching works without them, so they are
+# only created when the extension can be installed.
+TRIGRAM_INDEXES = [
+    ("x509_pki_certificate_name_trgm", "x509_pki_certificate", "name"),
+    ("x509_pki_dn_commonname_trgm", "x509_pki_distinguishedname", "commonName"),
+    ("x509_pki_dn_emailaddress_trgm", "x509_pki_distinguishedname", "emailAddress"),
+    ("x509_pki_keystore_fingerprint_trgm", "x509_pki_keystore", "fingerprint"),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if not cursor.fetchone():
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0008_certificate_unlocked_until"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="certificate",
+            index=models.Index(
+                condition=models.Q(("revoked_at__isnull", True)), fields=["parent"], name="x509_pki_certificate_active"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="certificate",
+            index=models.Index(fields=["owner", "-id"], name="x509_pki_certificate_owner"),
+        ),
+        migrations.AddIndex(
+            model_name="certificate",
+            index=models.Index(fields=["owner", "expires_at"], name="x509_pki_certificate_expires"),
+        ),
+        migrations.AddIndex(
+            model_name="certificate",
+            index=models.Index(fields=["serial"], name="x509_pki_certificate_serial"),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
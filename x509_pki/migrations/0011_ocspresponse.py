@@ -0,0 +1,35 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0010_certificatejob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OcspResponse",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "issuer_key_hash",
+                    models.BinaryField(help_text="SHA1 hash of the public key of the authority, as used in requests"),
+                ),
+                ("response", models.BinaryField(verbose_name="DER encoded signed OCSP response")),
+                ("this_update", models.DateTimeField(help_text="Date at which the response has been signed")),
+                ("next_update", models.DateTimeField(help_text="Date at which the response expires")),
+                (
+                    "certificate",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ocsp_response",
+                        to="x509_pki.certificate",
+                    ),
+                ),
+            ],
+        ),
+    ]
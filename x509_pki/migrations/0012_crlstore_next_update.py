@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:54
+
+from cryptography import x509
+from django.db import migrations, models
+
+
+def set_next_update(apps, schema_editor):
+    CrlStore = apps.get_model("x509_pki", "CrlStore")
+    for crlstore in CrlStore.objects.exclude(crl=None).only("id", "crl"):
+        crl = x509.load_pem_x509_crl(crlstore.crl.encode("utf-8"))
+        CrlStore.objects.filter(pk=crlstore.pk).update(next_update=crl.next_update_utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0011_ocspresponse"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crlstore",
+            name="next_update",
+            field=models.DateTimeField(
+                blank=True, editable=False, help_text="Date at which the last complete crl expires", null=True
+            ),
+        ),
+        migrations.RunPython(set_next_update, migrations.RunPython.noop),
+    ]
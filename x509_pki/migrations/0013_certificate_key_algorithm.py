@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0012_crlstore_next_update"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="certificate",
+            name="key_algorithm",
+            field=models.CharField(
+                blank=True,
+                choices=[("rsa", "RSA"), ("ecdsa", "ECDSA"), ("ed25519", "Ed25519")],
+                help_text="Algorithm of the key, if not set the configured key algorithm is used.",
+                max_length=16,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="certificate",
+            name="key_size",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Number of bits of RSA keys or the curve size of ECDSA keys (256 or 384), if not set 4096 bits RSA or P-384 for root and intermediate certificates, and 2048 bits RSA or P-256 for other types.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0013_certificate_key_algorithm"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="keystore",
+            name="key",
+            field=models.TextField(
+                blank=True,
+                help_text="Empty when the private key is held by the requester",
+                verbose_name="Serialized Private Key",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0014_keystore_key_blank"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="certificatejob",
+            index=models.Index(
+                condition=models.Q(("status", "running")), fields=["started_at"], name="x509_pki_certjob_running"
+            ),
+        ),
+    ]
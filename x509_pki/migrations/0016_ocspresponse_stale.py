@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("x509_pki", "0015_certificatejob_running_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ocspresponse",
+            name="stale",
+            field=models.BooleanField(
+                default=False,
+                help_text="The status of the certificate has changed, the response is replaced on next update",
+            ),
+        ),
+    ]
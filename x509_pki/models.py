@@ -1,14 +1,27 @@
 """Models for storing subject and certificate information"""
 
+import base64
 import datetime
+import json
+import logging
+import os
+import posixpath
+import re
+import tempfile
 import uuid
+from urllib.parse import urlparse
 
 import pytz
+from cryptography import x509
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.fields import ArrayField
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.template.defaultfilters import slugify
@@ -17,13 +30,30 @@ from django_countries.fields import CountryField
 
 from bounca import settings
 from certificate_engine.ssl.certificate import Certificate as CertificateGenerator
+from certificate_engine.ssl.certificate import PassPhraseError
 from certificate_engine.ssl.crl import revocation_list_builder, serialize
 from certificate_engine.ssl.info import get_certificate_fingerprint, get_certificate_info
+from certificate_engine.ssl.key import KEY_SIZES
 from certificate_engine.ssl.key import Key as KeyGenerator
+from certificate_engine.ssl.key import get_public_key_parameters
+from certificate_engine.ssl.key_cache import KeyCache
+from certificate_engine.ssl.key_pool import create_keys
+from certificate_engine.ssl.ocsp import get_issuer_hashes, ocsp_response_builder
+from certificate_engine.ssl.signing_daemon import RemoteSigner
+from certificate_engine.ssl.soft_token import get_session
 from certificate_engine.types import CertificateTypes
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+CRL_EXPORT_EXTENSION_RE = re.compile(r"(\.crl(\.pem)?)$")
+
+# Decrypted keys of unlocked authorities, None when unlocking is disabled by an idle timeout of 0
+issuer_key_cache = (
+    KeyCache(idle_timeout=settings.KEY_UNLOCK_IDLE_MINUTES * 60) if settings.KEY_UNLOCK_IDLE_MINUTES else None
+)
+
 
 class DistinguishedName(models.Model):
     alphanumeric_validator = RegexValidator(
@@ -149,6 +179,21 @@ class CertificateQuerySet(models.QuerySet):
         for obj in self:
             obj.delete()
 
+    def with_status(self):
+        """
+        Annotate the revoked and expired state, so it can be used for filtering and ordering in the database
+
+        Returns:   The queryset annotated with is_revoked and is_expired
+        """
+        return self.annotate(
+            is_revoked=models.ExpressionWrapper(
+                ~models.Q(revoked_uuid=uuid.UUID(int=0)), output_field=models.BooleanField()
+            ),
+            is_expired=models.ExpressionWrapper(
+                models.Q(expires_at__lte=timezone.now().date()), output_field=models.BooleanField()
+            ),
+        )
+
 
 class Certificate(models.Model):
     objects = CertificateQuerySet.as_manager()
@@ -184,6 +229,25 @@ class Certificate(models.Model):
         on_delete=models.PROTECT,
     )
 
+    KEY_ALGORITHMS = (
+        ("rsa", "RSA"),
+        ("ecdsa", "ECDSA"),
+        ("ed25519", "Ed25519"),
+    )
+    key_algorithm = models.CharField(
+        max_length=16,
+        choices=KEY_ALGORITHMS,
+        blank=True,
+        null=True,
+        help_text="Algorithm of the key, if not set the configured key algorithm is used.",
+    )
+    key_size = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Number of bits of RSA keys or the curve size of ECDSA keys (256 or 384), if not set 4096 bits "
+        "RSA or P-384 for root and intermediate certificates, and 2048 bits RSA or P-256 for other types.",
+    )
+
     crl_distribution_url = models.URLField(
         "CRL distribution url",
         validators=[crl_url_validator],
@@ -209,12 +273,23 @@ class Certificate(models.Model):
     # to ensure only one signed certificate has been issued
     revoked_uuid = models.UUIDField(default=0)
     serial = models.UUIDField(default=uuid.uuid4, editable=False)
+    unlocked_until = models.DateTimeField(
+        editable=False,
+        default=None,
+        blank=True,
+        null=True,
+        help_text="The decrypted key of the authority is kept in memory until this date",
+    )
 
     owner = models.ForeignKey(User, on_delete=models.PROTECT)
 
     passphrase_issuer = ""
     passphrase_out = ""
     passphrase_out_confirmation = ""
+    # Generate the key and certificate in a CertificateJob instead of while saving
+    generate_async = False
+    # Public key of a key held by the requester, the certificate is issued for it without generating a key
+    public_key = None
 
     @property
     def days_valid(self):
@@ -240,12 +315,86 @@ class Certificate(models.Model):
     def expired(self):
         return self.expires_at <= timezone.now().date()
 
+    @property
+    def unlocked(self):
+        return bool(self.unlocked_until and self.unlocked_until > timezone.now())
+
     def is_passphrase_valid(self, passphrase):
         if not hasattr(self, "keystore"):
             raise KeyStore.DoesNotExist("Certificate has no cert, " "something went wrong during generation")
+        if settings.SIGNING_SOCKET and self.type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
+            return get_signer(self, passphrase).check_passphrase()
+        session = get_soft_token_session()
+        if session and str(self.pk) in session:
+            return session.check_passphrase(str(self.pk), passphrase)
+        if self.unlocked:
+            try:
+                self.get_private_key(passphrase)
+                return True
+            except PassPhraseError:
+                return False
         valid = check_passphrase_issuer(self.keystore.key, passphrase)
         return bool(valid)
 
+    def get_private_key(self, passphrase):
+        """
+        Decrypt the private key of the certificate, taken from the issuer key cache while the certificate is unlocked
+
+        Arguments: passphrase - The passphrase of the key
+        Returns:   The decrypted key
+        """
+        if issuer_key_cache is None:
+            return self._load_private_key(passphrase)
+        if not self.unlocked:
+            # Might have been locked by another process
+            issuer_key_cache.evict(self.pk)
+            return self._load_private_key(passphrase)
+
+        key = issuer_key_cache.get(self.pk, passphrase)
+        if key is None:
+            key = self._load_private_key(passphrase)
+            issuer_key_cache.put(self.pk, passphrase, key, (self.unlocked_until - timezone.now()).total_seconds())
+        return key
+
+    def _load_private_key(self, passphrase):
+        if not hasattr(self, "keystore"):
+            raise KeyStore.DoesNotExist("Certificate has no cert, " "something went wrong during generation")
+        try:
+            return KeyGenerator().load(self.keystore.key, passphrase)
+        except ValueError:
+            raise PassPhraseError("Bad passphrase, could not decode private key")
+
+    def unlock(self, passphrase, minutes):
+        """
+        Keep the decrypted key of an authority in memory, so signing does not need to decrypt it every time.
+        The passphrase is still required to use the key.
+
+        Arguments: passphrase - The passphrase of the key
+                   minutes - Number of minutes the key is unlocked
+        """
+        if self.type not in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
+            raise ValidationError("Can only unlock Root or Intermediate certificate")
+        if self.revoked:
+            raise ValidationError("Cannot unlock a revoked certificate")
+        if not settings.KEY_UNLOCK_MAX_MINUTES or issuer_key_cache is None:
+            raise ValidationError("Unlocking keys is not enabled")
+        if not 0 < minutes <= settings.KEY_UNLOCK_MAX_MINUTES:
+            raise ValidationError(f"Unlock period should be between 1 and {settings.KEY_UNLOCK_MAX_MINUTES} minutes")
+
+        key = self._load_private_key(passphrase)
+        self.unlocked_until = timezone.now() + datetime.timedelta(minutes=minutes)
+        Certificate.objects.filter(pk=self.pk).update(unlocked_until=self.unlocked_until)
+        issuer_key_cache.put(self.pk, passphrase, key, minutes * 60)
+
+    def lock(self):
+        """
+        Remove the decrypted key of an authority from memory
+        """
+        self.unlocked_until = None
+        Certificate.objects.filter(pk=self.pk).update(unlocked_until=None)
+        if issuer_key_cache is not None:
+            issuer_key_cache.evict(self.pk)
+
     def get_certificate_info(self):
         if not hasattr(self, "keystore"):
             raise KeyStore.DoesNotExist("Certificate has no cert, " "something went wrong during generation")
@@ -275,6 +424,9 @@ class Certificate(models.Model):
         validate_in_future(expires_at)
 
         original_name = self.name
+        if hasattr(self, "keystore") and not self.keystore.key:
+            # Issued for a key held by the requester, the renewed certificate is issued for the same key
+            self.public_key = CertificateGenerator().load(self.keystore.crt).certificate.public_key()
 
         self.delete()
 
@@ -299,20 +451,7 @@ class Certificate(models.Model):
         if self.type not in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
             raise ValidationError("Can only renew crl of Root or Intermediate certificate")
 
-        revoked_certs = Certificate.objects.filter(parent=self, revoked_at__isnull=False)
-        crl_list = [(rc.keystore.crt, rc.revoked_at) for rc in revoked_certs if hasattr(rc, "keystore")]
-        last_update = self.crlstore.last_update if hasattr(self, "crlstore") else timezone.now()
-        next_update_days = datetime.timedelta(settings.CRL_UPDATE_DAYS_FUTURE, 0, 0)
-        next_update = datetime.datetime.now(tz=pytz.UTC) + next_update_days
-        crl = revocation_list_builder(crl_list, self, self.passphrase_in, last_update, next_update)
-
-        if not self.crlstore:
-            crlstore = CrlStore(certificate=self)
-            crlstore.crl = serialize(crl)
-            crlstore.save()
-        else:
-            self.crlstore.crl = serialize(crl)
-            self.crlstore.save()
+        update_revocation_list(self, self.passphrase_in)
 
     def force_delete(self, *args, **kwargs):
         return super().delete(*args, **kwargs)
@@ -326,6 +465,8 @@ class Certificate(models.Model):
         self.name = f"{self.name}_revoked-{self.revoked_at.isoformat()}"
         kwargs["update_fields"] = ["revoked_at", "revoked_uuid", "name"]
         super().save(*args, **kwargs)
+        if self.unlocked_until:
+            self.lock()
 
     def __init__(self, *args, **kwargs):
         if "passphrase_issuer" in kwargs:
@@ -334,6 +475,10 @@ class Certificate(models.Model):
             self.passphrase_out = kwargs.pop("passphrase_out")
         if "passphrase_out_confirmation" in kwargs:
             self.passphrase_out_confirmation = kwargs.pop("passphrase_out_confirmation")
+        if "generate_async" in kwargs:
+            self.generate_async = kwargs.pop("generate_async")
+        if "public_key" in kwargs:
+            self.public_key = kwargs.pop("public_key")
         super().__init__(*args, **kwargs)
 
     class Meta:
@@ -341,6 +486,25 @@ class Certificate(models.Model):
             ["name", "owner", "type", "revoked_uuid"],
             ["dn", "type", "revoked_uuid"],
         ]
+        indexes = [
+            # Revoked entries per issuer, used to build the certificate revocation lists
+            models.Index(
+                fields=["parent", "revoked_at"],
+                include=["serial"],
+                condition=models.Q(revoked_at__isnull=False),
+                name="x509_pki_certificate_revoked",
+            ),
+            # Certificates that are still valid per issuer
+            models.Index(
+                fields=["parent"],
+                condition=models.Q(revoked_at__isnull=True),
+                name="x509_pki_certificate_active",
+            ),
+            # Certificate list of the user, ordered by id for (cursor) pagination
+            models.Index(fields=["owner", "-id"], name="x509_pki_certificate_owner"),
+            models.Index(fields=["owner", "expires_at"], name="x509_pki_certificate_expires"),
+            models.Index(fields=["serial"], name="x509_pki_certificate_serial"),
+        ]
 
     def __unicode__(self):
         return str(self.name)
@@ -353,6 +517,13 @@ class Certificate(models.Model):
 def set_fields_certificate(sender, instance, *args, **kwargs):
     if not instance.name:
         instance.name = str(instance.dn.commonName)
+    if not instance.id and instance.public_key is not None:
+        try:
+            instance.key_algorithm, instance.key_size = get_public_key_parameters(instance.public_key)
+        except ValueError as e:
+            raise ValidationError(str(e))
+    elif not instance.id:
+        instance.key_algorithm, instance.key_size = get_key_parameters(instance)
 
 
 def check_if_not_update_certificate(instance, *args, **kwargs):
@@ -371,6 +542,20 @@ def check_if_not_update_certificate(instance, *args, **kwargs):
         raise ValidationError("Not allowed to update a Certificate record")
 
 
+def check_if_key_parameters_are_supported(instance, *args, **kwargs):
+    if instance.id:
+        return
+    if instance.key_algorithm not in KEY_SIZES:
+        raise ValidationError(f"Key algorithm {instance.key_algorithm} not supported")
+    key_sizes = KEY_SIZES[instance.key_algorithm]
+    if instance.key_size not in key_sizes:
+        if key_sizes == [None]:
+            raise ValidationError(f"Key size should not be set for {instance.key_algorithm} keys")
+        raise ValidationError(
+            f"Key size of {instance.key_algorithm} keys should be one of {', '.join(str(s) for s in key_sizes)}"
+        )
+
+
 def check_if_passphrases_are_matching(instance, *args, **kwargs):
     if (
         instance.passphrase_out
@@ -436,10 +621,13 @@ def validation_rules_certificate(sender, instance, *args, **kwargs):
     check_intermediate_policies(instance, *args, **kwargs)
     check_if_child_not_expires_after_parent(instance, *args, **kwargs)
     check_if_passphrases_are_matching(instance, *args, **kwargs)
+    check_if_key_parameters_are_supported(instance, *args, **kwargs)
 
 
 class KeyStore(models.Model):
-    key = models.TextField("Serialized Private Key")
+    key = models.TextField(
+        "Serialized Private Key", blank=True, help_text="Empty when the private key is held by the requester"
+    )
     crt = models.TextField("Serialized signed certificate")
     p12 = models.BinaryField("Serialized PKCS 12 package with key and certificate", null=True, blank=True, default=None)
     p12_legacy = models.BinaryField(
@@ -455,6 +643,37 @@ class KeyStore(models.Model):
         on_delete=models.CASCADE,
     )
 
+    def get_pkcs12(self, passphrase=None):
+        """
+        Get the PKCS12 packages of a leaf certificate. When they have not been generated at issuance,
+        they are created from the key and stored if PKCS12_CACHE is enabled.
+
+        Arguments: passphrase - The passphrase of the key, which is also used to encrypt the packages
+        Returns:   Tuple with the PKCS12 package and the PKCS12 package with legacy encryption
+        """
+        if self.p12 is not None and self.p12_legacy is not None:
+            return bytes(self.p12), bytes(self.p12_legacy)
+        certificate = self.certificate
+        if certificate.type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
+            raise ValidationError("PKCS12 packages are only available for leaf certificates")
+        if not self.key:
+            raise ValidationError("PKCS12 packages are only available for certificates with a private key")
+        try:
+            key = KeyGenerator().load(self.key, passphrase)
+        except ValueError:
+            raise PassPhraseError("Bad passphrase, could not decode private key")
+        p12, p12_legacy = build_pkcs12(
+            certificate.name,
+            key,
+            CertificateGenerator().load(self.crt).certificate,
+            passphrase,
+            issuer=certificate.parent,
+        )
+        if settings.PKCS12_CACHE:
+            KeyStore.objects.filter(pk=self.pk).update(p12=p12, p12_legacy=p12_legacy)
+            self.p12, self.p12_legacy = p12, p12_legacy
+        return p12, p12_legacy
+
     def _get_fingerprint(self):
         if not self.crt:
             raise KeyStore.DoesNotExist("Certificate has no cert, " "something went wrong during generation")
@@ -474,9 +693,22 @@ class KeyStore(models.Model):
 
 class CrlStore(models.Model):
     crl = models.TextField("Serialized CRL certificate", blank=True, null=True)
+    delta_crl = models.TextField("Serialized delta CRL certificate", blank=True, null=True)
+    crl_number = models.PositiveBigIntegerField(
+        default=0, editable=False, help_text="CRL number of the last generated complete or delta crl"
+    )
+    base_crl_number = models.PositiveBigIntegerField(
+        default=0, editable=False, help_text="CRL number of the last generated complete crl"
+    )
+    base_update = models.DateTimeField(
+        editable=False, blank=True, null=True, help_text="Date at which last complete crl has been generated"
+    )
     last_update = models.DateTimeField(
         auto_now=True, editable=False, help_text="Date at which last crl has been generated"
     )
+    next_update = models.DateTimeField(
+        editable=False, blank=True, null=True, help_text="Date at which the last complete crl expires"
+    )
 
     certificate = models.OneToOneField(
         Certificate,
@@ -484,6 +716,222 @@ class CrlStore(models.Model):
     )
 
 
+class OcspResponse(models.Model):
+    certificate = models.OneToOneField(Certificate, on_delete=models.CASCADE, related_name="ocsp_response")
+    issuer_key_hash = models.BinaryField(help_text="SHA1 hash of the public key of the authority, as used in requests")
+    response = models.BinaryField("DER encoded signed OCSP response")
+    this_update = models.DateTimeField(help_text="Date at which the response has been signed")
+    next_update = models.DateTimeField(help_text="Date at which the response expires")
+    stale = models.BooleanField(
+        default=False, help_text="The status of the certificate has changed, the response is replaced on next update"
+    )
+
+
+def get_delta_crl_url(crl_distribution_url):
+    if not crl_distribution_url:
+        return None
+    return CRL_EXPORT_EXTENSION_RE.sub(r"-delta\1", crl_distribution_url)
+
+
+def get_revoked_entries(issuer, since=None):
+    """
+    Get the revoked certificates signed by an authority
+
+    Arguments: issuer - The authority certificate
+               since - Optional, only return certificates revoked at or after this date
+    Returns:   List of serial number and revocation date tuples
+    """
+    revoked_certs = Certificate.objects.filter(parent=issuer, revoked_at__isnull=False, keystore__isnull=False)
+    if since:
+        revoked_certs = revoked_certs.filter(revoked_at__gte=since)
+    return [(int(serial), revoked_at) for serial, revoked_at in revoked_certs.values_list("serial", "revoked_at")]
+
+
+def update_revocation_list(issuer, passphrase, issuer_key=None):
+    """
+    Generate the complete certificate revocation list of an authority,
+    and an empty delta list on top of it when delta CRLs are enabled
+
+    Arguments: issuer - The authority certificate
+               passphrase - The passphrase of the key of the authority
+               issuer_key - Optional already decrypted key or signer of the authority
+    """
+    if issuer_key is None:
+        issuer_key = get_signer(issuer, passphrase)
+    with transaction.atomic():
+        crlstore = CrlStore.objects.select_for_update().filter(certificate=issuer).first()
+        if crlstore is None:
+            crlstore = CrlStore(certificate=issuer)
+            last_update = None
+        else:
+            last_update = crlstore.last_update
+
+        base_update = timezone.now()
+        next_update_days = datetime.timedelta(settings.CRL_UPDATE_DAYS_FUTURE, 0, 0)
+        next_update = datetime.datetime.now(tz=pytz.UTC) + next_update_days
+        crl_number = crlstore.crl_number + 1
+        delta_crl_url = get_delta_crl_url(issuer.crl_distribution_url) if settings.CRL_DELTA_ENABLED else None
+        crl = revocation_list_builder(
+            get_revoked_entries(issuer),
+            issuer,
+            passphrase,
+            last_update,
+            next_update,
+            crl_number=crl_number,
+            freshest_crl_url=delta_crl_url,
+            issuer_key=issuer_key,
+        )
+        crlstore.crl = serialize(crl)
+        crlstore.base_crl_number = crl_number
+        crlstore.base_update = base_update
+        crlstore.next_update = next_update
+        crlstore.delta_crl = None
+        if settings.CRL_DELTA_ENABLED:
+            crl_number += 1
+            delta_crl = revocation_list_builder(
+                [],
+                issuer,
+                passphrase,
+                next_update=next_update,
+                crl_number=crl_number,
+                delta_crl_indicator=crlstore.base_crl_number,
+                issuer_key=issuer_key,
+            )
+            crlstore.delta_crl = serialize(delta_crl)
+        crlstore.crl_number = crl_number
+        crlstore.save()
+        issuer.crlstore = crlstore
+
+
+def update_delta_revocation_list(issuer, passphrase, issuer_key=None):
+    """
+    Generate the delta certificate revocation list of an authority, containing
+    the certificates revoked since the last complete list has been generated
+
+    Arguments: issuer - The authority certificate
+               passphrase - The passphrase of the key of the authority
+               issuer_key - Optional already decrypted key or signer of the authority
+    """
+    if issuer_key is None:
+        issuer_key = get_signer(issuer, passphrase)
+    with transaction.atomic():
+        crlstore = CrlStore.objects.select_for_update().get(certificate=issuer)
+        next_update_days = datetime.timedelta(settings.CRL_UPDATE_DAYS_FUTURE, 0, 0)
+        next_update = datetime.datetime.now(tz=pytz.UTC) + next_update_days
+        crl_number = crlstore.crl_number + 1
+        delta_crl = revocation_list_builder(
+            get_revoked_entries(issuer, since=crlstore.base_update),
+            issuer,
+            passphrase,
+            next_update=next_update,
+            crl_number=crl_number,
+            delta_crl_indicator=crlstore.base_crl_number,
+            issuer_key=issuer_key,
+        )
+        crlstore.delta_crl = serialize(delta_crl)
+        crlstore.crl_number = crl_number
+        crlstore.save()
+        issuer.crlstore = crlstore
+
+
+def get_crl_export_path(crl_distribution_url):
+    """
+    Get the file path of an exported CRL, which is the path of its distribution url
+    within the CRL export directory, so the directory can be served as document root
+
+    Arguments: crl_distribution_url - The distribution url of the CRL
+    Returns:   The file path of the exported CRL
+    """
+    # Normalizing the absolute url path removes any '..' segments
+    path = posixpath.normpath("/" + urlparse(crl_distribution_url).path).lstrip("/")
+    return os.path.join(settings.CRL_EXPORT_DIR, *path.split("/"))
+
+
+def _get_versioned_path(path, version):
+    return CRL_EXPORT_EXTENSION_RE.sub(rf".{version}\1", path)
+
+
+def _write_file_atomic(path, content):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _link_file_atomic(source, path):
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    os.link(source, tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_old_versions(path, keep):
+    directory, filename = os.path.split(path)
+    stem = CRL_EXPORT_EXTENSION_RE.sub("", filename)
+    extension = filename.removeprefix(stem)
+    version_re = re.compile(rf"^{re.escape(stem)}\.(\d+){re.escape(extension)}$")
+    versions = sorted(
+        (int(match.group(1)), name) for name in os.listdir(directory) for match in [version_re.match(name)] if match
+    )
+    for _, name in versions[:-keep]:
+        os.unlink(os.path.join(directory, name))
+
+
+def _export_crl(path, crl, version):
+    der = x509.load_pem_x509_crl(crl.encode("utf-8")).public_bytes(serialization.Encoding.DER)
+    for file_path, content in [(path, crl.encode("utf-8")), (CRL_EXPORT_EXTENSION_RE.sub(".der.crl", path), der)]:
+        versioned_path = _get_versioned_path(file_path, version)
+        _write_file_atomic(versioned_path, content)
+        # Replace the current CRL by the new version in one step, readers see either the old or the new file
+        _link_file_atomic(versioned_path, file_path)
+        # The previous version is kept for readers which still have it open
+        _remove_old_versions(file_path, keep=2)
+
+
+def export_revocation_list(crlstore):
+    """
+    Write the complete and delta CRL of an authority to the CRL export directory, as PEM
+    and as DER (with extension .der.crl). Each CRL is written to a file versioned by its
+    CRL number, after which the file named after the distribution url is replaced by it
+
+    Arguments: crlstore - The CRL store of the authority
+    """
+    issuer = crlstore.certificate
+    if not settings.CRL_EXPORT_DIR or not issuer.crl_distribution_url or not crlstore.crl:
+        return
+    path = get_crl_export_path(issuer.crl_distribution_url)
+    _export_crl(path, crlstore.crl, crlstore.base_crl_number)
+    if crlstore.delta_crl:
+        _export_crl(get_delta_crl_url(path), crlstore.delta_crl, crlstore.crl_number)
+
+
+@receiver(post_save, sender=CrlStore)
+def export_updated_revocation_list(sender, instance, **kwargs):
+    if not settings.CRL_EXPORT_DIR:
+        return
+
+    def export():
+        try:
+            export_revocation_list(instance)
+        except OSError:
+            # The CRL has been stored, it is exported again on its next update
+            logger.exception(f"Export of CRL of certificate {instance.certificate_id} failed")
+
+    transaction.on_commit(export)
+
+
 def check_passphrase_issuer(key, passphrase):
     from certificate_engine.ssl.key import Key as KeyObjGenerator
 
@@ -502,45 +950,234 @@ def check_policies_certificate(sender, instance, **kwargs):
     certhandler.check_policies(instance)
 
 
+def get_key_parameters(certificate):
+    """
+    Get the key algorithm and key size of a new certificate. The configured key algorithm and the default
+    key size of the type of the certificate are used when not set on the certificate.
+
+    Arguments: certificate - The certificate
+    Returns:   Tuple with key algorithm and key size (None for Ed25519 keys)
+    """
+    key_algorithm = certificate.key_algorithm or settings.KEY_ALGORITHM
+    key_size = certificate.key_size
+    if key_size is None:
+        authority = certificate.type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]
+        if key_algorithm == "rsa":
+            key_size = 4096 if authority else 2048
+        elif key_algorithm == "ecdsa":
+            key_size = 384 if authority else 256
+    return key_algorithm, key_size
+
+
+def get_certificate_chain(issuer):
+    """
+    Get the certificates of an intermediate authority and its root authority
+
+    Arguments: issuer - The intermediate authority certificate
+    Returns:   List with the loaded intermediate and root certificate
+    """
+    return [
+        CertificateGenerator().load(issuer.keystore.crt).certificate,
+        CertificateGenerator().load(issuer.parent.keystore.crt).certificate,
+    ]
+
+
+def get_soft_token_session():
+    """
+    Get the session of the soft token of this process
+
+    Returns:   The session, None when the soft token signer is not configured
+    """
+    if settings.SIGNER_BACKEND != "soft_token":
+        return None
+    return get_session(settings.SOFT_TOKEN_DIR, settings.SOFT_TOKEN_PIN)
+
+
+def get_signer(issuer, passphrase):
+    """
+    Get the signer of an authority, which is the signing daemon when a signing socket is configured,
+    the soft token when it holds the key of the authority, and otherwise the decrypted key of the authority
+
+    Arguments: issuer - The authority certificate
+               passphrase - The passphrase of the key of the authority
+    Returns:   The signer or the decrypted key
+    """
+    if settings.SIGNING_SOCKET:
+        # The daemon signs with the key of its own key store, the key is only referred to by its id
+        return RemoteSigner(
+            settings.SIGNING_SOCKET,
+            issuer.pk,
+            passphrase,
+            CertificateGenerator().load(issuer.keystore.crt).certificate.public_key(),
+        )
+    session = get_soft_token_session()
+    if session and str(issuer.pk) in session:
+        return session.signer(str(issuer.pk), passphrase)
+    return issuer.get_private_key(passphrase)
+
+
+def get_issuer_key(issuer, passphrase_issuer):
+    """
+    Get the key of an authority for signing
+
+    Arguments: issuer - The authority certificate
+               passphrase_issuer - The passphrase of the key of the authority
+    Returns:   The decrypted key, or the signer when signing is done by the signing daemon
+    """
+    try:
+        return get_signer(issuer, passphrase_issuer)
+    except PassPhraseError:
+        raise PassPhraseError("Bad passphrase, could not decode issuer key")
+
+
+def build_keystore(instance, key, issuer_key=None, cas=None):
+    """
+    Sign a certificate and serialize it with its key
+
+    Arguments: instance - The certificate
+               key - The private key of the certificate, or the public key when the private key is held by
+                     the requester. The keystore is stored without key and PKCS12 packages in that case.
+               issuer_key - Optional decrypted key of the authority, loaded with the issuer passphrase if not provided
+               cas - Optional loaded certificate chain of the authority, added to PKCS12 packages
+    Returns:   The unsaved keystore
+    """
+    if issuer_key is None and instance.parent:
+        issuer_key = get_issuer_key(instance.parent, instance.passphrase_issuer)
+    certhandler = CertificateGenerator()
+    certhandler.create_certificate(instance, key, passphrase_issuer=instance.passphrase_issuer, issuer_key=issuer_key)
+    return _serialize_keystore(instance, key, certhandler, cas)
+
+
+def _serialize_keystore(instance, key, certhandler, cas=None):
+    keystore = KeyStore(certificate=instance)
+    has_private_key = isinstance(key, KeyGenerator)
+    keystore.key = key.serialize(instance.passphrase_out) if has_private_key else ""
+    keystore.crt = certhandler.serialize()
+    keystore.fingerprint = get_certificate_fingerprint(certhandler.certificate)
+    if (
+        has_private_key
+        and instance.type not in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]
+        and settings.PKCS12_GENERATION == "eager"
+    ):
+        keystore.p12, keystore.p12_legacy = build_pkcs12(
+            instance.name, key, certhandler.certificate, instance.passphrase_out, cas=cas, issuer=instance.parent
+        )
+    return keystore
+
+
+def build_pkcs12(name, key, certificate, passphrase, cas=None, issuer=None):
+    """
+    Serialize the key and certificate of a leaf certificate as PKCS12 packages
+
+    Arguments: name - Name of the certificate in the package
+               key - The private key of the certificate
+               certificate - The loaded certificate
+               passphrase - The passphrase to encrypt the packages with
+               cas - Optional loaded certificate chain of the authority, loaded from issuer if not provided
+               issuer - The authority of the certificate
+    Returns:   Tuple with the PKCS12 package and the PKCS12 package with legacy encryption
+    """
+    cas = cas if cas is not None else get_certificate_chain(issuer)
+    return (
+        key.serialize_pkcs12(name, certificate, passphrase, cas=cas, encryption_legacy=False),
+        key.serialize_pkcs12(name, certificate, passphrase, cas=cas, encryption_legacy=True),
+    )
+
+
+def generate_keystore(instance):
+    """
+    Generate the key and signed certificate of a saved certificate, only the certificate is generated
+    when the public key of a key held by the requester is set
+
+    Arguments: instance - The certificate, with passphrase_issuer and passphrase_out set
+    Returns:   The saved keystore
+    """
+    if instance.public_key is not None:
+        key = instance.public_key
+    else:
+        key = KeyGenerator().create_key(*get_key_parameters(instance))
+    keystore = build_keystore(instance, key)
+    keystore.save()
+
+    if instance.type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
+        # Signed with the new key, which the signing daemon does not hold before it has been added to its key store
+        update_revocation_list(instance, instance.passphrase_out, issuer_key=key)
+    return keystore
+
+
 @receiver(post_save, sender=Certificate)
 def generate_certificate(sender, instance, created, **kwargs):
     if created:
-        keystore = KeyStore(certificate=instance)
-        key_size = None
-        if settings.KEY_ALGORITHM == "rsa":
-            key_size = 4096 if instance.type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE] else 2048
-        key = KeyGenerator().create_key(settings.KEY_ALGORITHM, key_size)
-        keystore.key = key.serialize(instance.passphrase_out)
-        certhandler = CertificateGenerator()
-        certhandler.create_certificate(instance, keystore.key, instance.passphrase_out, instance.passphrase_issuer)
-        keystore.crt = certhandler.serialize()
-        if instance.type not in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
-            root_certificate = CertificateGenerator().load(instance.parent.parent.keystore.crt).certificate
-            int_certificate = CertificateGenerator().load(instance.parent.keystore.crt).certificate
-            keystore.p12 = key.serialize_pkcs12(
-                instance.name,
-                certhandler.certificate,
-                instance.passphrase_out,
-                cas=[int_certificate, root_certificate],
-                encryption_legacy=False,
-            )
-
-            keystore.p12_legacy = key.serialize_pkcs12(
-                instance.name,
-                certhandler.certificate,
-                instance.passphrase_out,
-                cas=[int_certificate, root_certificate],
-                encryption_legacy=True,
-            )
-        keystore.save()
-
-        if instance.type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE]:
-            next_update_days = datetime.timedelta(settings.CRL_UPDATE_DAYS_FUTURE, 0, 0)
-            next_update = datetime.datetime.now(tz=pytz.UTC) + next_update_days
-            crl = revocation_list_builder([], instance, instance.passphrase_out, next_update=next_update)
-            crlstore = CrlStore(certificate=instance)
-            crlstore.crl = serialize(crl)
-            crlstore.save()
+        if instance.generate_async and instance.public_key is None:
+            job = CertificateJob(certificate=instance, owner=instance.owner)
+            job.set_passphrases(instance.passphrase_issuer, instance.passphrase_out)
+            job.save()
+            return
+        generate_keystore(instance)
+
+
+def validate_certificate_request(instance):
+    """
+    Run the validations done on saving a new certificate, without saving it
+
+    Arguments: instance - The unsaved certificate with an unsaved distinguished name
+    """
+    set_fields_certificate(Certificate, instance)
+    instance.dn.full_clean()
+    instance.full_clean(exclude=["dn"])
+    validation_rules_certificate(Certificate, instance)
+    check_policies_certificate(Certificate, instance)
+
+
+def issue_certificates(certificates, passphrase_issuer):
+    """
+    Issue certificates of one authority in bulk. The key of the authority is decrypted once, the keys are
+    generated in parallel, the certificates are signed in one batch and all records are inserted in a single
+    transaction.
+
+    Arguments: certificates - The validated, unsaved certificates with unsaved distinguished names
+               passphrase_issuer - The passphrase of the key of the authority
+    Returns:   List with the saved certificates
+    """
+    if not certificates:
+        return []
+    issuer = certificates[0].parent
+    if any(c.parent != issuer for c in certificates):
+        raise ValidationError("Certificates issued in bulk should have the same parent")
+    if any(c.type in [CertificateTypes.ROOT, CertificateTypes.INTERMEDIATE] for c in certificates):
+        raise ValidationError("Root and intermediate certificates can not be issued in bulk")
+
+    issuer_key = get_issuer_key(issuer, passphrase_issuer)
+    cas = get_certificate_chain(issuer)
+
+    key_parameters = [get_key_parameters(c) for c in certificates]
+    keys = {
+        parameters: create_keys(*parameters, key_parameters.count(parameters), max_workers=settings.KEY_POOL_WORKERS)
+        for parameters in set(key_parameters)
+    }
+
+    created_at = timezone.now().date()
+    cert_requests = []
+    for certificate, parameters in zip(certificates, key_parameters):
+        certificate.created_at = created_at
+        cert_requests.append((certificate, keys[parameters].pop()))
+    # Signed in one batch, which is one round trip when signing is done by the signing daemon
+    certhandlers = CertificateGenerator.create_certificates(cert_requests, issuer_key)
+    keystores = [
+        _serialize_keystore(certificate, key, certhandler, cas)
+        for (certificate, key), certhandler in zip(cert_requests, certhandlers)
+    ]
+
+    with transaction.atomic():
+        DistinguishedName.objects.bulk_create([c.dn for c in certificates])
+        Certificate.objects.bulk_create(certificates)
+        KeyStore.objects.bulk_create(keystores)
+
+    for certificate in certificates:
+        certificate.passphrase_issuer = None
+        certificate.passphrase_out = None
+        certificate.passphrase_out_confirmation = None
+    return certificates
 
 
 @receiver(post_save, sender=Certificate)
@@ -553,17 +1190,305 @@ def update_certificate_revocation_list(sender, instance, created, **kwargs):
         if not instance.parent:
             RuntimeError(f"Cannot build revoke list of certificate {instance} without parent")
 
-        revoked_certs = Certificate.objects.filter(parent=instance.parent, revoked_at__isnull=False)
-        crl_list = [(rc.keystore.crt, rc.revoked_at) for rc in revoked_certs if hasattr(rc, "keystore")]
-        last_update = instance.parent.crlstore.last_update if hasattr(instance.parent, "crlstore") else timezone.now()
-
-        next_update_days = datetime.timedelta(settings.CRL_UPDATE_DAYS_FUTURE, 0, 0)
-        next_update = datetime.datetime.now(tz=pytz.UTC) + next_update_days
-        crl = revocation_list_builder(crl_list, instance.parent, instance.passphrase_issuer, last_update, next_update)
-        if not hasattr(instance.parent, "crlstore"):
-            crlstore = CrlStore(certificate=instance.parent)
-            crlstore.crl = serialize(crl)
-            crlstore.save()
+        issuer = instance.parent
+        issuer_key = get_signer(issuer, instance.passphrase_issuer)
+        if settings.CRL_DELTA_ENABLED and hasattr(issuer, "crlstore") and issuer.crlstore.base_update:
+            update_delta_revocation_list(issuer, instance.passphrase_issuer, issuer_key)
         else:
-            instance.parent.crlstore.crl = serialize(crl)
-            instance.parent.crlstore.save()
+            update_revocation_list(issuer, instance.passphrase_issuer, issuer_key)
+        update_revoked_ocsp_response(instance, issuer_key)
+
+
+def get_ocsp_cache_key(serial):
+    return f"ocsp:{serial.hex}"
+
+
+def get_ocsp_response(serial_number):
+    """
+    Get the signed OCSP response of a certificate, from the cache or else from the database
+
+    Arguments: serial_number - The serial number of the certificate
+    Returns:   Tuple with the SHA1 hash of the key of the authority, the DER encoded response, the date
+               of the response and the date of its next update, or None when there is no valid response
+    """
+    try:
+        serial = uuid.UUID(int=serial_number)
+    except ValueError:
+        return None
+    key = get_ocsp_cache_key(serial)
+    entry = cache.get(key)
+    if entry is None:
+        entry = (
+            OcspResponse.objects.filter(certificate__serial=serial)
+            .values_list("issuer_key_hash", "response", "this_update", "next_update")
+            .first()
+        )
+        if entry:
+            entry = (bytes(entry[0]), bytes(entry[1]), entry[2], entry[3])
+        # Unknown certificates are cached as well, to keep them from hitting the database on every request
+        cache.set(key, entry or (), settings.OCSP_CACHE_SECONDS)
+    if not entry or entry[3] <= timezone.now():
+        return None
+    return entry
+
+
+def _invalidate_ocsp_cache(serials):
+    keys = [get_ocsp_cache_key(serial) for serial in serials]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def update_ocsp_responses(responder, passphrase):
+    """
+    Sign the OCSP responses of the certificates issued by the authority of an OCSP signing certificate,
+    which have no response yet or of which the response expires within the refresh window
+
+    Arguments: responder - The OCSP signing certificate
+               passphrase - The passphrase of the key of the OCSP signing certificate
+    Returns:   Nr of signed responses
+    """
+    if responder.type != CertificateTypes.OCSP:
+        raise ValidationError("Can only sign OCSP responses with an OCSP signing certificate")
+    if responder.revoked or responder.expired:
+        raise ValidationError("Cannot sign OCSP responses with a revoked or expired certificate")
+
+    responder_key = responder.get_private_key(passphrase)
+    responder_crt = CertificateGenerator().load(responder.keystore.crt).certificate
+    issuer = responder.parent
+    issuer_crt = CertificateGenerator().load(issuer.keystore.crt).certificate
+    issuer_hashes = get_issuer_hashes(issuer_crt)
+
+    this_update = timezone.now()
+    next_update = this_update + datetime.timedelta(hours=settings.OCSP_RESPONSE_VALIDITY_HOURS)
+    refresh_before = this_update + datetime.timedelta(hours=settings.OCSP_REFRESH_HOURS)
+    certificates = list(
+        Certificate.objects.filter(parent=issuer, keystore__isnull=False, expires_at__gte=this_update.date())
+        .exclude(ocsp_response__next_update__gt=refresh_before, ocsp_response__stale=False)
+        .values_list("id", "serial", "revoked_at")
+    )
+    responses = [
+        OcspResponse(
+            certificate_id=pk,
+            issuer_key_hash=issuer_hashes[1],
+            response=ocsp_response_builder(
+                int(serial),
+                issuer_crt,
+                responder_crt,
+                responder_key,
+                this_update,
+                next_update,
+                revoked_at,
+                issuer_hashes,
+            ),
+            this_update=this_update,
+            next_update=next_update,
+        )
+        for pk, serial, revoked_at in certificates
+    ]
+
+    with transaction.atomic():
+        # Skip the certificates revoked while signing, their response has been replaced on revocation
+        revoked = set(
+            Certificate.objects.select_for_update()
+            .filter(pk__in=[pk for pk, _, revoked_at in certificates if not revoked_at], revoked_at__isnull=False)
+            .values_list("id", flat=True)
+        )
+        responses = [response for response in responses if response.certificate_id not in revoked]
+        OcspResponse.objects.filter(certificate_id__in=[response.certificate_id for response in responses]).delete()
+        OcspResponse.objects.bulk_create(responses)
+        _invalidate_ocsp_cache([serial for pk, serial, _ in certificates if pk not in revoked])
+    return len(responses)
+
+
+def update_revoked_ocsp_response(certificate, issuer_key):
+    """
+    Replace the OCSP response of a revoked certificate by a response signed by its authority, so the revocation
+    is served without waiting for the next update of the responses signed by the OCSP signing certificate.
+    When signing fails, the previous response is kept and marked stale, so it is replaced on the next update.
+
+    Arguments: certificate - The revoked certificate
+               issuer_key - The decrypted key or signer of the authority
+    """
+    issuer = certificate.parent
+    this_update = timezone.now()
+    next_update = this_update + datetime.timedelta(hours=settings.OCSP_RESPONSE_VALIDITY_HOURS)
+    try:
+        issuer_crt = CertificateGenerator().load(issuer.keystore.crt).certificate
+        issuer_hashes = get_issuer_hashes(issuer_crt)
+        response = ocsp_response_builder(
+            int(certificate.serial),
+            issuer_crt,
+            issuer_crt,
+            issuer_key,
+            this_update,
+            next_update,
+            certificate.revoked_at,
+            issuer_hashes,
+        )
+    except Exception:
+        logger.exception(f"Signing the OCSP response of revoked certificate {certificate.pk} failed")
+        OcspResponse.objects.filter(certificate=certificate).update(stale=True)
+    else:
+        OcspResponse.objects.update_or_create(
+            certificate=certificate,
+            defaults={
+                "issuer_key_hash": issuer_hashes[1],
+                "response": response,
+                "this_update": this_update,
+                "next_update": next_update,
+                "stale": False,
+            },
+        )
+    _invalidate_ocsp_cache([certificate.serial])
+
+
+def _get_job_fernet():
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"bounca certificate job").derive(
+        settings.SECRET_KEY.encode("utf-8")
+    )
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+class CertificateJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    STATUSES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    certificate = models.OneToOneField(
+        Certificate, on_delete=models.SET_NULL, null=True, blank=True, related_name="job"
+    )
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=8, choices=STATUSES, default=PENDING)
+    passphrases = models.BinaryField(
+        "Encrypted passphrases, removed when the job has been processed",
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+    )
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(editable=False, default=None, blank=True, null=True)
+    finished_at = models.DateTimeField(editable=False, default=None, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status="pending"),
+                name="x509_pki_certificatejob_queue",
+            ),
+            models.Index(
+                fields=["started_at"],
+                condition=models.Q(status="running"),
+                name="x509_pki_certjob_running",
+            ),
+        ]
+
+    def set_passphrases(self, passphrase_issuer, passphrase_out):
+        data = json.dumps({"passphrase_issuer": passphrase_issuer, "passphrase_out": passphrase_out})
+        self.passphrases = _get_job_fernet().encrypt(data.encode("utf-8"))
+
+    def get_passphrases(self):
+        data = json.loads(_get_job_fernet().decrypt(bytes(self.passphrases)))
+        return data["passphrase_issuer"], data["passphrase_out"]
+
+    def __str__(self):
+        return str(f"{self.id}-{self.status}")
+
+
+def _remove_job_certificate(job):
+    """
+    Remove the certificate of a failed job together with its distinguished name, so it can be requested again
+
+    Arguments: job - The failed job
+    """
+    certificate = job.certificate
+    if certificate is not None and not certificate.revoked:
+        dn = certificate.dn
+        certificate.force_delete()
+        dn.delete()
+        job.certificate = None
+
+
+def fail_stale_certificate_jobs():
+    """
+    Fail the jobs which are running longer than CERTIFICATE_JOB_TIMEOUT_MINUTES, as their worker has been stopped
+    before it finished the job. Their passphrases and certificate are removed.
+
+    Returns:   Nr of failed jobs
+    """
+    started_before = timezone.now() - datetime.timedelta(minutes=settings.CERTIFICATE_JOB_TIMEOUT_MINUTES)
+    with transaction.atomic():
+        jobs = list(
+            CertificateJob.objects.select_for_update(skip_locked=True).filter(
+                status=CertificateJob.RUNNING, started_at__lt=started_before
+            )
+        )
+        for job in jobs:
+            logger.warning(f"Certificate job {job.id} did not finish within the timeout")
+            job.status = CertificateJob.FAILED
+            job.error = "Certificate generation did not finish in time"
+            _remove_job_certificate(job)
+            job.passphrases = None
+            job.finished_at = timezone.now()
+            job.save()
+    return len(jobs)
+
+
+def claim_certificate_job():
+    """
+    Take the oldest pending certificate job from the queue, jobs claimed by other workers are skipped
+
+    Returns:   The claimed job or None if there are no pending jobs
+    """
+    fail_stale_certificate_jobs()
+    with transaction.atomic():
+        job = (
+            CertificateJob.objects.select_for_update(skip_locked=True)
+            .filter(status=CertificateJob.PENDING)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = CertificateJob.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at"])
+    return job
+
+
+def run_certificate_job(job):
+    """
+    Generate the key and certificate of a claimed job. When generation fails, the certificate
+    is removed, so it can be requested again.
+
+    Arguments: job - The claimed job
+    """
+    certificate = job.certificate
+    try:
+        if certificate is None or certificate.revoked:
+            raise ValidationError("Certificate has been removed before it was generated")
+        certificate.passphrase_issuer, certificate.passphrase_out = job.get_passphrases()
+        with transaction.atomic():
+            generate_keystore(certificate)
+        job.status = CertificateJob.DONE
+    except Exception as e:
+        job.status = CertificateJob.FAILED
+        job.error = "; ".join(e.messages) if isinstance(e, ValidationError) else str(e)
+        _remove_job_certificate(job)
+    finally:
+        if certificate is not None:
+            certificate.passphrase_issuer = None
+            certificate.passphrase_out = None
+        job.passphrases = None
+        job.finished_at = timezone.now()
+        job.save()
@@ -0,0 +1,120 @@
+import uuid
+
+import arrow
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, DistinguishedName, KeyStore
+from x509_pki.tests.factories import UserFactory
+
+
+def pg_trgm_installed():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+class ModelIndexTest(TestCase):
+    """
+    Check that the hot queries of the api are served by an index. The seeded data set is small,
+    so sequential scans are disabled to let the planner choose an index whenever it can.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserFactory.default()
+        cls.other_user = UserFactory.create(username="other_user_indexes")
+        expires_at = arrow.get(timezone.now()).shift(years=+1).date()
+        dns = DistinguishedName.objects.bulk_create(
+            [DistinguishedName(countryName="NL", commonName=f"device-{i}.repleo.nl") for i in range(1001)]
+        )
+        cls.ca = Certificate.objects.bulk_create(
+            [Certificate(name="root ca", type=CertificateTypes.ROOT, dn=dns[0], expires_at=expires_at, owner=cls.user)]
+        )[0]
+        certificates = Certificate.objects.bulk_create(
+            [
+                Certificate(
+                    name=f"device-{i}",
+                    type=CertificateTypes.CLIENT_CERT,
+                    parent=cls.ca,
+                    dn=dn,
+                    expires_at=expires_at,
+                    owner=cls.user if i % 20 == 1 else cls.other_user,
+                    revoked_at=timezone.now() if i % 10 == 0 else None,
+                    revoked_uuid=uuid.uuid4() if i % 10 == 0 else 0,
+                )
+                for i, dn in enumerate(dns[1:])
+            ]
+        )
+        KeyStore.objects.bulk_create(
+            [
+                KeyStore(key="", crt="", fingerprint=f"{i:040X}", certificate=certificate)
+                for i, certificate in enumerate(certificates)
+            ]
+        )
+        cls.serial = certificates[42].serial
+        cls.cursor_id = certificates[900].id
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE x509_pki_certificate, x509_pki_distinguishedname, x509_pki_keystore")
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn("Index", plan)
+        self.assertIn(index_name, plan)
+
+    def test_certificate_list(self):
+        self.assertUsesIndex(
+            Certificate.objects.filter(owner=self.user).order_by("-id")[:25], "x509_pki_certificate_owner"
+        )
+
+    def test_certificate_list_cursor(self):
+        self.assertUsesIndex(
+            Certificate.objects.filter(owner=self.user, id__lt=self.cursor_id).order_by("-id")[:25],
+            "x509_pki_certificate_owner",
+        )
+
+    def test_expired_certificates(self):
+        self.assertUsesIndex(
+            Certificate.objects.filter(owner=self.user, expires_at__lte=timezone.now().date()),
+            "x509_pki_certificate_expires",
+        )
+
+    def test_revoked_certificates(self):
+        self.assertUsesIndex(
+            Certificate.objects.filter(parent=self.ca, revoked_at__isnull=False).values_list("serial", "revoked_at"),
+            "x509_pki_certificate_revoked",
+        )
+
+    def test_active_certificates(self):
+        self.assertUsesIndex(
+            Certificate.objects.filter(parent=self.ca, revoked_at__isnull=True), "x509_pki_certificate_active"
+        )
+
+    def test_serial(self):
+        self.assertUsesIndex(Certificate.objects.filter(serial=self.serial), "x509_pki_certificate_serial")
+
+    def test_duplicate_name(self):
+        self.assertUsesIndex(
+            Certificate.objects.filter(name="device-21", owner=self.user, type=CertificateTypes.CLIENT_CERT),
+            "x509_pki_certificate_name_owner_id_type_revok",
+        )
+
+    def test_search(self):
+        if not pg_trgm_installed():
+            self.skipTest("pg_trgm extension is not available")
+        self.assertUsesIndex(Certificate.objects.filter(name__icontains="vice-4"), "x509_pki_certificate_name_trgm")
+        self.assertUsesIndex(
+            DistinguishedName.objects.filter(commonName__icontains="vice-4"), "x509_pki_dn_commonname_trgm"
+        )
+        self.assertUsesIndex(
+            DistinguishedName.objects.filter(emailAddress__icontains="repleo"), "x509_pki_dn_emailaddress_trgm"
+        )
+        self.assertUsesIndex(
+            KeyStore.objects.filter(fingerprint__icontains="00042"), "x509_pki_keystore_fingerprint_trgm"
+        )
@@ -1,13 +1,20 @@
 # coding: utf-8
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
 from uuid import UUID
 
 import arrow
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.management import call_command
 from django.test import TestCase
 from django.utils import timezone
 
 from certificate_engine.types import CertificateTypes
-from x509_pki.models import Certificate, DistinguishedName
+from x509_pki.models import Certificate, DistinguishedName, get_crl_export_path, get_delta_crl_url
 from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
 
 
@@ -694,3 +701,224 @@ class ModelCertificateTest(TestCase):
         with self.assertRaises(ValidationError) as c:
             cert.save()
         self.assertEqual(c.exception.message, "The two passphrase fields didn't match.")
+
+    def test_key_parameters_stored(self):
+        self.assertEqual((self.ca.key_algorithm, self.ca.key_size), ("rsa", 4096))
+        self.assertEqual((self.cert.key_algorithm, self.cert.key_size), ("rsa", 2048))
+
+        cert = CertificateFactory(type=CertificateTypes.ROOT, key_algorithm="ecdsa")
+        cert.save()
+        cert.refresh_from_db()
+        self.assertEqual((cert.key_algorithm, cert.key_size), ("ecdsa", 384))
+        crt = x509.load_pem_x509_certificate(cert.keystore.crt.encode("utf8"))
+        self.assertEqual(crt.public_key().curve.name, "secp384r1")
+
+    def test_key_size_not_supported(self):
+        cert = CertificateFactory(type=CertificateTypes.ROOT, key_algorithm="rsa", key_size=1024)
+        with self.assertRaises(ValidationError) as c:
+            cert.save()
+        self.assertEqual(c.exception.message, "Key size of rsa keys should be one of 2048, 3072, 4096")
+
+        cert = CertificateFactory(type=CertificateTypes.ROOT, key_algorithm="ed25519", key_size=256)
+        with self.assertRaises(ValidationError) as c:
+            cert.save()
+        self.assertEqual(c.exception.message, "Key size should not be set for ed25519 keys")
+
+
+class ModelCertificateRevocationListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserFactory()
+        cls.ca = CertificateFactory(
+            type=CertificateTypes.ROOT,
+            owner=cls.user,
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="ca.bounca.org",
+            ),
+        )
+        cls.ca.save()
+        cls.int = CertificateFactory(
+            type=CertificateTypes.INTERMEDIATE,
+            parent=cls.ca,
+            owner=cls.user,
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            crl_distribution_url="https://ca.demo.repleo.nl/crl/test.crl",
+            dn=DistinguishedNameFactory(
+                countryName="NL",
+                stateOrProvinceName="Noord-Holland",
+                organizationName="Repleo",
+                commonName="int.bounca.org",
+            ),
+        )
+        cls.int.save()
+
+    def make_server_certificate(self, common_name):
+        cert = CertificateFactory(
+            type=CertificateTypes.SERVER_CERT,
+            parent=self.int,
+            owner=self.user,
+            expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+            crl_distribution_url=None,
+            ocsp_distribution_host=None,
+            dn=DistinguishedNameFactory(commonName=common_name, subjectAltNames=[common_name]),
+        )
+        cert.save()
+        return Certificate.objects.get(pk=cert.pk)
+
+    def load_crls(self):
+        crlstore = Certificate.objects.get(pk=self.int.pk).crlstore
+        crl = x509.load_pem_x509_crl(crlstore.crl.encode("utf8"))
+        delta_crl = x509.load_pem_x509_crl(crlstore.delta_crl.encode("utf8")) if crlstore.delta_crl else None
+        return crlstore, crl, delta_crl
+
+    def renew_revocation_list(self):
+        int_cert = Certificate.objects.get(pk=self.int.pk)
+        int_cert.passphrase_in = ""
+        int_cert.renew_revocation_list()
+
+    def test_get_delta_crl_url(self):
+        self.assertEqual(get_delta_crl_url("https://example.com/crl/int.crl"), "https://example.com/crl/int-delta.crl")
+        self.assertEqual(
+            get_delta_crl_url("https://example.com/crl/int.crl.pem"), "https://example.com/crl/int-delta.crl.pem"
+        )
+        self.assertIsNone(get_delta_crl_url(None))
+
+    def test_crl_number(self):
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(crlstore.crl_number, 1)
+        self.assertEqual(crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number, 1)
+        self.assertIsNone(delta_crl)
+
+        self.renew_revocation_list()
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(crlstore.crl_number, 2)
+        self.assertEqual(crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number, 2)
+
+    def test_revoke_certificate(self):
+        cert = self.make_server_certificate("www1.repleo.nl")
+        cert.delete()
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(crlstore.crl_number, 2)
+        self.assertEqual(len(crl), 1)
+        revoked_cert = crl.get_revoked_certificate_by_serial_number(int(cert.serial))
+        self.assertEqual(revoked_cert.revocation_date_utc, cert.revoked_at.replace(microsecond=0))
+        self.assertIsNone(delta_crl)
+        with self.assertRaises(x509.ExtensionNotFound):
+            crl.extensions.get_extension_for_class(x509.FreshestCRL)
+
+    @mock.patch("x509_pki.models.settings.CRL_DELTA_ENABLED", True)
+    def test_revoke_certificate_delta_crl(self):
+        cert1 = self.make_server_certificate("www1.repleo.nl")
+        cert1.delete()
+        self.renew_revocation_list()
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(crlstore.base_crl_number, 3)
+        self.assertEqual(crlstore.crl_number, 4)
+        self.assertEqual(len(crl), 1)
+        self.assertEqual(
+            crl.extensions.get_extension_for_class(x509.FreshestCRL).value[0].full_name[0].value,
+            "https://ca.demo.repleo.nl/crl/test-delta.crl",
+        )
+        self.assertEqual(len(delta_crl), 0)
+        self.assertEqual(delta_crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator).value.crl_number, 3)
+
+        cert2 = self.make_server_certificate("www2.repleo.nl")
+        cert2.delete()
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(crlstore.base_crl_number, 3)
+        self.assertEqual(crlstore.crl_number, 5)
+        self.assertEqual(len(crl), 1)
+        self.assertIsNone(crl.get_revoked_certificate_by_serial_number(int(cert2.serial)))
+        self.assertEqual(len(delta_crl), 1)
+        self.assertIsNotNone(delta_crl.get_revoked_certificate_by_serial_number(int(cert2.serial)))
+        self.assertEqual(delta_crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number, 5)
+        self.assertEqual(delta_crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator).value.crl_number, 3)
+
+        self.renew_revocation_list()
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(crlstore.base_crl_number, 6)
+        self.assertEqual(len(crl), 2)
+        self.assertIsNotNone(crl.get_revoked_certificate_by_serial_number(int(cert2.serial)))
+        self.assertEqual(len(delta_crl), 0)
+
+
+class ModelCertificateRevocationListExportTest(ModelCertificateRevocationListTest):
+    def setUp(self):
+        self.export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.export_dir.cleanup)
+        patcher = mock.patch("x509_pki.models.settings.CRL_EXPORT_DIR", self.export_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def renew_revocation_list(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            super().renew_revocation_list()
+
+    def read_file(self, *path):
+        with open(os.path.join(self.export_dir.name, "crl", *path), "rb") as f:
+            return f.read()
+
+    def test_get_crl_export_path(self):
+        self.assertEqual(
+            get_crl_export_path("https://example.com/crl/int.crl"), os.path.join(self.export_dir.name, "crl", "int.crl")
+        )
+        self.assertEqual(
+            get_crl_export_path("https://example.com/../../etc/int.crl"),
+            os.path.join(self.export_dir.name, "etc", "int.crl"),
+        )
+
+    def test_export_crl(self):
+        self.renew_revocation_list()
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(self.read_file("test.crl").decode("utf8"), crlstore.crl)
+        self.assertEqual(self.read_file("test.der.crl"), crl.public_bytes(serialization.Encoding.DER))
+        self.assertEqual(self.read_file("test.2.crl").decode("utf8"), crlstore.crl)
+        self.assertEqual(self.read_file("test.der.2.crl"), crl.public_bytes(serialization.Encoding.DER))
+        self.assertFalse(os.path.exists(os.path.join(self.export_dir.name, "crl", "test-delta.crl")))
+
+    def test_export_crl_keeps_previous_version(self):
+        for _ in range(3):
+            self.renew_revocation_list()
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.export_dir.name, "crl"))),
+            ["test.3.crl", "test.4.crl", "test.crl", "test.der.3.crl", "test.der.4.crl", "test.der.crl"],
+        )
+        self.assertEqual(self.read_file("test.crl").decode("utf8"), crlstore.crl)
+
+    def test_export_crl_revoke_certificate(self):
+        cert = self.make_server_certificate("www1.repleo.nl")
+        with self.captureOnCommitCallbacks(execute=True):
+            cert.delete()
+        crl = x509.load_pem_x509_crl(self.read_file("test.crl"))
+        self.assertIsNotNone(crl.get_revoked_certificate_by_serial_number(int(cert.serial)))
+
+    @mock.patch("x509_pki.models.settings.CRL_DELTA_ENABLED", True)
+    def test_export_delta_crl(self):
+        self.renew_revocation_list()
+        cert = self.make_server_certificate("www1.repleo.nl")
+        with self.captureOnCommitCallbacks(execute=True):
+            cert.delete()
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(self.read_file("test.crl").decode("utf8"), crlstore.crl)
+        self.assertEqual(self.read_file("test-delta.crl").decode("utf8"), crlstore.delta_crl)
+        self.assertEqual(self.read_file("test-delta.der.crl"), delta_crl.public_bytes(serialization.Encoding.DER))
+        self.assertEqual(self.read_file(f"test-delta.{crlstore.crl_number}.crl").decode("utf8"), crlstore.delta_crl)
+
+    def test_export_crl_error(self):
+        with mock.patch("x509_pki.models._write_file_atomic", side_effect=OSError("disk full")):
+            with self.assertLogs("x509_pki.models", level="ERROR"):
+                self.renew_revocation_list()
+        self.assertEqual(self.load_crls()[0].crl_number, 2)
+
+    def test_export_crls_command(self):
+        out = StringIO()
+        call_command("export_crls", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Exported 2 CRLs")
+        crlstore, crl, delta_crl = self.load_crls()
+        self.assertEqual(self.read_file("test.crl").decode("utf8"), crlstore.crl)
+        self.assertEqual(self.read_file("cert.crl").decode("utf8"), Certificate.objects.get(pk=self.ca.pk).crlstore.crl)
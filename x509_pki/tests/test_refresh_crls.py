@@ -0,0 +1,170 @@
+# coding: utf-8
+import datetime
+import tempfile
+from io import StringIO
+from unittest import mock
+
+import arrow
+from cryptography import x509
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, CrlStore
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+class RefreshCrlsMixin:
+    def make_authorities(self):
+        self.user = UserFactory()
+        self.ca = CertificateFactory(
+            type=CertificateTypes.ROOT,
+            name="root ca",
+            owner=self.user,
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="ca"
+            ),
+        )
+        self.ca.save()
+        self.ints = []
+        for i in range(2):
+            cert = CertificateFactory(
+                type=CertificateTypes.INTERMEDIATE,
+                name=f"int ca {i}",
+                parent=self.ca,
+                owner=self.user,
+                expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+                passphrase_issuer="welkom123",
+                passphrase_out=f"welkom{i}{i}{i}",
+                passphrase_out_confirmation=f"welkom{i}{i}{i}",
+                dn=DistinguishedNameFactory(
+                    countryName="NL",
+                    stateOrProvinceName="Noord-Holland",
+                    organizationName="Repleo",
+                    commonName=f"int{i}",
+                ),
+            )
+            cert.save()
+            self.ints.append(cert)
+
+    def write_passphrases(self, content):
+        f = tempfile.NamedTemporaryFile("w", suffix=".yaml")
+        self.addCleanup(f.close)
+        f.write(content)
+        f.flush()
+        return f.name
+
+    def refresh_crls(self, *args, failed=0):
+        out = StringIO()
+        err = StringIO()
+        if failed:
+            with self.assertRaisesMessage(CommandError, f"Failed to refresh {failed} CRLs"):
+                call_command("refresh_crls", *args, stdout=out, stderr=err)
+        else:
+            call_command("refresh_crls", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def get_crl_numbers(self):
+        return dict(CrlStore.objects.values_list("certificate_id", "crl_number"))
+
+
+class RefreshCrlsTest(RefreshCrlsMixin, TestCase):
+    def setUp(self):
+        with mock.patch("x509_pki.models.settings.CRL_UPDATE_DAYS_FUTURE", 0.25):
+            self.make_authorities()
+        self.passphrase_file = self.write_passphrases(
+            f"{self.ca.pk}: welkom123\n{self.ints[0].pk}: welkom000\n{self.ints[1].pk}: welkom111\n"
+        )
+
+    def test_next_update(self):
+        crlstore = CrlStore.objects.get(certificate=self.ca)
+        crl = x509.load_pem_x509_crl(crlstore.crl.encode("utf8"))
+        self.assertEqual(crlstore.next_update.replace(microsecond=0), crl.next_update_utc)
+        self.assertAlmostEqual(
+            crlstore.next_update, timezone.now() + datetime.timedelta(hours=6), delta=datetime.timedelta(minutes=1)
+        )
+
+    def test_refresh_expiring_crls(self):
+        crl_numbers = self.get_crl_numbers()
+        out, err = self.refresh_crls("--passphrase-file", self.passphrase_file, "--processes", "1")
+        self.assertEqual(err, "")
+        self.assertIn(f"Refreshed CRL of root ca ({self.ca.pk}) in ", out)
+        self.assertIn(f"Refreshed CRL of int ca 1 ({self.ints[1].pk}) in ", out)
+        self.assertIn("Refreshed 3 of 3 CRLs in ", out)
+        self.assertEqual(self.get_crl_numbers(), {pk: number + 1 for pk, number in crl_numbers.items()})
+
+        crlstore = CrlStore.objects.get(certificate=self.ca)
+        self.assertGreater(crlstore.next_update, timezone.now() + datetime.timedelta(days=364))
+
+        # The refreshed CRLs are valid for a year, which is not within half of the CRL validity
+        out, err = self.refresh_crls("--passphrase-file", self.passphrase_file, "--processes", "1")
+        self.assertIn("Refreshed 0 of 0 CRLs in ", out)
+
+    def test_refresh_within(self):
+        out, err = self.refresh_crls("--passphrase-file", self.passphrase_file, "--processes", "1", "--within", "1")
+        self.assertIn("Refreshed 0 of 0 CRLs in ", out)
+        CrlStore.objects.filter(certificate=self.ints[0]).update(next_update=timezone.now())
+        out, err = self.refresh_crls("--passphrase-file", self.passphrase_file, "--processes", "1", "--within", "1")
+        self.assertIn("Refreshed 1 of 1 CRLs in ", out)
+
+    def test_refresh_all(self):
+        crl_numbers = self.get_crl_numbers()
+        with mock.patch("x509_pki.models.settings.CRL_UPDATE_DAYS_FUTURE", 0.25):
+            out, err = self.refresh_crls("--passphrase-file", self.passphrase_file, "--processes", "1", "--all")
+        self.assertIn("Refreshed 3 of 3 CRLs in ", out)
+        self.assertEqual(self.get_crl_numbers(), {pk: number + 1 for pk, number in crl_numbers.items()})
+
+    def test_skip_revoked_authority(self):
+        Certificate.objects.filter(pk=self.ints[1].pk).update(revoked_at=timezone.now())
+        out, err = self.refresh_crls("--passphrase-file", self.passphrase_file, "--processes", "1")
+        self.assertIn("Refreshed 2 of 2 CRLs in ", out)
+
+    def test_missing_and_wrong_passphrase(self):
+        passphrase_file = self.write_passphrases(f"{self.ca.pk}: welkom123\n{self.ints[0].pk}: wrong\n")
+        crl_numbers = self.get_crl_numbers()
+        out, err = self.refresh_crls("--passphrase-file", passphrase_file, "--processes", "1", failed=1)
+        self.assertIn(f"Failed to refresh CRL of int ca 0 ({self.ints[0].pk}): Bad passphrase", err)
+        self.assertIn(f"Skipped CRL of int ca 1 ({self.ints[1].pk}), no passphrase", err)
+        self.assertIn("Refreshed 1 of 3 CRLs in ", out)
+        self.assertEqual(self.get_crl_numbers()[self.ints[0].pk], crl_numbers[self.ints[0].pk])
+
+    def test_unexpected_error(self):
+        renew_revocation_list = Certificate.renew_revocation_list
+
+        def renew_or_fail(certificate):
+            if certificate.pk == self.ints[0].pk:
+                raise DatabaseError("connection lost")
+            renew_revocation_list(certificate)
+
+        crl_numbers = self.get_crl_numbers()
+        with mock.patch.object(Certificate, "renew_revocation_list", autospec=True, side_effect=renew_or_fail):
+            with self.assertLogs("x509_pki.management.commands.refresh_crls", level="ERROR"):
+                out, err = self.refresh_crls("--passphrase-file", self.passphrase_file, "--processes", "1", failed=1)
+        self.assertIn(f"Failed to refresh CRL of int ca 0 ({self.ints[0].pk}): DatabaseError: connection lost", err)
+        self.assertIn(f"Refreshed CRL of int ca 1 ({self.ints[1].pk}) in ", out)
+        self.assertIn("Refreshed 2 of 3 CRLs in ", out)
+        self.assertEqual(self.get_crl_numbers()[self.ints[0].pk], crl_numbers[self.ints[0].pk])
+        self.assertEqual(self.get_crl_numbers()[self.ints[1].pk], crl_numbers[self.ints[1].pk] + 1)
+
+    def test_invalid_passphrase_file(self):
+        with self.assertRaises(CommandError):
+            self.refresh_crls("--passphrase-file", self.write_passphrases("- welkom123\n"))
+
+
+class RefreshCrlsProcessPoolTest(RefreshCrlsMixin, TransactionTestCase):
+    def test_refresh_in_process_pool(self):
+        with mock.patch("x509_pki.models.settings.CRL_UPDATE_DAYS_FUTURE", 0.25):
+            self.make_authorities()
+        crl_numbers = self.get_crl_numbers()
+        passphrase_file = self.write_passphrases(
+            f"{self.ca.pk}: welkom123\n{self.ints[0].pk}: welkom000\n{self.ints[1].pk}: welkom111\n"
+        )
+        out, err = self.refresh_crls("--passphrase-file", passphrase_file, "--processes", "2")
+        self.assertEqual(err, "")
+        self.assertIn("Refreshed 3 of 3 CRLs in ", out)
+        self.assertEqual(self.get_crl_numbers(), {pk: number + 1 for pk, number in crl_numbers.items()})
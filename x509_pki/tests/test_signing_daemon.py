@@ -0,0 +1,173 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import arrow
+from cryptography import x509
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509 import ocsp
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from certificate_engine.ssl.signing_daemon import UNKNOWN_KEY, RemoteSigner, SigningDaemon, SigningError
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, CrlStore, OcspResponse, issue_certificates
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+class SigningDaemonTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            type=CertificateTypes.ROOT,
+            owner=self.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="ca"
+            ),
+        )
+        self.ca.save()
+        self.int = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            type=CertificateTypes.INTERMEDIATE,
+            parent=self.ca,
+            owner=self.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="int"
+            ),
+        )
+        self.int.save()
+
+        # The daemon holds the keys of the authorities, as loaded with --passphrase-file
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.socket_path = os.path.join(directory, "signing.sock")
+        self.daemon = SigningDaemon(self.socket_path)
+        self.daemon.add_key(self.ca.pk, self.ca.get_private_key("welkom123"), "welkom123")
+        self.daemon.add_key(self.int.pk, self.int.get_private_key("welkom1234"), "welkom1234")
+        thread = threading.Thread(target=self.daemon.serve, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.daemon.shutdown)
+        while not os.path.exists(self.socket_path):
+            time.sleep(0.01)
+
+        patcher = mock.patch("x509_pki.models.settings.SIGNING_SOCKET", self.socket_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load_certificate(self, certificate):
+        return x509.load_pem_x509_certificate(certificate.keystore.crt.encode("utf8"))
+
+    def test_sign_with_daemon(self):
+        cert = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+            name="www.repleo.nl",
+            type=CertificateTypes.SERVER_CERT,
+            parent=self.int,
+            owner=self.user,
+            crl_distribution_url=None,
+            ocsp_distribution_host=None,
+            passphrase_issuer="welkom1234",
+            dn=DistinguishedNameFactory(commonName="www.repleo.nl", subjectAltNames=["www.repleo.nl"]),
+        )
+        with mock.patch("x509_pki.models.Certificate.get_private_key") as get_private_key:
+            cert.save()
+        get_private_key.assert_not_called()
+
+        ca_crt = self.load_certificate(self.ca)
+        int_crt = self.load_certificate(self.int)
+        int_crt.verify_directly_issued_by(ca_crt)
+        self.load_certificate(Certificate.objects.get(pk=cert.pk)).verify_directly_issued_by(int_crt)
+        for authority, crt in [(self.ca, ca_crt), (self.int, int_crt)]:
+            crl = x509.load_pem_x509_crl(CrlStore.objects.get(certificate=authority).crl.encode("utf8"))
+            self.assertTrue(crl.is_signature_valid(crt.public_key()))
+
+        cert = Certificate.objects.get(pk=cert.pk)
+        cert.passphrase_issuer = "welkom1234"
+        cert.delete()
+        crl = x509.load_pem_x509_crl(CrlStore.objects.get(certificate=self.int).crl.encode("utf8"))
+        self.assertTrue(crl.is_signature_valid(int_crt.public_key()))
+        self.assertIsNotNone(crl.get_revoked_certificate_by_serial_number(int(cert.serial)))
+        # The revoked status is signed by the authority through the daemon
+        ocsp_response = ocsp.load_der_ocsp_response(bytes(OcspResponse.objects.get(certificate=cert).response))
+        self.assertEqual(ocsp_response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+        self.assertEqual(
+            ocsp_response.responder_key_hash, x509.SubjectKeyIdentifier.from_public_key(int_crt.public_key()).digest
+        )
+        int_crt.public_key().verify(
+            ocsp_response.signature,
+            ocsp_response.tbs_response_bytes,
+            padding.PKCS1v15(),
+            ocsp_response.signature_hash_algorithm,
+        )
+
+    def test_issue_certificates_with_daemon(self):
+        certificates = [
+            CertificateFactory.build(
+                expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+                name=f"device-{i}.repleo.nl",
+                type=CertificateTypes.CLIENT_CERT,
+                parent=self.int,
+                owner=self.user,
+                crl_distribution_url=None,
+                ocsp_distribution_host=None,
+                passphrase_out="dev1cepass",
+                passphrase_out_confirmation="dev1cepass",
+                dn=DistinguishedNameFactory.build(
+                    commonName=f"device-{i}.repleo.nl", subjectAltNames=[f"device-{i}@repleo.nl"]
+                ),
+            )
+            for i in range(3)
+        ]
+        with mock.patch.object(RemoteSigner, "sign_tbs", autospec=True, side_effect=RemoteSigner.sign_tbs) as sign_tbs:
+            issue_certificates(certificates, "welkom1234")
+        # All certificates are signed with one request to the daemon
+        sign_tbs.assert_called_once()
+        int_crt = self.load_certificate(self.int)
+        for certificate in certificates:
+            self.load_certificate(Certificate.objects.get(pk=certificate.pk)).verify_directly_issued_by(int_crt)
+
+    def test_passphrase_checked_by_daemon(self):
+        with mock.patch("x509_pki.models.check_passphrase_issuer") as check_passphrase_issuer:
+            self.assertTrue(self.int.is_passphrase_valid("welkom1234"))
+            self.assertFalse(self.int.is_passphrase_valid("wrong"))
+        check_passphrase_issuer.assert_not_called()
+
+    def test_command_without_socket(self):
+        with mock.patch("x509_pki.management.commands.signing_daemon.settings.SIGNING_SOCKET", None):
+            with self.assertRaisesMessage(CommandError, "No socket provided and no signing_socket configured"):
+                call_command("signing_daemon")
+
+    def test_key_not_held_by_daemon(self):
+        cert = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+            type=CertificateTypes.SERVER_CERT,
+            parent=self.int,
+            owner=self.user,
+            crl_distribution_url=None,
+            ocsp_distribution_host=None,
+            passphrase_issuer="welkom1234",
+            dn=DistinguishedNameFactory(commonName="www.repleo.nl", subjectAltNames=["www.repleo.nl"]),
+        )
+        # An authority of which the key is not added to the key store of the daemon
+        del self.daemon._keys[self.int.pk]
+        with self.assertRaises(SigningError) as context:
+            cert.save()
+        self.assertEqual(context.exception.code, UNKNOWN_KEY)
+
+    def test_command_without_keys(self):
+        with self.assertRaisesMessage(
+            CommandError, "Provide the keys of the authorities with --passphrase-file or --soft-token"
+        ):
+            call_command("signing_daemon", socket=os.path.join(os.path.dirname(self.socket_path), "other.sock"))
@@ -0,0 +1,146 @@
+# coding: utf-8
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import arrow
+from cryptography import x509
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from certificate_engine.ssl.soft_token import SoftToken, close_sessions
+from certificate_engine.types import CertificateTypes
+from x509_pki.models import Certificate, CrlStore
+from x509_pki.tests.factories import CertificateFactory, DistinguishedNameFactory, UserFactory
+
+
+class SoftTokenTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.token_dir = os.path.join(directory, "token")
+        self.passphrase_file = os.path.join(directory, "passphrase")
+        with open(self.passphrase_file, "w") as f:
+            f.write("welkom1234\n")
+
+        for setting, value in [
+            ("SIGNER_BACKEND", "soft_token"),
+            ("SOFT_TOKEN_DIR", self.token_dir),
+            ("SOFT_TOKEN_PIN", "1234"),
+        ]:
+            patcher = mock.patch(f"x509_pki.models.settings.{setting}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(close_sessions)
+
+        self.user = UserFactory()
+        self.ca = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+10).date(),
+            type=CertificateTypes.ROOT,
+            owner=self.user,
+            passphrase_out="welkom123",
+            passphrase_out_confirmation="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="ca"
+            ),
+        )
+        self.ca.save()
+        self.int = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            type=CertificateTypes.INTERMEDIATE,
+            parent=self.ca,
+            owner=self.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="int"
+            ),
+        )
+        self.int.save()
+
+    def import_key(self):
+        call_command("soft_token_import", self.int.pk, passphrase_file=self.passphrase_file, stdout=io.StringIO())
+
+    def load_certificate(self, certificate):
+        return x509.load_pem_x509_certificate(certificate.keystore.crt.encode("utf8"))
+
+    def test_sign_with_soft_token(self):
+        self.import_key()
+        self.assertEqual(SoftToken(self.token_dir).labels(), [str(self.int.pk)])
+        cert = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+1).date(),
+            name="www.repleo.nl",
+            type=CertificateTypes.SERVER_CERT,
+            parent=self.int,
+            owner=self.user,
+            crl_distribution_url=None,
+            ocsp_distribution_host=None,
+            passphrase_issuer="welkom1234",
+            dn=DistinguishedNameFactory(commonName="www.repleo.nl", subjectAltNames=["www.repleo.nl"]),
+        )
+        with mock.patch("x509_pki.models.Certificate.get_private_key") as get_private_key:
+            cert.save()
+        get_private_key.assert_not_called()
+
+        int_crt = self.load_certificate(self.int)
+        self.load_certificate(Certificate.objects.get(pk=cert.pk)).verify_directly_issued_by(int_crt)
+
+        cert = Certificate.objects.get(pk=cert.pk)
+        cert.passphrase_issuer = "welkom1234"
+        with mock.patch("x509_pki.models.Certificate.get_private_key") as get_private_key:
+            cert.delete()
+        get_private_key.assert_not_called()
+        crl = x509.load_pem_x509_crl(CrlStore.objects.get(certificate=self.int).crl.encode("utf8"))
+        self.assertTrue(crl.is_signature_valid(int_crt.public_key()))
+        self.assertIsNotNone(crl.get_revoked_certificate_by_serial_number(int(cert.serial)))
+
+    def test_key_not_in_token(self):
+        # The root authority is not imported and is signed with its pem key
+        self.import_key()
+        intermediate = CertificateFactory(
+            expires_at=arrow.get(timezone.now()).shift(years=+5).date(),
+            name="int2",
+            type=CertificateTypes.INTERMEDIATE,
+            parent=self.ca,
+            owner=self.user,
+            passphrase_out="welkom1234",
+            passphrase_out_confirmation="welkom1234",
+            passphrase_issuer="welkom123",
+            dn=DistinguishedNameFactory(
+                countryName="NL", stateOrProvinceName="Noord-Holland", organizationName="Repleo", commonName="int2"
+            ),
+        )
+        intermediate.save()
+        self.load_certificate(intermediate).verify_directly_issued_by(self.load_certificate(self.ca))
+
+    def test_passphrase_checked_by_soft_token(self):
+        self.import_key()
+        with mock.patch("x509_pki.models.check_passphrase_issuer") as check_passphrase_issuer:
+            self.assertTrue(self.int.is_passphrase_valid("welkom1234"))
+            self.assertFalse(self.int.is_passphrase_valid("wrong"))
+        check_passphrase_issuer.assert_not_called()
+
+    def test_import_bad_passphrase(self):
+        with open(self.passphrase_file, "w") as f:
+            f.write("wrong\n")
+        with self.assertRaisesMessage(CommandError, "Bad passphrase"):
+            self.import_key()
+        self.assertEqual(SoftToken(self.token_dir).labels(), [])
+
+    def test_import_unknown_authority(self):
+        with self.assertRaisesMessage(CommandError, "Authority 0 not found"):
+            call_command("soft_token_import", 0, passphrase_file=self.passphrase_file)
+
+    def test_delete_key(self):
+        self.import_key()
+        call_command("soft_token_import", self.int.pk, delete=True, stdout=io.StringIO())
+        self.assertEqual(SoftToken(self.token_dir).labels(), [])
+
+    def test_command_without_token(self):
+        with mock.patch("x509_pki.management.commands.soft_token_import.settings.SOFT_TOKEN_DIR", None):
+            with self.assertRaisesMessage(CommandError, "No soft_token_dir and soft_token_pin configured"):
+                call_command("soft_token_import", self.int.pk)